@@ -0,0 +1,154 @@
+#Per-device admission control for the legacy endpoints.
+#Each (device, mode) pair has a token bucket; a request spends a token or is rejected with 429
+#before the handler does its own work. Limits are set per registered device_type and mode.
+#Buckets live in flat arrays indexed by a per-device slot (two doubles per bucket), so a few
+#hundred thousand devices cost tens of MB. Rejections are only counted, never logged as rows.
+import math
+import os
+import threading
+import time
+from array import array
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "false").lower() == "true"
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "5"))     # requests/s per device and mode
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "20"))  # bucket size
+# Overrides, e.g. "camera:*=10/40,*:replay=1/2,lock:secure=0" (device_type:mode=rate/burst, rate 0 = unlimited)
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "")
+ADMISSION_MAX_DEVICES = int(os.getenv("ADMISSION_MAX_DEVICES", "500000"))
+
+MODES = ("insecure", "secure", "replay")
+DEVICE_TYPES = ("thermostat", "camera", "lock")
+MODE_INDEX = {mode: i for i, mode in enumerate(MODES)}
+
+
+def parse_limits(spec):
+    """{(device_type, mode): (rate, burst)} from "type:mode=rate/burst,..." ("*" matches anything)."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, value = item.partition("=")
+        device_type, _, mode = key.partition(":")
+        rate, _, burst = value.partition("/")
+        if mode and mode != "*" and mode not in MODE_INDEX:
+            raise ValueError(f"ADMISSION_LIMITS: unknown mode {mode!r}")
+        rate = float(rate)
+        limits[(device_type or "*", mode or "*")] = (rate, float(burst) if burst else max(rate, 1.0))
+    return limits
+
+
+class AdmissionController:
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST, limits=ADMISSION_LIMITS,
+                 max_devices=ADMISSION_MAX_DEVICES):
+        self.default = (rate, burst)
+        self.limits = parse_limits(limits) if isinstance(limits, str) else dict(limits)
+        self.max_devices = max_devices
+        # device_type is the registered type (None if unknown): anything else is counted as "other"
+        self.device_types = set(DEVICE_TYPES) | {t for t, _ in self.limits if t != "*"}
+        self._resolved = {}  # (device_type, mode) -> (rate, burst), after wildcard matching
+
+        self._slots = {}     # device_id -> slot
+        self._ids = []       # slot -> device_id (for reclaiming idle slots)
+        self._free = []
+        # bucket b = slot * len(MODES) + mode: tokens left and when they were last topped up
+        self._tokens = array("d")
+        self._stamps = array("d")
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.rejected = {}   # (device_type, mode) -> count
+        self.reclaimed = 0
+
+    def limit(self, device_type, mode):
+        key = (device_type, mode)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            for candidate in (key, (device_type, "*"), ("*", mode), ("*", "*")):
+                if candidate in self.limits:
+                    resolved = self.limits[candidate]
+                    break
+            else:
+                resolved = self.default
+            self._resolved[key] = resolved
+        return resolved
+
+    def admit(self, device_id, device_type, mode, cost=1, now=None):
+        """Spend `cost` tokens. Returns 0.0 when admitted, else the seconds until it would be."""
+        if device_type not in self.device_types:
+            device_type = "other"
+        rate, burst = self.limit(device_type, mode)
+        if rate <= 0:
+            return 0.0
+        cost = min(cost, burst)  # a batch bigger than the bucket goes through on a full bucket
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                slot = self._allocate(device_id, now)
+            b = slot * len(MODES) + MODE_INDEX[mode]
+            tokens = min(burst, self._tokens[b] + (now - self._stamps[b]) * rate)
+            self._stamps[b] = now
+            if tokens >= cost:
+                self._tokens[b] = tokens - cost
+                self.admitted += 1
+                return 0.0
+            self._tokens[b] = tokens
+            key = (device_type, mode)
+            self.rejected[key] = self.rejected.get(key, 0) + 1
+            return (cost - tokens) / rate
+
+    def _allocate(self, device_id, now):
+        if not self._free and len(self._ids) >= self.max_devices:
+            self._reclaim(now)
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = device_id
+        else:
+            slot = len(self._ids)
+            self._ids.append(device_id)
+            self._tokens.extend([0.0] * len(MODES))
+            self._stamps.extend([0.0] * len(MODES))
+        base = slot * len(MODES)
+        for i in range(len(MODES)):
+            self._tokens[base + i] = 0.0
+            self._stamps[base + i] = -math.inf  # refills to a full bucket on first use
+        self._slots[device_id] = slot
+        return slot
+
+    def _reclaim(self, now):
+        """
+        Free the slots of devices idle long enough for all their buckets to be full again, since
+        forgetting those changes nothing. If there are none, free the lower half of the slots;
+        those devices start again with full buckets.
+        """
+        longest_refill = max([burst / rate for rate, burst in [self.default, *self.limits.values()] if rate > 0] or [0])
+        idle_before = now - longest_refill
+        n = len(MODES)
+        for slot, device_id in enumerate(self._ids):
+            if device_id is not None and max(self._stamps[slot * n:slot * n + n]) <= idle_before:
+                self._release(slot, device_id)
+        if not self._free:
+            for slot in range(len(self._ids) // 2):
+                self._release(slot, self._ids[slot])
+
+    def _release(self, slot, device_id):
+        del self._slots[device_id]
+        self._ids[slot] = None
+        self._free.append(slot)
+        self.reclaimed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "tracked_devices": len(self._slots),
+                "max_devices": self.max_devices,
+                "approx_bytes": (self._tokens.buffer_info()[1] + self._stamps.buffer_info()[1]) * 8 + len(self._slots) * 100,
+                "admitted": self.admitted,
+                "rejected_total": sum(self.rejected.values()),
+                "rejected": [{"device_type": t, "mode": m, "count": c} for (t, m), c in sorted(self.rejected.items())],
+                "reclaimed_slots": self.reclaimed,
+            }
+
+
+# Shared controller (None when admission control is disabled)
+admission = AdmissionController() if ADMISSION_CONTROL_ENABLED else None
@@ -1,14 +1,199 @@
 # Define functions to log data into the database
 #Functions for creating and retrieving logs.
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.models import DeviceLog
+from starlette.concurrency import run_in_threadpool
+from app.database import run_db
+from app.models import Device, DeviceLog
+from app.log_buffer import log_buffer
+from app.rollups import metrics_rollups
+from app.histograms import latency_histograms
+from app.timing import timed
+import secrets
+from datetime import datetime
+
+def record_metrics(log_data: dict):
+    # keep the /metrics/summary rollups and latency histograms in step with every logged row
+    if metrics_rollups is not None and log_buffer is None:
+        metrics_rollups.record(log_data)
+    latency_histograms.record(log_data.get("mode"), log_data.get("status_code"), log_data.get("response_time"))
+
+def record_rollups(rows: list):
+    for row in rows:
+        metrics_rollups.record(row)
+
+# write-behind mode: rows reach the rollups once they are committed, so rows the buffer drops
+# after its retries never show up in /metrics/summary
+if log_buffer is not None and metrics_rollups is not None:
+    log_buffer.on_flush = record_rollups
 
 def create_device_log(db: Session, log_data: dict):
+    # write-behind mode: queue the row, the flusher thread inserts it in a batch
+    if log_buffer is not None:
+        row = log_buffer.put(log_data)
+        record_metrics(row)
+        return row
+
     log_entry = DeviceLog(**log_data)
     db.add(log_entry)
     db.commit()
     db.refresh(log_entry)
+    record_metrics({**log_data, "created_at": log_entry.created_at})
     return log_entry
 
+async def create_device_log_async(db, log_data: dict):
+    """create_device_log for async handlers: never blocks the event loop."""
+    with timed("log_write"):
+        return await _create_device_log_async(db, log_data)
+
+async def _create_device_log_async(db, log_data: dict):
+    if log_buffer is not None:
+        row = log_buffer.try_put(log_data)
+        if row is not None:
+            record_metrics(row)
+            return row
+        # queue full: wait for space (bounded by the put timeout) off the loop
+        row = await run_in_threadpool(log_buffer.put, log_data)
+        record_metrics(row)
+        return row
+    return await run_db(db, create_device_log, log_data)
+
+def create_device_logs(db: Session, rows: list):
+    """Insert many log rows with one multi-row statement (or queue them in write-behind mode)."""
+    if log_buffer is not None:
+        queued = log_buffer.put_many(rows)  # all or nothing: a 503 means no row of the batch was queued
+        for row in queued:
+            record_metrics(row)
+        return queued
+
+    now = datetime.utcnow()
+    rows = [{**row, "created_at": row.get("created_at") or now} for row in rows]
+    if rows:
+        db.execute(insert(DeviceLog), rows)
+        db.commit()
+    for row in rows:
+        record_metrics(row)
+    return rows
+
+async def create_device_logs_async(db, rows: list):
+    with timed("log_write"):
+        if log_buffer is not None:
+            return await run_in_threadpool(create_device_logs, db, rows)
+        return await run_db(db, create_device_logs, rows)
+
 def get_all_logs(db: Session):
     return db.query(DeviceLog).all()
+
+LOG_COLUMNS = ["id", "device_id", "device_type", "mode", "status_code", "response_time", "payload_size", "created_at"]
+
+def _log_query(mode=None, device_id=None, status_code=None):
+    stmt = select(*[getattr(DeviceLog, c) for c in LOG_COLUMNS])
+    if mode is not None:
+        stmt = stmt.where(DeviceLog.mode == mode)
+    if device_id is not None:
+        stmt = stmt.where(DeviceLog.device_id == device_id)
+    if status_code is not None:
+        stmt = stmt.where(DeviceLog.status_code == status_code)
+    return stmt
+
+def get_logs_page(db: Session, limit: int, cursor: int = None, mode=None, device_id=None, status_code=None):
+    """Keyset page of logs ordered by id; pass the returned cursor back to get the next page."""
+    stmt = _log_query(mode, device_id, status_code)
+    if cursor is not None:
+        stmt = stmt.where(DeviceLog.id > cursor)
+    rows = [dict(row._mapping) for row in db.execute(stmt.order_by(DeviceLog.id).limit(limit))]
+    next_cursor = rows[-1]["id"] if len(rows) == limit else None
+    return rows, next_cursor
+
+def iter_logs(db: Session, chunk_size: int = 1000, mode=None, device_id=None, status_code=None):
+    """Yield logs from a server-side cursor, chunk_size rows at a time, so memory stays flat."""
+    stmt = _log_query(mode, device_id, status_code).order_by(DeviceLog.id)
+    result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    for row in result:
+        yield row._mapping
+
+# Device registry helpers (sync; async handlers call them through run_db)
+
+def get_devices_page(db: Session, limit: int, cursor: str = None):
+    query = db.query(Device)
+    if cursor is not None:
+        query = query.filter(Device.device_id > cursor)
+    devices = query.order_by(Device.device_id).limit(limit).all()
+    next_cursor = devices[-1].device_id if len(devices) == limit else None
+    return devices, next_cursor
+
+def iter_devices(db: Session, chunk_size: int = 1000):
+    result = db.execute(select(Device).execution_options(stream_results=True, yield_per=chunk_size))
+    for device in result.scalars():
+        yield device
+
+def get_device(db: Session, device_id: str):
+    return db.query(Device).filter(Device.device_id == device_id).first()
+
+def create_device(db: Session, device_data: dict):
+    device = Device(**device_data)
+    db.add(device)
+    db.commit()
+    db.refresh(device)
+    return device
+
+def delete_device(db: Session, device: Device):
+    db.delete(device)
+    db.commit()
+
+# Bulk provisioning: one set-based conflict check and one multi-row insert per batch
+
+def _bulk_secrets(n: int):
+    raw = secrets.token_hex(4 * n)  # one call for the whole batch, 8 hex chars per device
+    return [raw[i * 8:(i + 1) * 8] for i in range(n)]
+
+def create_devices_bulk(db: Session, devices: list):
+    """
+    Insert the devices that do not exist yet in one transaction.
+    Returns one result dict per input item, in input order.
+    """
+    for attempt in range(2):
+        ids = [d["device_id"] for d in devices]
+        existing = set(db.scalars(select(Device.device_id).where(Device.device_id.in_(ids))))
+
+        results = []
+        rows = []
+        seen = set()
+        for d in devices:
+            device_id = d["device_id"]
+            if device_id in existing or device_id in seen:
+                results.append({"device_id": device_id, "status": "conflict", "detail": "Device ID already exists"})
+                continue
+            seen.add(device_id)
+            row = {"device_id": device_id, "device_type": d["device_type"], "mode": d["mode"]}
+            rows.append(row)
+            results.append(row)
+
+        for row, secret in zip(rows, _bulk_secrets(len(rows))):
+            row["shared_secret"] = secret
+        try:
+            if rows:
+                db.execute(insert(Device), rows)
+            db.commit()
+        except IntegrityError:
+            # a concurrent writer added one of these IDs after our check: re-check once
+            db.rollback()
+            if attempt:
+                raise
+            continue
+
+        for row in rows:
+            row["status"] = "created"
+        return results
+
+def delete_devices_bulk(db: Session, device_ids: list):
+    """Delete the given devices in one statement; returns one result dict per input ID."""
+    deleted = set(db.scalars(
+        delete(Device).where(Device.device_id.in_(device_ids)).returning(Device.device_id)
+    ))
+    db.commit()
+    return [
+        {"device_id": device_id, "status": "deleted" if device_id in deleted else "not_found"}
+        for device_id in device_ids
+    ]
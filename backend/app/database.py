@@ -3,7 +3,9 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 # Load environment variables from .env
 load_dotenv()
@@ -15,19 +17,110 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")  # Default PostgreSQL port
 DB_NAME = os.getenv("DB_NAME")
 
-# Construct the database URL
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Connection pool / driver settings
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"  # use SQLAlchemy asyncio + asyncpg for request sessions
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))        # seconds to wait for a free pooled connection
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))    # seconds to establish a new connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # seconds before a pooled connection is replaced (-1 = never)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"  # test each connection on checkout
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", str(DB_POOL_SIZE)))     # connections opened at startup
+
+# Construct the database URL (DATABASE_URL overrides the DB_* parts, e.g. sqlite:///bench.db for benchmarks)
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+pool_options = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
 
 
 #configure SQLAlchemy
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The sync engine is always created: schema setup and background jobs (log flusher) use it.
+# Creating an engine opens no connections; the app lifespan prewarms the pool (prewarm_pool).
+if DATABASE_URL.startswith("sqlite"):
+    connect_args = {"check_same_thread": False}  # sessions move between threadpool threads
+else:
+    connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **pool_options)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
+if DB_ASYNC:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args={"timeout": DB_CONNECT_TIMEOUT}, **pool_options)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    # Dependency to get DB session (AsyncSession)
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+    # Dependency to get DB session
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+def _run_and_release(fn, db, *args, **kwargs):
+    try:
+        result = fn(db, *args, **kwargs)
+    except Exception:
+        db.rollback()
+        raise
+    # End the transaction so the connection goes back to the pool before the next await.
+    # Otherwise threadpool threads blocked waiting for a connection can starve the very
+    # requests that hold the connections, until the pool timeout fires.
+    db.commit()
+    return result
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    Run fn(session, *args) without blocking the event loop.
+    With DB_ASYNC the AsyncSession runs it on its own connection (asyncpg);
+    otherwise the sync Session call is moved to the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(_run_and_release, fn, db, *args, **kwargs)
+
+
+def prewarm_pool(count=DB_POOL_PREWARM):
+    """Open `count` pooled connections at once (capped at the pool size) so first requests don't pay for connecting."""
+    count = min(count, DB_POOL_SIZE)
+    connections = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in connections:
+            conn.close()  # back to the pool, still open
+    return len(connections)
+
+
+async def prewarm_async_pool(count=DB_POOL_PREWARM):
+    """prewarm_pool for the asyncpg engine (DB_ASYNC)."""
+    count = min(count, DB_POOL_SIZE)
+    connections = []
     try:
-        yield db
+        for _ in range(count):
+            conn = await async_engine.connect()
+            connections.append(conn)
+            await conn.exec_driver_sql("SELECT 1")
     finally:
-        db.close()
\ No newline at end of file
+        for conn in connections:
+            await conn.close()
+    return len(connections)
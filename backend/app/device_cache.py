@@ -0,0 +1,131 @@
+#In-process cache of device records used on the authentication path.
+#Bounded LRU with a TTL; unknown device IDs are cached too (negative caching).
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.database import run_db
+from app.models import Device
+from app.shared_state import shared_state
+
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "100000"))
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "300"))               # seconds
+DEVICE_CACHE_NEGATIVE_TTL = float(os.getenv("DEVICE_CACHE_NEGATIVE_TTL", "5"))  # seconds, for unknown IDs
+DEVICE_CACHE_PREWARM = int(os.getenv("DEVICE_CACHE_PREWARM", "10000"))        # devices loaded at startup (0 = none)
+
+# Detached snapshot of the columns the legacy handlers need (no ORM session attached)
+CachedDevice = namedtuple("CachedDevice", ["device_id", "device_type", "mode", "shared_secret"])
+
+
+class DeviceCache:
+    def __init__(self, max_size=DEVICE_CACHE_SIZE, ttl=DEVICE_CACHE_TTL, negative_ttl=DEVICE_CACHE_NEGATIVE_TTL,
+                 shared=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # device_id -> (expires_at, CachedDevice or None)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # entries stay per worker (kept coherent by app.device_events); hit/miss counts are host-wide
+        self.shared = shared
+
+    def get(self, device_id):
+        """Return (hit, device). device is None for a cached unknown ID."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[device_id]
+                self.misses += 1
+                hit = False
+            else:
+                self._entries.move_to_end(device_id)
+                self.hits += 1
+                hit = True
+        if self.shared is not None:
+            self.shared.add("device_cache_hits" if hit else "device_cache_misses")
+        return (True, entry[1]) if hit else (False, None)
+
+    def peek(self, device_id):
+        """The cached device, or None if unknown or not cached. No stats, LRU update or database read."""
+        entry = self._entries.get(device_id)  # a single dict read needs no lock
+        return entry[1] if entry is not None and entry[0] >= time.monotonic() else None
+
+    def put(self, device_id, device):
+        ttl = self.ttl if device is not None else self.negative_ttl
+        with self._lock:
+            self._entries[device_id] = (time.monotonic() + ttl, device)
+            self._entries.move_to_end(device_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def known_devices(self):
+        """(device_id, shared_secret) pairs of the live positive entries."""
+        now = time.monotonic()
+        with self._lock:
+            return [(d.device_id, d.shared_secret) for expires, d in self._entries.values()
+                    if d is not None and expires >= now]
+
+    def invalidate(self, device_id=None):
+        """Drop one device, or the whole cache when no ID is given."""
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.shared.counter("device_cache_hits") if self.shared else self.hits,
+                "misses": self.shared.counter("device_cache_misses") if self.shared else self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def load_device(db: Session, device_id: str):
+    """Read one device from the database as a CachedDevice (or None)."""
+    device = db.query(Device).filter(Device.device_id == device_id).first()
+    if device is None:
+        return None
+    return CachedDevice(device.device_id, device.device_type, device.mode, device.shared_secret)
+
+
+def prewarm_device_cache(db: Session, limit=DEVICE_CACHE_PREWARM):
+    """Load up to `limit` registered devices into the cache in one streamed query; returns the count."""
+    limit = min(limit, device_cache.max_size)
+    if limit <= 0:
+        return 0
+    rows = db.execute(
+        select(Device.device_id, Device.device_type, Device.mode, Device.shared_secret)
+        .limit(limit)
+        .execution_options(stream_results=True, yield_per=1000)
+    )
+    count = 0
+    for row in rows:
+        device_cache.put(row.device_id, CachedDevice(*row))
+        count += 1
+    return count
+
+
+async def get_device(db, device_id: str):
+    """Cached device lookup for the legacy handlers; only a miss touches the database."""
+    hit, device = device_cache.get(device_id)
+    if hit:
+        return device
+    device = await run_db(db, load_device, device_id)
+    device_cache.put(device_id, device)
+    return device
+
+
+# Shared cache instance
+device_cache = DeviceCache(shared=shared_state)
@@ -0,0 +1,121 @@
+#Device change notifications between gateway workers (PostgreSQL LISTEN/NOTIFY).
+#Each worker keeps its own device cache. When devices are created or deleted, their IDs are sent
+#on a channel, and every listening worker (on this host or any other) drops them from its cache.
+#Without this, a deleted device would stay authenticated in the other workers until its cache TTL.
+import os
+import select
+import threading
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.database import engine as default_engine
+from app.device_cache import device_cache
+from app.shared_state import SHARED_STATE_ENABLED
+
+DEVICE_CACHE_NOTIFY = os.getenv("DEVICE_CACHE_NOTIFY", str(SHARED_STATE_ENABLED)).lower() == "true"
+DEVICE_NOTIFY_CHANNEL = os.getenv("DEVICE_NOTIFY_CHANNEL", "zta_device_changes")
+NOTIFY_PAYLOAD_MAX = 7900  # PostgreSQL limits a payload to 8000 bytes
+INVALIDATE_ALL = "*"
+
+
+def notify_enabled(engine=default_engine):
+    return DEVICE_CACHE_NOTIFY and engine.dialect.name == "postgresql"
+
+
+def _payloads(device_ids):
+    """Newline-separated IDs, split to fit the payload limit."""
+    payload = []
+    size = 0
+    for device_id in device_ids:
+        length = len(device_id.encode()) + 1
+        if payload and size + length > NOTIFY_PAYLOAD_MAX:
+            yield "\n".join(payload)
+            payload, size = [], 0
+        payload.append(device_id)
+        size += length
+    if payload:
+        yield "\n".join(payload)
+
+
+def notify_device_changes(db: Session, device_ids):
+    """Announce changed device IDs to every worker's cache (the notifications go out on commit)."""
+    sent = 0
+    for payload in _payloads(device_ids):
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": DEVICE_NOTIFY_CHANNEL, "payload": payload})
+        sent += 1
+    db.commit()
+    return sent
+
+
+class DeviceChangeListener:
+    """Background thread holding one dedicated connection that LISTENs on the channel."""
+
+    def __init__(self, cache, engine=default_engine, channel=DEVICE_NOTIFY_CHANNEL):
+        self.cache = cache
+        self.engine = engine
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = None
+        self.received = 0
+        self.reconnects = 0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="device-change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        connected_before = False
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                conn = raw.driver_connection
+                raw.detach()  # long-lived and in LISTEN state: keep it out of the pool
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                if connected_before:
+                    # notifications sent while disconnected are lost: start over with an empty cache
+                    self.reconnects += 1
+                    self.cache.invalidate()
+                connected_before = True
+                self._listen(conn)
+            except Exception as e:
+                print(f"[DeviceEvents] Listener error, reconnecting: {e}")
+                self._stop.wait(2.0)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if not select.select([conn], [], [], 1.0)[0]:
+                continue
+            conn.poll()
+            while conn.notifies:
+                self.apply(conn.notifies.pop(0).payload)
+
+    def apply(self, payload):
+        self.received += 1
+        if payload == INVALIDATE_ALL:
+            self.cache.invalidate()
+            return
+        for device_id in payload.split("\n"):
+            self.cache.invalidate(device_id)
+
+    def stats(self):
+        return {"channel": self.channel, "received": self.received, "reconnects": self.reconnects,
+                "listening": self._thread is not None and self._thread.is_alive()}
+
+
+# Shared listener (None unless DEVICE_CACHE_NOTIFY is on and the database is PostgreSQL)
+device_listener = DeviceChangeListener(device_cache) if notify_enabled() else None
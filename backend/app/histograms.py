@@ -0,0 +1,148 @@
+#Streaming latency histograms for the legacy endpoints.
+#Log-bucketed sketches (DDSketch-style, bounded relative error) kept per (mode, status_code)
+#in a ring of 10-second slices, so 1m/5m/1h percentiles come from merging slices, not SQL.
+import math
+import os
+import threading
+import time
+
+HISTOGRAM_RELATIVE_ACCURACY = float(os.getenv("HISTOGRAM_RELATIVE_ACCURACY", "0.01"))  # 1% relative error on quantiles
+HISTOGRAM_SLICE_SECONDS = 10
+HISTOGRAM_MIN_VALUE = 1e-6  # seconds; smaller values share the lowest bucket
+HISTOGRAM_MAX_VALUE = 1e3   # seconds; larger values share the highest bucket
+
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+class LatencySketch:
+    """Mergeable log-bucketed histogram with a fixed number of buckets."""
+    __slots__ = ("gamma", "log_gamma", "offset", "counts", "count", "max")
+
+    def __init__(self, relative_accuracy=HISTOGRAM_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = self._raw_index(HISTOGRAM_MIN_VALUE)
+        self.counts = {}  # bucket index -> count (sparse; at most index(MAX) + 1 entries)
+        self.count = 0
+        self.max = 0.0
+
+    def _raw_index(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _index(self, value):
+        value = min(max(value, HISTOGRAM_MIN_VALUE), HISTOGRAM_MAX_VALUE)
+        return self._raw_index(value) - self.offset
+
+    def add(self, value, count=1):
+        i = self._index(value)
+        self.counts[i] = self.counts.get(i, 0) + count
+        self.count += count
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.count += other.count
+        if other.max > self.max:
+            self.max = other.max
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen > rank:
+                # midpoint of the bucket (gamma^(i-1), gamma^i] keeps the error within the accuracy bound
+                value = 2 * self.gamma ** (i + self.offset) / (self.gamma + 1)
+                return min(value, self.max)
+        return self.max
+
+
+class WindowedSketch:
+    """Ring of per-slice sketches covering the longest window."""
+
+    def __init__(self, slice_seconds=HISTOGRAM_SLICE_SECONDS, horizon=max(WINDOWS.values())):
+        self.slice_seconds = slice_seconds
+        self.slices = horizon // slice_seconds
+        self._ring = [None] * self.slices  # (slice_id, LatencySketch)
+
+    def add(self, value, now):
+        slice_id = int(now // self.slice_seconds)
+        pos = slice_id % self.slices
+        entry = self._ring[pos]
+        if entry is None or entry[0] != slice_id:
+            entry = self._ring[pos] = (slice_id, LatencySketch())  # reuse the slot: the old slice aged out
+        entry[1].add(value)
+
+    def merged(self, window_seconds, now):
+        current = int(now // self.slice_seconds)
+        oldest = current - math.ceil(window_seconds / self.slice_seconds) + 1
+        result = LatencySketch()
+        for entry in self._ring:
+            if entry is not None and oldest <= entry[0] <= current:
+                result.merge(entry[1])
+        return result
+
+
+class LatencyHistograms:
+    def __init__(self):
+        self._series = {}  # (mode, status_code) -> WindowedSketch
+        self._lock = threading.Lock()
+
+    def record(self, mode, status_code, value, now=None):
+        if value is None:
+            return
+        if now is None:
+            now = time.time()
+        key = (mode or "unknown", status_code)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = WindowedSketch()
+            series.add(value, now)
+
+    def report(self, window="5m", mode=None, status_code=None, now=None):
+        window_seconds = WINDOWS[window]
+        if now is None:
+            now = time.time()
+        with self._lock:
+            merged = {
+                key: series.merged(window_seconds, now)
+                for key, series in self._series.items()
+                if (mode is None or key[0] == mode) and (status_code is None or key[1] == status_code)
+            }
+
+        by_mode = {}
+        by_status = []
+        for (m, status), sketch in sorted(merged.items(), key=lambda kv: (kv[0][0], kv[0][1] or 0)):
+            if sketch.count == 0:
+                continue
+            by_status.append({"mode": m, "status_code": status, **describe(sketch)})
+            by_mode.setdefault(m, LatencySketch()).merge(sketch)
+
+        return {
+            "window": window,
+            "window_seconds": window_seconds,
+            "modes": {m: describe(sketch) for m, sketch in by_mode.items()},
+            "by_status": by_status,
+        }
+
+
+def describe(sketch: LatencySketch):
+    def q(x):
+        v = sketch.quantile(x)
+        return round(v, 6) if v is not None else None
+    return {
+        "count": sketch.count,
+        "p50": q(0.50),
+        "p90": q(0.90),
+        "p99": q(0.99),
+        "max": round(sketch.max, 6),
+    }
+
+
+# Shared histogram state
+latency_histograms = LatencyHistograms()
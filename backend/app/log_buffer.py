@@ -0,0 +1,241 @@
+#Write-behind buffer for device log ingestion.
+#Rows are queued in memory and flushed as multi-row inserts by a background thread.
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert
+from app.database import SessionLocal
+from app.models import DeviceLog
+
+logger = logging.getLogger(__name__)
+
+# Buffer settings (read from .env, see .env.example)
+LOG_BUFFER_ENABLED = os.getenv("LOG_BUFFER_ENABLED", "false").lower() == "true"
+LOG_BUFFER_QUEUE_SIZE = int(os.getenv("LOG_BUFFER_QUEUE_SIZE", "50000"))   # max rows waiting in memory
+LOG_BUFFER_BATCH_SIZE = int(os.getenv("LOG_BUFFER_BATCH_SIZE", "500"))     # flush when this many rows are queued
+LOG_BUFFER_MAX_AGE = float(os.getenv("LOG_BUFFER_MAX_AGE", "1.0"))         # ... or when the oldest row is this old (seconds)
+LOG_BUFFER_PUT_TIMEOUT = float(os.getenv("LOG_BUFFER_PUT_TIMEOUT", "0.05"))  # how long a request waits on a full queue
+LOG_BUFFER_FLUSH_RETRIES = int(os.getenv("LOG_BUFFER_FLUSH_RETRIES", "5"))     # retries of a failed flush before its rows are dropped
+LOG_BUFFER_RETRY_BACKOFF = float(os.getenv("LOG_BUFFER_RETRY_BACKOFF", "0.5"))  # first retry delay (seconds), doubled each time
+
+
+class LogBufferFull(Exception):
+    """Raised when the queue stays full for longer than the put timeout (backpressure)."""
+
+
+class LogWriteBuffer:
+    def __init__(self, session_factory=SessionLocal, queue_size=LOG_BUFFER_QUEUE_SIZE,
+                 batch_size=LOG_BUFFER_BATCH_SIZE, max_age=LOG_BUFFER_MAX_AGE,
+                 put_timeout=LOG_BUFFER_PUT_TIMEOUT, flush_retries=LOG_BUFFER_FLUSH_RETRIES,
+                 retry_backoff=LOG_BUFFER_RETRY_BACKOFF, on_flush=None):
+        self.session_factory = session_factory
+        self.on_flush = on_flush  # called with each batch once it is committed (see app.crud)
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.put_timeout = put_timeout
+        self.flush_retries = flush_retries
+        self.retry_backoff = retry_backoff
+        self.queue_size = queue_size
+        # one lock, two conditions (like queue.Queue), so put_many can check room for a whole batch
+        self._rows = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+
+        # counters
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.dropped_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    # ------------------------ lifecycle ------------------------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-buffer-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop the flusher thread and write out whatever is still queued."""
+        self._stop.set()
+        with self._lock:
+            self._not_empty.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self._drain()
+
+    # ------------------------ producer side ------------------------
+
+    def _row(self, log_data: dict):
+        row = dict(log_data)
+        # stamp the row now, not when it is flushed
+        row.setdefault("created_at", datetime.utcnow())
+        return row
+
+    def _enqueue(self, rows, timeout):
+        """Queue all rows, waiting up to timeout for room for every one of them; False if there is none."""
+        deadline = time.monotonic() + timeout
+        with self._not_full:
+            while self.queue_size - len(self._rows) < len(rows):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or len(rows) > self.queue_size:
+                    return False
+                self._not_full.wait(remaining)
+            was_empty = not self._rows
+            self._rows.extend(rows)
+            # wake the flusher for its first row or a full batch, not on every put
+            if was_empty or len(self._rows) >= self.batch_size:
+                self._not_empty.notify()
+        with self._stats_lock:
+            self.enqueued += len(rows)
+        return True
+
+    def try_put(self, log_data: dict):
+        """Non-blocking enqueue (safe on the event loop). Returns None if the queue is full."""
+        row = self._row(log_data)
+        return row if self._enqueue((row,), 0) else None
+
+    def put(self, log_data: dict):
+        """Enqueue, waiting up to put_timeout for space; raises LogBufferFull after that."""
+        return self.put_many([log_data])[0]
+
+    def put_many(self, rows: list):
+        """
+        Enqueue a whole batch or none of it: waits up to put_timeout until there is room for
+        every row, then queues them together; raises LogBufferFull after that.
+        """
+        rows = [self._row(log_data) for log_data in rows]
+        if not self._enqueue(rows, self.put_timeout):
+            with self._stats_lock:
+                self.rejected += len(rows)
+            raise LogBufferFull("Log buffer is full")
+        return rows
+
+    # ------------------------ flusher side ------------------------
+
+    def _take(self, n):
+        batch = [self._rows.popleft() for _ in range(min(n, len(self._rows)))]
+        if batch:
+            self._not_full.notify_all()
+        return batch
+
+    def _next_batch(self):
+        """Wait for batch_size rows, or for whatever is queued max_age after the first one arrived."""
+        with self._not_empty:
+            if not self._rows:
+                self._not_empty.wait(0.25)
+                if not self._rows:
+                    return []
+            deadline = time.monotonic() + self.max_age
+            while len(self._rows) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+            return self._take(self.batch_size)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                batch = self._take(self.batch_size)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _insert(self, batch):
+        db = self.session_factory()
+        try:
+            # executemany insert -> SQLAlchemy batches this into multi-row INSERTs
+            db.execute(insert(DeviceLog), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self, batch):
+        """
+        Insert one batch, retrying with exponential backoff while the database is unavailable.
+        The flusher stalls meanwhile, so a full queue pushes back on requests (503) instead of
+        losing rows. Rows are only dropped (and counted) once the retries run out; while
+        stopping, the retries do not wait.
+        """
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                self._insert(batch)
+                ok = True
+                break
+            except Exception as e:
+                attempt += 1
+                with self._stats_lock:
+                    self.flush_errors += 1
+                if attempt > self.flush_retries:
+                    logger.error("Dropping %s log rows after %s failed flushes: %s", len(batch), attempt, e)
+                    ok = False
+                    break
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                logger.warning("Flush of %s log rows failed (attempt %s), retrying in %.1fs: %s", len(batch), attempt, delay, e)
+                self._stop.wait(delay)
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.flush_count += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+            if ok:
+                self.flushed_rows += len(batch)
+            else:
+                self.dropped_rows += len(batch)
+        if ok and self.on_flush is not None:
+            try:
+                self.on_flush(batch)
+            except Exception:
+                logger.exception("Flush callback failed")
+
+    # ------------------------ metrics ------------------------
+
+    def stats(self):
+        with self._stats_lock:
+            avg = self.total_flush_seconds / self.flush_count if self.flush_count else 0.0
+            return {
+                "enabled": True,
+                "queue_depth": len(self._rows),
+                "queue_capacity": self.queue_size,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "flushed_rows": self.flushed_rows,
+                "flush_count": self.flush_count,
+                "flush_errors": self.flush_errors,
+                "dropped_rows": self.dropped_rows,
+                "last_flush_seconds": round(self.last_flush_seconds, 6),
+                "avg_flush_seconds": round(avg, 6),
+                "max_flush_seconds": round(self.max_flush_seconds, 6),
+            }
+
+
+# Shared buffer instance (None when write-behind is disabled)
+log_buffer = LogWriteBuffer() if LOG_BUFFER_ENABLED else None
@@ -1,19 +1,98 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.routes.device_management import router as device_management_router
 from app.routes.legacy import router as legacy_router
-from app.routes.metrics import router as metrics_router
-from app.database import Base, engine
+from app.routes.metrics import router as metrics_router, metrics_broadcaster
+from app.routes.logs import router as logs_router
+from app.routes.prometheus import router as prometheus_router
+from app.routes.health import router as health_router, readiness
+from app.database import SessionLocal, async_engine, prewarm_pool, prewarm_async_pool
+from app.log_buffer import log_buffer, LogBufferFull
+from app.timing import TimingMiddleware
+from app.device_cache import device_cache, prewarm_device_cache
+from app.device_events import device_listener
+from app.tokens import token_engine, precompute_loop, TOKEN_PRECOMPUTE
+from app.rollups import metrics_rollups
+from app.partitions import partitioning_enabled, PartitionMaintainer
+from app.schema import ensure_schema
+import asyncio
 
+partition_maintainer = PartitionMaintainer() if partitioning_enabled() else None
 
-# Create tables in the database.
-# Base.metadata.create_all ensures that all tables defined in the ORM models
-# are created in the database if they do not already exist. It binds the metadata
-# to the database engine and executes the necessary SQL commands to create the tables.
 
-Base.metadata.create_all(bind=engine)
+def prewarm_devices():
+    with SessionLocal() as db:
+        return prewarm_device_cache(db)
 
-app = FastAPI(title = "Legacy IOT ZTA Gateway")
+
+async def warm_up():
+    """Open pooled connections and fill the device cache, then report ready (retried until the database answers)."""
+    while True:
+        try:
+            readiness.mark("db_connections", await asyncio.to_thread(prewarm_pool))
+            if async_engine is not None:
+                readiness.mark("async_db_connections", await prewarm_async_pool())
+            readiness.mark("cached_devices", await asyncio.to_thread(prewarm_devices))
+            if TOKEN_PRECOMPUTE:
+                readiness.mark("precomputed_tokens",
+                               await asyncio.to_thread(token_engine.precompute, device_cache.known_devices()))
+            break
+        except Exception as e:
+            readiness.mark("error", str(e))
+            print(f"[Startup] Warm-up failed, retrying: {e}")
+            await asyncio.sleep(2.0)
+    readiness.steps.pop("error", None)
+    readiness.set_ready()
+    print(f"[Startup] Ready: {readiness.steps}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema: inspect once, create only what is missing (see app.schema)
+    await asyncio.to_thread(ensure_schema)
+    readiness.mark("schema", "ok")
+
+    # Partition maintenance: create upcoming device_logs partitions, roll up and drop expired ones
+    if partition_maintainer is not None:
+        partition_maintainer.start()
+    # Write-behind log buffer: start the flusher
+    if log_buffer is not None:
+        log_buffer.start()
+    # Metrics rollups: load the persisted totals, then add local deltas to the table periodically
+    if metrics_rollups is not None:
+        await asyncio.to_thread(metrics_rollups.start)
+    # Live metrics stream: one ticker shared by every connected dashboard
+    metrics_broadcaster.start()
+    # Device change notifications from other workers (LISTEN/NOTIFY) keep this worker's cache coherent
+    if device_listener is not None:
+        device_listener.start()
+
+    tasks = [asyncio.create_task(warm_up())]
+    # Token table: optionally hash the next window for cached devices before the boundary
+    if TOKEN_PRECOMPUTE:
+        tasks.append(asyncio.create_task(precompute_loop(token_engine, device_cache.known_devices)))
+
+    yield
+
+    readiness.set_ready(False)  # fail readiness first so load balancers stop routing here
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # flush what is left in the buffer and the rollup deltas
+    if log_buffer is not None:
+        log_buffer.stop()
+    if metrics_rollups is not None:
+        metrics_rollups.stop()
+    if partition_maintainer is not None:
+        partition_maintainer.stop()
+    if device_listener is not None:
+        device_listener.stop()
+    await metrics_broadcaster.stop()
+
+
+app = FastAPI(title = "Legacy IOT ZTA Gateway", lifespan=lifespan)
 
 # Configure CORS
 
@@ -30,8 +109,20 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Per-request and per-stage timings, exported at /metrics
+app.add_middleware(TimingMiddleware)
+
+
+@app.exception_handler(LogBufferFull)
+async def log_buffer_full_handler(request: Request, exc: LogBufferFull):
+    # backpressure: tell the device to retry later instead of growing memory
+    return JSONResponse(status_code=503, content={"detail": "Gateway busy, retry later"}, headers={"Retry-After": "1"})
+
 #register routers
 
 app.include_router(legacy_router, prefix="/api", tags=["legacy"])
 app.include_router(device_management_router, prefix="/api", tags=["device_management"])
-app.include_router(metrics_router, prefix="/api", tags=["dashboard_metrics"])
\ No newline at end of file
+app.include_router(metrics_router, prefix="/api", tags=["dashboard_metrics"])
+app.include_router(logs_router, prefix="/api", tags=["logs"])
+app.include_router(health_router, tags=["health"])
+app.include_router(prometheus_router, tags=["prometheus"])  # /metrics at the root, where scrapers look
\ No newline at end of file
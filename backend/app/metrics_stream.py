@@ -0,0 +1,133 @@
+#Push-based live metrics for the dashboard (Server-Sent Events).
+#One background task computes the metrics once per tick and publishes a single serialized event;
+#every connected client receives that same event, so dashboards add no database load of their own.
+#Slow clients are coalesced: they skip straight to the latest event instead of queueing old ones.
+import asyncio
+import json
+import os
+import time
+
+METRICS_STREAM_INTERVAL = float(os.getenv("METRICS_STREAM_INTERVAL", "1.0"))  # seconds between ticks
+METRICS_STREAM_KEEPALIVE = 15.0  # seconds; comment line so proxies keep an idle stream open
+
+
+class MetricsBroadcaster:
+    def __init__(self, compute, interval=METRICS_STREAM_INTERVAL):
+        self.compute = compute    # async () -> /metrics/summary dict
+        self.interval = interval
+        self.subscribers = 0
+        self.ticks = 0            # computations done (one per tick with listeners, however many)
+        self._seq = 0
+        self._event = None        # latest serialized SSE message
+        self._previous = None     # (summary, monotonic time) of the last published tick
+        self._changed = asyncio.Condition()
+        self._task = None
+
+    # ------------------------ lifecycle ------------------------
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            if self.subscribers:
+                try:
+                    await self._tick()
+                except Exception as e:
+                    print(f"[MetricsStream] Tick failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    # ------------------------ producer ------------------------
+
+    async def _tick(self):
+        summary = await self.compute()
+        self.ticks += 1
+        now = time.monotonic()
+        if self._previous is not None and self._previous[0] == summary:
+            return  # nothing new; clients keep what they have
+        previous, elapsed = (self._previous[0], now - self._previous[1]) if self._previous else (None, None)
+        self._previous = (summary, now)
+
+        self._seq += 1
+        payload = {
+            "seq": self._seq,
+            "interval": self.interval,
+            "summary": summary,
+            "delta": delta(previous, summary, elapsed),
+        }
+        message = f"id: {self._seq}\nevent: metrics\ndata: {json.dumps(payload, default=str)}\n\n"
+        async with self._changed:
+            self._event = message
+            self._changed.notify_all()
+
+    # ------------------------ consumers ------------------------
+
+    async def subscribe(self):
+        """Async iterator of SSE messages for one client (latest event first, then each new one)."""
+        self.subscribers += 1
+        seen = None
+        try:
+            if self._previous is None:
+                try:
+                    await self._tick()  # first listener: don't make it wait a full interval
+                except Exception as e:
+                    # stay connected: the background task keeps ticking, as after any failed tick
+                    print(f"[MetricsStream] Tick failed: {e}")
+                    yield error_event("Metrics are unavailable, retrying", self.interval)
+            while True:
+                if self._event is not seen:
+                    seen = self._event
+                    yield seen
+                    continue
+                async with self._changed:
+                    try:
+                        await asyncio.wait_for(
+                            self._changed.wait_for(lambda: self._event is not seen), METRICS_STREAM_KEEPALIVE
+                        )
+                        idle = False
+                    except asyncio.TimeoutError:
+                        idle = True
+                if idle:
+                    yield ": keepalive\n\n"  # outside the lock: a stalled client must not block the producer
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers:
+                self._previous = None  # deltas restart from the next listener's first tick
+
+    def stats(self):
+        return {"subscribers": self.subscribers, "ticks": self.ticks, "events": self._seq, "interval": self.interval}
+
+
+def error_event(detail, retry_seconds):
+    """SSE error event; the retry field tells EventSource how soon to reconnect if the stream drops."""
+    return f"event: error\nretry: {int(retry_seconds * 1000)}\ndata: {json.dumps({'detail': detail})}\n\n"
+
+
+def delta(previous, current, elapsed):
+    """Changes since the previous published tick, with per-mode request rates over that interval."""
+    if previous is None:
+        return None
+    requests = {
+        mode: count - previous["requests"].get(mode, 0)
+        for mode, count in current["requests"].items()
+    }
+    rate = {mode: round(n / elapsed, 3) for mode, n in requests.items()} if elapsed else {}
+    total = current["total_logs"] - previous["total_logs"]
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": requests,
+        "total_logs": total,
+        "replay_attempts": current["replay_attempts"] - previous["replay_attempts"],
+        "throughput_rps": rate,
+        "total_throughput_rps": round(total / elapsed, 3) if elapsed else None,
+    }
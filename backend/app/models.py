@@ -1,6 +1,6 @@
 #to structure the database table (schema)
 
-from sqlalchemy import Column, Integer, String, Float, Enum, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Enum, DateTime, Index
 from app.database import Base
 from datetime import datetime
 
@@ -24,4 +24,41 @@ class DeviceLog(Base):
     status_code = Column(Integer)
     response_time = Column(Float)
     payload_size = Column(Integer)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # composite indexes matching the metrics/log queries (mode + status filter, time range per mode)
+    __table_args__ = (
+        Index("ix_device_logs_mode_status_code", "mode", "status_code"),
+        Index("ix_device_logs_mode_created_at", "mode", "created_at"),
+        Index("ix_device_logs_created_at", "created_at"),
+    )
+
+class MetricsRollup(Base):
+    """Per-mode running totals behind /metrics/summary (maintained by app.rollups)."""
+    __tablename__ = "metrics_rollups"
+
+    mode = Column(String, primary_key=True)
+    request_count = Column(BigInteger, nullable=False, default=0)
+    latency_sum = Column(Float, nullable=False, default=0.0)
+    latency_count = Column(BigInteger, nullable=False, default=0)
+    status_409_count = Column(BigInteger, nullable=False, default=0)
+    first_at = Column(DateTime)
+    last_at = Column(DateTime)
+
+
+class DeviceLogAggregate(Base):
+    """Roll-up of a dropped device_logs partition (written by the retention job in app.partitions)."""
+    __tablename__ = "device_log_aggregates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    bucket_end = Column(DateTime, nullable=False)
+    device_type = Column(String)
+    mode = Column(String)
+    status_code = Column(Integer)
+    request_count = Column(BigInteger, nullable=False)
+    latency_sum = Column(Float)
+    latency_count = Column(BigInteger)
+    latency_min = Column(Float)
+    latency_max = Column(Float)
+    payload_sum = Column(BigInteger)
@@ -0,0 +1,221 @@
+#Time-partitioned device_logs (PostgreSQL only) and the retention job.
+#With DEVICE_LOGS_PARTITIONING=daily|hourly, device_logs is created as a RANGE partitioned table on
+#created_at. The maintenance job creates partitions ahead of time and, past the retention period,
+#rolls each old partition up into device_log_aggregates and drops it (no DELETE scans). A DEFAULT
+#partition takes rows no range partition covers yet, so inserts never fail if maintenance falls
+#behind; the next maintenance run moves them into their own partitions.
+#Run the job by hand with:  python -m app.partitions maintain
+import os
+import re
+import sys
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import MetaData, PrimaryKeyConstraint, text
+from sqlalchemy.engine import Engine
+from app.database import engine as default_engine
+from app.models import DeviceLog
+
+DEVICE_LOGS_PARTITIONING = os.getenv("DEVICE_LOGS_PARTITIONING", "none").lower()        # none | daily | hourly
+DEVICE_LOGS_PARTITIONS_AHEAD = int(os.getenv("DEVICE_LOGS_PARTITIONS_AHEAD", "3"))      # future partitions kept ready
+DEVICE_LOGS_RETENTION_HOURS = int(os.getenv("DEVICE_LOGS_RETENTION_HOURS", "720"))      # 0 = keep raw logs forever
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "600"))  # seconds
+
+PARENT = DeviceLog.__tablename__
+STEPS = {"daily": (timedelta(days=1), "%Y%m%d"), "hourly": (timedelta(hours=1), "%Y%m%d%H")}
+NAME_RE = re.compile(rf"^{PARENT}_p(\d{{8}}|\d{{10}})$")
+DEFAULT_PARTITION = f"{PARENT}_default"
+TRUNC_UNITS = {"daily": "day", "hourly": "hour"}
+ENSURE_LOCK_KEY = 0x7A7A0009  # pg_advisory_xact_lock key: workers create partitions one at a time
+
+
+def partitioning_enabled():
+    if DEVICE_LOGS_PARTITIONING == "none":
+        return False
+    if DEVICE_LOGS_PARTITIONING not in STEPS:
+        raise ValueError(f"DEVICE_LOGS_PARTITIONING must be none, daily or hourly, not {DEVICE_LOGS_PARTITIONING!r}")
+    return True
+
+
+def _period_start(ts: datetime, granularity):
+    if granularity == "daily":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _partition_name(start: datetime, granularity):
+    return f"{PARENT}_p{start.strftime(STEPS[granularity][1])}"
+
+
+def _partitioned_table():
+    """Copy of the DeviceLog table with the partition key added to the primary key."""
+    table = DeviceLog.__table__.to_metadata(MetaData())
+    table.c.created_at.primary_key = True
+    table.c.created_at.nullable = False
+    table.c.id.autoincrement = True  # keep SERIAL on a composite primary key
+    table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.created_at))
+    table.dialect_options["postgresql"]["partition_by"] = "RANGE (created_at)"
+    return table
+
+
+def _relkind(conn):
+    return conn.execute(
+        text("SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+             "WHERE c.relname = :name AND n.nspname = current_schema()"),
+        {"name": PARENT},
+    ).scalar()
+
+
+def prepare_schema(engine: Engine = default_engine, now=None):
+    """
+    Create device_logs as a partitioned table if it does not exist yet (call before create_all).
+    An existing plain device_logs table is left alone; converting it is a manual migration.
+    """
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("device_logs partitioning requires PostgreSQL")
+
+    with engine.begin() as conn:
+        kind = _relkind(conn)
+        if kind is None:
+            table = _partitioned_table()
+            table.create(conn)  # also creates the indexes, which PostgreSQL propagates to partitions
+            print(f"[Partitions] Created {PARENT} partitioned {DEVICE_LOGS_PARTITIONING} on created_at")
+        elif kind != "p":
+            print(f"[Partitions] {PARENT} exists and is not partitioned; leaving it as is")
+            return False
+    ensure_partitions(engine, now=now)
+    return True
+
+
+def ensure_partitions(engine: Engine = default_engine, now=None, ahead=DEVICE_LOGS_PARTITIONS_AHEAD):
+    granularity = DEVICE_LOGS_PARTITIONING
+    step = STEPS[granularity][0]
+    start = _period_start(now or datetime.utcnow(), granularity)
+    created = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ENSURE_LOCK_KEY})
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+        # one period back as well, for write-behind rows stamped just before a boundary,
+        # plus every period that has rows waiting in the default partition
+        periods = {start + i * step for i in range(-1, ahead + 1)}
+        periods.update(conn.execute(text(
+            f"SELECT DISTINCT date_trunc('{TRUNC_UNITS[granularity]}', created_at) FROM {DEFAULT_PARTITION}"
+        )).scalars())
+        for lower in sorted(periods):
+            created.append(_create_partition(conn, lower, lower + step, granularity))
+    return created
+
+
+def _create_partition(conn, lower, upper, granularity):
+    """
+    Create one range partition. PostgreSQL refuses while the default partition holds rows in its
+    range, so those rows are taken out first and inserted again once the partition exists.
+    """
+    name = _partition_name(lower, granularity)
+    bounds = {"lower": lower, "upper": upper}
+    in_range = "created_at >= :lower AND created_at < :upper"
+    waiting = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})"), bounds).scalar()
+    if waiting:
+        conn.execute(text(
+            f"CREATE TEMP TABLE moved_logs ON COMMIT DROP AS "
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *) SELECT * FROM moved"
+        ), bounds)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    ))
+    if waiting:
+        moved = conn.execute(text(f"INSERT INTO {PARENT} SELECT * FROM moved_logs")).rowcount
+        conn.execute(text("DROP TABLE moved_logs"))
+        print(f"[Partitions] Moved {moved} rows from {DEFAULT_PARTITION} into {name}")
+    return name
+
+
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name AND p.relnamespace = current_schema()::regnamespace ORDER BY c.relname"
+    ), {"name": PARENT}).scalars()
+    partitions = []
+    for name in rows:
+        match = NAME_RE.match(name)
+        if not match:
+            continue
+        stamp = match.group(1)
+        granularity = "daily" if len(stamp) == 8 else "hourly"
+        lower = datetime.strptime(stamp, STEPS[granularity][1])
+        partitions.append((name, lower, lower + STEPS[granularity][0]))
+    return partitions
+
+
+def apply_retention(engine: Engine = default_engine, now=None, retention_hours=DEVICE_LOGS_RETENTION_HOURS):
+    """Roll every partition older than the retention period into device_log_aggregates, then drop it."""
+    if retention_hours <= 0:
+        return []
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=retention_hours)
+    dropped = []
+    with engine.connect() as conn:
+        partitions = list_partitions(conn)
+    for name, lower, upper in partitions:
+        if upper > cutoff:
+            continue
+        # one transaction per partition: the aggregate rows and the drop commit together
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO device_log_aggregates "
+                "(bucket_start, bucket_end, device_type, mode, status_code, request_count, "
+                " latency_sum, latency_count, latency_min, latency_max, payload_sum) "
+                "SELECT :lower, :upper, device_type, mode, status_code, count(*), "
+                "       sum(response_time), count(response_time), min(response_time), max(response_time), sum(payload_size) "
+                f"FROM {name} GROUP BY device_type, mode, status_code"
+            ), {"lower": lower, "upper": upper})
+            conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+        print(f"[Partitions] Rolled up and dropped {name}")
+    return dropped
+
+
+def run_maintenance(engine: Engine = default_engine, now=None):
+    created = ensure_partitions(engine, now=now)
+    dropped = apply_retention(engine, now=now)
+    return created, dropped
+
+
+class PartitionMaintainer:
+    """Background thread running run_maintenance every PARTITION_MAINTENANCE_INTERVAL seconds."""
+
+    def __init__(self, engine: Engine = default_engine, interval=PARTITION_MAINTENANCE_INTERVAL):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                run_maintenance(self.engine)
+            except Exception as e:
+                print(f"[Partitions] Maintenance failed: {e}")
+            self._stop.wait(self.interval)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["maintain"]:
+        print("usage: python -m app.partitions maintain")
+        sys.exit(2)
+    if not partitioning_enabled():
+        print("[Partitions] DEVICE_LOGS_PARTITIONING is none; nothing to do")
+        sys.exit(0)
+    created, dropped = run_maintenance()
+    print(f"[Partitions] {len(created)} partitions ensured, {len(dropped)} dropped")
@@ -0,0 +1,197 @@
+#Seen-token store for replay detection.
+#Token uses are recorded in one bucket per 30-second window; expired buckets are dropped whole.
+import hashlib
+import logging
+import os
+import threading
+from app.tokens import current_window, TOKEN_SKEW_WINDOWS
+from app.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+REPLAY_STORE_MODE = os.getenv("REPLAY_STORE_MODE", "exact")                     # "exact" (sets) or "bloom"
+REPLAY_STORE_MAX_ENTRIES = int(os.getenv("REPLAY_STORE_MAX_ENTRIES", "2000000"))  # exact mode: hard ceiling over all live buckets
+REPLAY_BLOOM_BITS = int(os.getenv("REPLAY_BLOOM_BITS", str(1 << 24)))           # bloom mode: bits per window (2 MiB)
+REPLAY_BLOOM_HASHES = int(os.getenv("REPLAY_BLOOM_HASHES", "7"))
+# By default a token is single-use within its window: the key is (device_id, token). The token
+# does not cover the body, so a client-chosen field cannot be trusted to tell messages apart.
+# Only a message signed with X-Message-Signature (HMAC over token and body) adds this field to
+# the key, letting a device send several readings per window. Set to "" to ignore it even then.
+REPLAY_KEY_FIELD = os.getenv("REPLAY_KEY_FIELD", "timestamp")
+
+
+def replay_key(device_id, token, nonce=None) -> bytes:
+    data = f"{device_id}\x00{token}\x00{'' if nonce is None else nonce}"
+    return hashlib.blake2b(data.encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key: bytes):
+        # double hashing: two 64-bit halves of the key give all k positions
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: bytes):
+        return all(self._array[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: bytes):
+        for p in self._positions(key):
+            self._array[p >> 3] |= 1 << (p & 7)
+
+    def nbytes(self):
+        return len(self._array)
+
+
+class SeenTokenStore:
+    def __init__(self, mode=REPLAY_STORE_MODE, max_entries=REPLAY_STORE_MAX_ENTRIES,
+                 bloom_bits=REPLAY_BLOOM_BITS, bloom_hashes=REPLAY_BLOOM_HASHES,
+                 skew_windows=TOKEN_SKEW_WINDOWS):
+        if mode not in ("exact", "bloom"):
+            raise ValueError(f"Unknown replay store mode: {mode}")
+        self.mode = mode
+        self.max_entries = max_entries
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        # a token valid for window w can be presented until w + skew, i.e. up to 2*skew receive windows later
+        self.live_windows = 2 * skew_windows + 1
+        self._buckets = {}  # receive window -> set of 8-byte keys, or BloomFilter
+        self._entries = 0   # exact mode: keys across all live buckets
+        self._window = None  # window of the last expiry pass
+        self._lock = threading.Lock()
+
+        self.replays = 0
+        self.overflows = 0
+
+    def _expire(self, window):
+        if window == self._window:
+            return
+        self._window = window
+        oldest = window - self.live_windows + 1
+        for w in [w for w in self._buckets if w < oldest]:
+            bucket = self._buckets.pop(w)  # O(1) drop of the whole window
+            if self.mode == "exact":
+                self._entries -= len(bucket)
+
+    def _new_bucket(self):
+        return set() if self.mode == "exact" else BloomFilter(self.bloom_bits, self.bloom_hashes)
+
+    def check_and_record(self, device_id, token, nonce=None, now=None) -> bool:
+        """Record a token use. Returns True if the same use was already seen (a replay)."""
+        return self._check_and_record(replay_key(device_id, token, nonce), now, count=True)
+
+    def mark_used(self, device_id, token, now=None):
+        """Record the bare token as used without counting a replay (see message_nonce)."""
+        self._check_and_record(replay_key(device_id, token), now, count=False)
+
+    def _check_and_record(self, key, now, count):
+        if self.mode == "exact":
+            key = key[:8]  # 64-bit keys keep sets small; collisions are ~n^2/2^65
+        window = current_window(now)
+
+        with self._lock:
+            self._expire(window)
+            for w in range(window - self.live_windows + 1, window + 1):
+                bucket = self._buckets.get(w)
+                if bucket is not None and key in bucket:
+                    if count:
+                        self.replays += 1
+                    return True
+
+            bucket = self._buckets.get(window)
+            if bucket is None:
+                bucket = self._buckets[window] = self._new_bucket()
+            if self.mode == "exact":
+                if self._entries >= self.max_entries:
+                    # memory ceiling reached: stop recording rather than grow (fail open, counted)
+                    self.overflows += 1
+                    if self.overflows == 1 or self.overflows % 10000 == 0:
+                        logger.warning("Replay store full (%s entries); %s uses not recorded", self._entries, self.overflows)
+                    return False
+                bucket.add(key)
+                self._entries += 1
+            else:
+                bucket.add(key)
+            return False
+
+    def stats(self):
+        with self._lock:
+            if self.mode == "exact":
+                approx_bytes = self._entries * 80  # set slot + 8-byte key, see benchmarks/bench_replay_store.py
+            else:
+                approx_bytes = sum(b.nbytes() for b in self._buckets.values())
+            return {
+                "mode": self.mode,
+                "buckets": sorted(self._buckets),
+                "entries": self._entries if self.mode == "exact" else None,
+                "max_entries": self.max_entries if self.mode == "exact" else None,
+                "approx_bytes": approx_bytes,
+                "replays_detected": self.replays,
+                "overflows": self.overflows,
+            }
+
+
+class SharedSeenTokenStore:
+    """
+    SeenTokenStore backed by the shared-memory replay table (SHARED_STATE_ENABLED), so a
+    message replayed to a different worker than the one that saw it first is still caught.
+    """
+
+    def __init__(self, state, skew_windows=TOKEN_SKEW_WINDOWS):
+        self.state = state
+        self.live_windows = 2 * skew_windows + 1
+
+    def check_and_record(self, device_id, token, nonce=None, now=None) -> bool:
+        seen = self._check_and_record(device_id, token, nonce, now)
+        if seen is None:
+            # every slot of the key's bucket holds a live use: fail open, counted (like the exact store)
+            self.state.add("replay_overflows")
+            return False
+        if seen:
+            self.state.add("replays_detected")
+        return seen
+
+    def mark_used(self, device_id, token, now=None):
+        self._check_and_record(device_id, token, None, now)
+
+    def _check_and_record(self, device_id, token, nonce, now):
+        key = int.from_bytes(replay_key(device_id, token, nonce)[:8], "little") or 1  # 0 marks an empty slot
+        return self.state.replay_check_and_record(key, current_window(now), self.live_windows)
+
+    def stats(self):
+        return {
+            "mode": "shared",
+            "buckets": None,
+            "entries": None,
+            "max_entries": self.state.replay_slots,
+            "approx_bytes": self.state.replay_slots * 16,
+            "replays_detected": self.state.counter("replays_detected"),
+            "overflows": self.state.counter("replay_overflows"),
+        }
+
+
+def message_nonce(data: dict, signed: bool):
+    """Per-message part of the replay key: only for signed messages, whose body the attacker cannot change."""
+    return data.get(REPLAY_KEY_FIELD) if signed and REPLAY_KEY_FIELD else None
+
+
+def check_replay(store, device_id, token, data: dict, signed: bool) -> bool:
+    """
+    Record one use of a valid token; True if it is a replay. A signed message with a nonce is
+    keyed by it, and also marks the bare token as used: otherwise the token, once captured,
+    could be resent unsigned with any body in the same window.
+    """
+    nonce = message_nonce(data, signed)
+    if nonce is None:
+        return store.check_and_record(device_id, token)
+    store.mark_used(device_id, token)
+    return store.check_and_record(device_id, token, nonce)
+
+
+# Shared store instance (one table for all workers with SHARED_STATE_ENABLED)
+seen_tokens = SharedSeenTokenStore(shared_state) if shared_state is not None else SeenTokenStore()
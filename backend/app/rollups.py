@@ -0,0 +1,367 @@
+#Incrementally maintained metrics rollups.
+#The ingestion path updates per-mode totals in memory; a background thread adds them to the
+#metrics_rollups table, so /metrics/summary never has to scan device_logs.
+#Rebuild from raw logs with:  python -m app.rollups rebuild
+import math
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import DeviceLog, DeviceLogAggregate, MetricsRollup
+from app.shared_state import shared_state as default_shared_state, ROLLUP_INDEX
+
+METRICS_ROLLUPS_ENABLED = os.getenv("METRICS_ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_PERSIST_INTERVAL = float(os.getenv("ROLLUP_PERSIST_INTERVAL", "10"))  # seconds between table updates
+REBUILD_LOCK_KEY = 0x7A7A0006  # pg_advisory_xact_lock key: one worker at a time checks for and runs the first rebuild
+
+
+class ModeTotals:
+    __slots__ = ("count", "latency_sum", "latency_count", "status_409", "first_at", "last_at")
+
+    def __init__(self, count=0, latency_sum=0.0, latency_count=0, status_409=0, first_at=None, last_at=None):
+        self.count = count
+        self.latency_sum = latency_sum
+        self.latency_count = latency_count
+        self.status_409 = status_409
+        self.first_at = first_at
+        self.last_at = last_at
+
+    def add(self, response_time, status_code, created_at, count=1):
+        self.count += count
+        if response_time is not None:
+            self.latency_sum += response_time
+            self.latency_count += count
+        if status_code == 409:
+            self.status_409 += count
+        if self.first_at is None or created_at < self.first_at:
+            self.first_at = created_at
+        if self.last_at is None or created_at > self.last_at:
+            self.last_at = created_at
+
+    def merge(self, other):
+        self.count += other.count
+        self.latency_sum += other.latency_sum
+        self.latency_count += other.latency_count
+        self.status_409 += other.status_409
+        for ts in (other.first_at, other.last_at):
+            if ts is not None:
+                if self.first_at is None or ts < self.first_at:
+                    self.first_at = ts
+                if self.last_at is None or ts > self.last_at:
+                    self.last_at = ts
+
+
+EPOCH = datetime(1970, 1, 1)  # created_at is naive UTC
+
+
+def _to_shared(totals: ModeTotals):
+    return [totals.count, totals.latency_sum, totals.latency_count, totals.status_409,
+            (totals.first_at - EPOCH).total_seconds() if totals.first_at else math.nan,
+            (totals.last_at - EPOCH).total_seconds() if totals.last_at else math.nan]
+
+
+def _from_shared(values):
+    count, latency_sum, latency_count, status_409, first_at, last_at = values
+    return ModeTotals(int(count), latency_sum, int(latency_count), int(status_409),
+                      None if math.isnan(first_at) else EPOCH + timedelta(seconds=first_at),
+                      None if math.isnan(last_at) else EPOCH + timedelta(seconds=last_at))
+
+
+def _earliest(column, value):
+    return case((column.is_(None), value), (column > value, value), else_=column)
+
+
+def _latest(column, value):
+    return case((column.is_(None), value), (column < value, value), else_=column)
+
+
+class MetricsRollups:
+    def __init__(self, session_factory=SessionLocal, persist_interval=ROLLUP_PERSIST_INTERVAL, shared=None):
+        self.session_factory = session_factory
+        self.persist_interval = persist_interval
+        # With shared state the base and every worker's deltas live in shared memory, so all
+        # workers report the same totals; otherwise each worker has its own deltas.
+        self.shared = shared
+        self._base = {}   # mode -> ModeTotals, as last read from metrics_rollups
+        self._delta = {}  # mode -> ModeTotals, recorded here but not yet added to the table
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------------ ingestion side ------------------------
+
+    def record(self, log_data: dict):
+        mode = log_data.get("mode") or "unknown"
+        created_at = log_data.get("created_at") or datetime.utcnow()
+        if self.shared is not None:
+            self.shared.rollup_record(mode, log_data.get("response_time"), log_data.get("status_code"),
+                                      (created_at - EPOCH).total_seconds())
+            return
+        with self._lock:
+            totals = self._delta.get(mode)
+            if totals is None:
+                totals = self._delta[mode] = ModeTotals()
+            totals.add(log_data.get("response_time"), log_data.get("status_code"), created_at)
+
+    # ------------------------ read side ------------------------
+
+    def totals(self):
+        """Current per-mode totals (table snapshot + local unpersisted deltas)."""
+        if self.shared is not None:
+            return {mode: _from_shared(values) for mode, values in self.shared.rollup_totals().items() if values[0]}
+        with self._lock:
+            merged = {}
+            for source in (self._base, self._delta):
+                for mode, totals in source.items():
+                    merged.setdefault(mode, ModeTotals()).merge(totals)
+            return merged
+
+    def summary(self):
+        return summarize(self.totals())
+
+    # ------------------------ persistence ------------------------
+
+    def load(self, db: Session):
+        if self.shared is not None:
+            with self.shared.rollup_writer():  # not between another worker's take and its commit
+                return self._load_shared(db)
+        rows = db.query(MetricsRollup).all()
+        with self._lock:
+            self._base = {
+                row.mode: ModeTotals(row.request_count, row.latency_sum, row.latency_count,
+                                     row.status_409_count, row.first_at, row.last_at)
+                for row in rows
+            }
+        return len(rows)
+
+    def _load_shared(self, db: Session):
+        rows = db.query(MetricsRollup).all()
+        base = {}
+        for row in rows:
+            mode = row.mode if row.mode in ROLLUP_INDEX else "unknown"
+            base.setdefault(mode, ModeTotals()).merge(ModeTotals(
+                row.request_count, row.latency_sum, row.latency_count,
+                row.status_409_count, row.first_at, row.last_at))
+        self.shared.rollup_set_base({mode: _to_shared(t) for mode, t in base.items()})
+        return len(rows)
+
+    def persist(self):
+        """Add the local deltas to metrics_rollups (additive, so several workers can share the table)."""
+        if self.shared is not None:
+            self._persist_shared()
+            return
+        with self._lock:
+            delta, self._delta = self._delta, {}
+
+        db = self.session_factory()
+        try:
+            for mode, totals in delta.items():
+                self._apply_delta(db, mode, totals)
+            db.commit()
+            self.load(db)
+        except Exception as e:
+            db.rollback()
+            # keep the deltas for the next attempt
+            with self._lock:
+                for mode, totals in delta.items():
+                    self._delta.setdefault(mode, ModeTotals()).merge(totals)
+            print(f"[Rollups] Persist failed: {e}")
+        finally:
+            db.close()
+
+    def _persist_shared(self):
+        # takes every worker's deltas (the shared base already includes them), then writes them
+        with self.shared.rollup_writer():
+            taken = self.shared.rollup_take()
+            if taken:
+                self._write_taken(taken)
+
+    def _write_taken(self, taken):
+        db = self.session_factory()
+        try:
+            for mode, values in taken.items():
+                self._apply_delta(db, mode, _from_shared(values))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.shared.rollup_restore(taken)
+            print(f"[Rollups] Persist failed: {e}")
+        finally:
+            db.close()
+
+    def _apply_delta(self, db: Session, mode, totals):
+        t = MetricsRollup.__table__.c
+        stmt = (
+            update(MetricsRollup)
+            .where(MetricsRollup.mode == mode)
+            .values(
+                request_count=t.request_count + totals.count,
+                latency_sum=t.latency_sum + totals.latency_sum,
+                latency_count=t.latency_count + totals.latency_count,
+                status_409_count=t.status_409_count + totals.status_409,
+                first_at=_earliest(t.first_at, totals.first_at),
+                last_at=_latest(t.last_at, totals.last_at),
+            )
+        )
+        if db.execute(stmt).rowcount:
+            return
+        try:
+            with db.begin_nested():
+                db.add(MetricsRollup(
+                    mode=mode, request_count=totals.count, latency_sum=totals.latency_sum,
+                    latency_count=totals.latency_count, status_409_count=totals.status_409,
+                    first_at=totals.first_at, last_at=totals.last_at,
+                ))
+        except IntegrityError:
+            # another worker inserted the row first
+            db.execute(stmt)
+
+    def rebuild(self, db: Session):
+        """
+        Recompute metrics_rollups from the raw device_logs table (one full scan) plus the
+        aggregates of partitions already dropped by the retention job.
+        Run it while the gateway is stopped; live workers would add their deltas on top.
+        """
+        raw = (
+            db.query(
+                DeviceLog.mode.label("mode"),
+                func.count(DeviceLog.id).label("count"),
+                func.sum(DeviceLog.response_time).label("latency_sum"),
+                func.count(DeviceLog.response_time).label("latency_count"),
+                func.count(case((DeviceLog.status_code == 409, 1))).label("status_409"),
+                func.min(DeviceLog.created_at).label("first_at"),
+                func.max(DeviceLog.created_at).label("last_at"),
+            )
+            .group_by(DeviceLog.mode)
+            .all()
+        )
+        A = DeviceLogAggregate
+        archived = (
+            db.query(
+                A.mode.label("mode"),
+                func.sum(A.request_count).label("count"),
+                func.sum(A.latency_sum).label("latency_sum"),
+                func.sum(A.latency_count).label("latency_count"),
+                func.sum(case((A.status_code == 409, A.request_count), else_=0)).label("status_409"),
+                func.min(A.bucket_start).label("first_at"),
+                func.max(A.bucket_end).label("last_at"),
+            )
+            .group_by(A.mode)
+            .all()
+        )
+
+        totals = {}
+        for row in list(archived) + list(raw):
+            totals.setdefault(row.mode or "unknown", ModeTotals()).merge(ModeTotals(
+                int(row.count or 0), float(row.latency_sum or 0.0), int(row.latency_count or 0),
+                int(row.status_409 or 0), row.first_at, row.last_at,
+            ))
+
+        db.query(MetricsRollup).delete()
+        for mode, t in totals.items():
+            db.add(MetricsRollup(
+                mode=mode, request_count=t.count, latency_sum=t.latency_sum, latency_count=t.latency_count,
+                status_409_count=t.status_409, first_at=t.first_at, last_at=t.last_at,
+            ))
+        db.commit()
+        self.load(db)
+        return len(totals)
+
+    # ------------------------ lifecycle ------------------------
+
+    def start(self):
+        db = self.session_factory()
+        try:
+            if self.load(db) == 0:
+                self._rebuild_if_empty(db)
+        finally:
+            db.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollup-persister", daemon=True)
+        self._thread.start()
+
+    def _rebuild_if_empty(self, db: Session):
+        """
+        First run against an existing log table. Workers starting together serialize on an
+        advisory lock and re-check, so only the first one rebuilds; the others load its rows.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY})
+        try:
+            if db.query(MetricsRollup.mode).first() is None and db.query(DeviceLog.id).first() is not None:
+                self.rebuild(db)  # its commit releases the lock
+                return
+        except IntegrityError:
+            # no advisory lock (not PostgreSQL) and another worker inserted the rows first
+            pass
+        db.rollback()
+        self.load(db)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.persist_interval + 5)
+            self._thread = None
+        self.persist()
+
+    def _run(self):
+        while not self._stop.wait(self.persist_interval):
+            self.persist()
+
+
+def summarize(totals: dict):
+    """Shape per-mode totals like the original /metrics/summary response."""
+    mode_count_map = {}
+    latency_map = {}
+    total_logs = 0
+    first_log = None
+    last_log = None
+    for mode, t in totals.items():
+        mode_count_map[mode] = t.count
+        latency_map[mode] = float(round(t.latency_sum / t.latency_count, 6)) if t.latency_count else 0.0
+        total_logs += t.count
+        if t.first_at is not None and (first_log is None or t.first_at < first_log):
+            first_log = t.first_at
+        if t.last_at is not None and (last_log is None or t.last_at > last_log):
+            last_log = t.last_at
+
+    # only 409s in replay endpoint count as detected
+    replay = totals.get("replay")
+    replay_attempts = replay.status_409 if replay else 0
+    attack_detection_rate = round((replay_attempts / total_logs * 100), 2) if total_logs > 0 else 0.0
+
+    if first_log and last_log and first_log != last_log:
+        duration_secs = (last_log - first_log).total_seconds()
+    else:
+        duration_secs = 1.0  # avoid div-by-zero
+    throughput_rps = round(total_logs / duration_secs, 4) if duration_secs > 0 else 0.0
+
+    return {
+        "latencies": latency_map,
+        "requests": mode_count_map,
+        "attack_detection_rate": attack_detection_rate,
+        "replay_attempts": replay_attempts,
+        "total_logs": total_logs,
+        "throughput_rps": throughput_rps,
+        "window_seconds": duration_secs,
+    }
+
+
+# Shared rollup state (None when disabled -> summary falls back to SQL aggregation)
+metrics_rollups = MetricsRollups(shared=default_shared_state) if METRICS_ROLLUPS_ENABLED else None
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python -m app.rollups rebuild")
+        sys.exit(2)
+    session = SessionLocal()
+    try:
+        modes = MetricsRollups().rebuild(session)
+        print(f"[Rollups] Rebuilt metrics_rollups from device_logs ({modes} modes)")
+    finally:
+        session.close()
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from app.database import get_db
-from app.models import Device as DeviceModel  # Used to import the SQLAlchemy model for devices
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from app.database import get_db, run_db, SessionLocal
+from app import crud
+from app.device_cache import device_cache
+from app.device_events import notify_enabled, notify_device_changes
+import json
 import secrets
+import tempfile
 
 # Create a router for device management
 router = APIRouter()   
 
+BULK_CHUNK_SIZE = 1000   # bulk input is processed (and committed) this many items at a time
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+DEVICE_MODES = ("insecure", "secure", "replay")  # values of the device_mode enum
+
 
 # Schema for validating device data
 class Device(BaseModel):
@@ -18,32 +26,67 @@ class Device(BaseModel):
     class Config:
         orm_mode = True
             
+async def _announce(db, device_ids):
+    """Drop changed devices from this worker's cache, and from every other worker's when notifications are on."""
+    for device_id in device_ids:
+        device_cache.invalidate(device_id)
+    if device_ids and notify_enabled():
+        await run_db(db, notify_device_changes, device_ids)
+
+
+def _device_dict(device):
+    return {
+        "device_id": device.device_id,
+        "device_type": device.device_type,
+        "mode": device.mode,
+        "shared_secret": device.shared_secret,
+    }
+
 # Fetch all devices
 @router.get("/devices")
-async def get_devices(db: Session = Depends(get_db)):
-    """Fetch all registered devices."""
-    return db.query(DeviceModel).all()
+def get_devices():
+    """Fetch all registered devices (streamed as one JSON array, read in chunks)."""
+    def generate():
+        # own session: request dependencies are closed before the body finishes streaming
+        db = SessionLocal()
+        try:
+            chunk = []
+            first = True
+            for device in crud.iter_devices(db):
+                chunk.append(json.dumps(_device_dict(device)))
+                if len(chunk) == 1000:
+                    yield ("[" if first else ",") + ",".join(chunk)
+                    first = False
+                    chunk = []
+            yield ("[" if first else ",") + ",".join(chunk) + "]" if chunk else ("[]" if first else "]")
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+# Fetch one page of devices
+@router.get("/devices/page")
+async def get_devices_page(limit: int = Query(100, ge=1, le=5000), cursor: str = None, db = Depends(get_db)):
+    """Keyset-paginated devices ordered by device_id; pass next_cursor back as cursor."""
+    devices, next_cursor = await run_db(db, crud.get_devices_page, limit, cursor)
+    return {"items": [_device_dict(d) for d in devices], "next_cursor": next_cursor}
 
 # Add a new device
 @router.post("/devices")
-async def add_device(device: Device, db: Session = Depends(get_db)):
+async def add_device(device: Device, db = Depends(get_db)):
     """Add a new device."""
-    if db.query(DeviceModel).filter(DeviceModel.device_id == device.device_id).first():
+    if await run_db(db, crud.get_device, device.device_id):
         raise HTTPException(status_code=400, detail="Device ID already exists")
     
     shared_secret = secrets.token_hex(4)  # Generate a random shared secret
     
-    new_device = DeviceModel(
-        device_id=device.device_id,
-        device_type=device.device_type,
-        mode=device.mode,
-        shared_secret=shared_secret  # Assuming shared_secret is a field in DeviceModel
-    )
-    
-    
-    db.add(new_device)
-    db.commit()
-    db.refresh(new_device)
+    new_device = await run_db(db, crud.create_device, {
+        "device_id": device.device_id,
+        "device_type": device.device_type,
+        "mode": device.mode,
+        "shared_secret": shared_secret  # Assuming shared_secret is a field in DeviceModel
+    })
+    await _announce(db, [new_device.device_id])  # drop any negative entry for this ID
 
     return {
         "message": "Device added successfully",
@@ -55,13 +98,175 @@ async def add_device(device: Device, db: Session = Depends(get_db)):
         }
     }
 
+# ------------------------ bulk provisioning ------------------------
+
+def _is_ndjson(request: Request):
+    return request.headers.get("content-type", "").split(";")[0].strip() == NDJSON_MEDIA_TYPE
+
+
+async def _iter_ndjson_chunks(request: Request):
+    """Parse an NDJSON request body incrementally, yielding lists of up to BULK_CHUNK_SIZE values."""
+    chunk = []
+    pending = b""
+    async for data in request.stream():
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                chunk.append(line)
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if pending.strip():
+        chunk.append(pending)
+    if chunk:
+        yield chunk
+
+
+def _parse_line(line):
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+
+async def _provision(db, items):
+    """Validate items, then create the valid ones with one conflict query and one insert."""
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {"device_id": None, "status": "invalid", "detail": "Expected a device object"}
+            continue
+        try:
+            device = Device(**item)
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results[i] = {"device_id": item.get("device_id"), "status": "invalid", "detail": detail}
+            continue
+        if device.mode not in DEVICE_MODES:
+            results[i] = {"device_id": device.device_id, "status": "invalid", "detail": f"mode must be one of {', '.join(DEVICE_MODES)}"}
+            continue
+        valid.append((i, {"device_id": device.device_id, "device_type": device.device_type, "mode": device.mode}))
+
+    if valid:
+        created = await run_db(db, crud.create_devices_bulk, [d for _, d in valid])
+        for (i, _), result in zip(valid, created):
+            results[i] = result
+        # drop any negative entries
+        await _announce(db, [r["device_id"] for r in created if r["status"] == "created"])
+    return results
+
+
+async def _deprovision(db, items):
+    results = [None] * len(items)
+    ids = []
+    for i, item in enumerate(items):
+        device_id = item.get("device_id") if isinstance(item, dict) else item
+        if not isinstance(device_id, str):
+            results[i] = {"device_id": None, "status": "invalid", "detail": "Expected a device ID string"}
+            continue
+        ids.append((i, device_id))
+
+    if ids:
+        deleted = await run_db(db, crud.delete_devices_bulk, [d for _, d in ids])
+        for (i, _), result in zip(ids, deleted):
+            results[i] = result
+        await _announce(db, [r["device_id"] for r in deleted if r["status"] == "deleted"])
+    return results
+
+
+def _summarize(results):
+    summary = {}
+    for r in results:
+        summary[r["status"]] = summary.get(r["status"], 0) + 1
+    return summary
+
+
+async def _bulk_ndjson(request: Request, db, handler):
+    """
+    Process an NDJSON body chunk by chunk (one transaction per chunk) and answer with one
+    NDJSON result line per input line plus a final summary line. Results are spooled to a
+    temporary file so neither input nor output is held in memory.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode="w+")
+    summary = {}
+    async for lines in _iter_ndjson_chunks(request):
+        parsed = [_parse_line(line) for line in lines]
+        items = [item for item, error in parsed if error is None]
+        handled = iter(await handler(db, items))
+        for item, error in parsed:
+            result = {"device_id": None, "status": "invalid", "detail": error} if error else next(handled)
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+            spool.write(json.dumps(result) + "\n")
+    spool.write(json.dumps({"summary": summary}) + "\n")
+    spool.seek(0)
+
+    def generate():
+        try:
+            while True:
+                data = spool.read(64 * 1024)
+                if not data:
+                    break
+                yield data
+        finally:
+            spool.close()
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
+
+
+async def _json_list(request: Request):
+    try:
+        items = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array (or NDJSON with Content-Type: application/x-ndjson)")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    return items
+
+
+async def _bulk_json(request: Request, db, handler):
+    """
+    Process a JSON array body in chunks of BULK_CHUNK_SIZE items (one transaction per chunk),
+    as for NDJSON, so no statement exceeds the drivers' bind-parameter limits.
+    """
+    items = await _json_list(request)
+    results = []
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        results.extend(await handler(db, items[start:start + BULK_CHUNK_SIZE]))
+    return {"summary": _summarize(results), "results": results}
+
+
+# Add many devices
+@router.post("/devices/bulk")
+async def add_devices_bulk(request: Request, db = Depends(get_db)):
+    """
+    Provision devices in bulk: a JSON array of devices, or NDJSON
+    (Content-Type: application/x-ndjson) for batches too large to buffer.
+    """
+    if _is_ndjson(request):
+        return await _bulk_ndjson(request, db, _provision)
+    return await _bulk_json(request, db, _provision)
+
+
+# Delete many devices
+@router.delete("/devices/bulk")
+async def delete_devices_bulk(request: Request, db = Depends(get_db)):
+    """
+    Deprovision devices in bulk: a JSON array of device IDs, or NDJSON with one ID
+    (or {"device_id": ...}) per line.
+    """
+    if _is_ndjson(request):
+        return await _bulk_ndjson(request, db, _deprovision)
+    return await _bulk_json(request, db, _deprovision)
+
 # Delete a device
 @router.delete("/devices/{device_id}")
-async def delete_device(device_id: str, db: Session = Depends(get_db)):
+async def delete_device(device_id: str, db = Depends(get_db)):
     """ Delete a device from the database by its ID. """
-    device = db.query(DeviceModel).filter(DeviceModel.device_id == device_id).first()
+    device = await run_db(db, crud.get_device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    db.delete(device)
-    db.commit()
+    await run_db(db, crud.delete_device, device)
+    await _announce(db, [device_id])
     return {"message": f"Device {device_id} deleted successfully"}
@@ -0,0 +1,46 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import time
+
+router = APIRouter()
+
+
+class Readiness:
+    """Startup progress reported by /health/ready; the app lifespan marks each warm-up step."""
+
+    def __init__(self):
+        self.ready = False
+        self.started_at = time.time()
+        self.ready_at = None
+        self.steps = {}  # step -> result (count, or error text)
+
+    def mark(self, step, result):
+        self.steps[step] = result
+
+    def set_ready(self, ready=True):
+        self.ready = ready
+        if ready:
+            self.ready_at = time.time()
+
+    def status(self):
+        return {
+            "status": "ready" if self.ready else "starting",
+            "startup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": self.steps,
+        }
+
+
+# Shared readiness state
+readiness = Readiness()
+
+
+@router.get("/health/live")
+def liveness():
+    """The process is up and serving requests (it may still be warming up)."""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+def readiness_check():
+    """200 once the schema is checked and connections and caches are warm, 503 until then (and while shutting down)."""
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=readiness.status())
@@ -1,31 +1,102 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
 from app.database import get_db
-from app.crud import create_device_log
-from app.models import Device
-import hashlib
+from app.crud import create_device_log_async, create_device_logs_async
+from app.device_cache import device_cache, get_device
+from app.tokens import token_engine, verify_message_signature
+from app.replay_store import seen_tokens, check_replay
+from app.timing import timed, mark_parsed, response_time
+from app.admission import admission
+import json
+import math
+import orjson
+import os
 import time
 
 router = APIRouter()
 
-def generate_expected_token(device_id: str, shared_secret: str) -> str:
+LEGACY_BATCH_MAX_READINGS = int(os.getenv("LEGACY_BATCH_MAX_READINGS", "1000"))
+# Lean ingestion: orjson on the raw body, payload_size = body bytes, and a fixed ack instead of echoing the payload
+LEGACY_LEAN_INGESTION = os.getenv("LEGACY_LEAN_INGESTION", "false").lower() == "true"
+LEGACY_ACK = os.getenv("LEGACY_ACK", "json").lower()  # lean mode response: json = {"status":"ok"}, empty = 204
+
+ACK_BODY = b'{"status":"ok"}'
+
+
+async def read_payload(request: Request):
     """
-    Generate a time-based token valid for a 30-second window.
+    (data, payload_size) from the raw request body, read once.
+    Lean mode parses with orjson and sizes the payload by its byte length; otherwise the
+    stdlib parser is used and payload_size keeps its original len(str(data)) definition.
     """
-    current_time = int(time.time())
-    timestamp = current_time // 30  # Reduced from 300 to 30 for faster expiry
-    token_data = f"{device_id}{shared_secret}{timestamp}"
-    token = hashlib.sha256(token_data.encode()).hexdigest()[:16]
+    body = await request.body()
+    try:
+        data = orjson.loads(body) if LEGACY_LEAN_INGESTION else json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Body must be a JSON object")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Body must be a JSON object")
+    for field in ("device_id", "device_type"):
+        if not isinstance(data.get(field, ""), str):
+            raise HTTPException(status_code=422, detail=f"{field} must be a string")
+    return data, len(body) if LEGACY_LEAN_INGESTION else len(str(data))
+
+
+def ack(response: dict):
+    """The handler's full response, or in lean mode the fixed ack (or an empty 204)."""
+    if not LEGACY_LEAN_INGESTION:
+        return response
+    if LEGACY_ACK == "empty":
+        return Response(status_code=204)
+    return Response(ACK_BODY, media_type="application/json")
+
+
+def batch_ack(response: dict):
+    """Batch responses keep their counts in lean mode, just without the message text."""
+    if not LEGACY_LEAN_INGESTION:
+        return response
+    return Response(orjson.dumps({k: v for k, v in response.items() if k != "message"}), media_type="application/json")
 
-    print(f"[DEBUG] Device: {device_id}, Expected Token: {token}")
-    return token
+
+async def message_signed(request: Request, device, token, signature) -> bool:
+    """Whether the body carries a valid X-Message-Signature (see replay_store.message_nonce); a wrong one is a 403."""
+    if signature is None:
+        return False
+    if not verify_message_signature(device.shared_secret, token, await request.body(), signature):
+        raise HTTPException(status_code=403, detail="Invalid signature")
+    return True
+
+
+async def lookup(db, device_id):
+    with timed("device_lookup"):
+        return await get_device(db, device_id)
+
+
+def admit(device_id, mode, cost=1):
+    """
+    Per-device token bucket check, run before the handler's own work (including the device
+    lookup, so a flood of cache misses is rejected without database reads). The limit class is
+    the registered device_type if the device is cached, else "other"; the bucket is per device,
+    so once the lookup has cached the device its next request is classed by its type. The type
+    claimed in the payload is never used. Rejections are counted, not logged.
+    """
+    if admission is None:
+        return
+    with timed("admission"):
+        device = device_cache.peek(device_id)
+        retry_after = admission.admit(device_id, device.device_type if device is not None else None, mode, cost)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
 
 
 @router.post("/legacy/insecure")
-async def handle_insecure_request(data: dict, db: Session = Depends(get_db)):
+async def handle_insecure_request(payload = Depends(read_payload), db = Depends(get_db)):
     """
     Handle unauthenticated legacy device data (no token required).
     """
+    mark_parsed()
+    data, payload_size = payload
+    admit(data.get("device_id"), "insecure")
     start_time = time.time()
 
     log_data = {
@@ -33,86 +104,221 @@ async def handle_insecure_request(data: dict, db: Session = Depends(get_db)):
         "device_type": data.get("device_type"),
         "mode": "insecure",
         "status_code": 200,
-        "payload_size": len(str(data)),
-        "response_time": time.time() - start_time
+        "payload_size": payload_size,
+        "response_time": response_time(start_time)
     }
 
-    create_device_log(db, log_data)
-    return {"message": "Data received insecurely", "data": data}
+    await create_device_log_async(db, log_data)
+    return ack({"message": "Data received insecurely", "data": data})
 
 
 @router.post("/legacy/secure")
 async def handle_secure_request(
-    data: dict,
+    request: Request,
+    payload = Depends(read_payload),
     x_access_token: str = Header(None),
-    db: Session = Depends(get_db)
+    x_message_signature: str = Header(None),
+    db = Depends(get_db)
 ):
     """
     Handle authenticated requests with token validation.
     """
+    mark_parsed()
+    data, payload_size = payload
     start_time = time.time()
 
     device_id = data.get("device_id")
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    admit(device_id, "secure")
+    device = await lookup(db, device_id)
     if not device:
         raise HTTPException(status_code=403, detail="Unknown device")
 
-    expected_token = generate_expected_token(device_id, device.shared_secret)
-    if x_access_token != expected_token:
+    with timed("token_validation"):
+        valid = token_engine.validate(device_id, device.shared_secret, x_access_token)
+        signed = valid and await message_signed(request, device, x_access_token, x_message_signature)
+    if not valid:
         raise HTTPException(status_code=403, detail="Invalid token")
 
+    # Valid token, but this exact use was already seen in the window -> replayed message
+    with timed("replay_check"):
+        replayed = check_replay(seen_tokens, device_id, x_access_token, data, signed)
+    if replayed:
+        log_data = {
+            "device_id": device_id,
+            "device_type": data.get("device_type"),
+            "mode": "secure",
+            "status_code": 409,
+            "payload_size": payload_size,
+            "response_time": response_time(start_time)
+        }
+        await create_device_log_async(db, log_data)
+        raise HTTPException(status_code=409, detail="Replay attack detected")
+
     log_data = {
         "device_id": device_id,
         "device_type": data.get("device_type"),
         "mode": "secure",
         "status_code": 200,
-        "payload_size": len(str(data)),
-        "response_time": time.time() - start_time
+        "payload_size": payload_size,
+        "response_time": response_time(start_time)
     }
 
-    create_device_log(db, log_data)
-    return {"message": "Data received securely", "data": data}
+    await create_device_log_async(db, log_data)
+    return ack({"message": "Data received securely", "data": data})
 
 
 @router.post("/legacy/replay")
 async def handle_replay_attack(
-    data: dict,
+    request: Request,
+    payload = Depends(read_payload),
     x_access_token: str = Header(None),
-    db: Session = Depends(get_db)
+    x_message_signature: str = Header(None),
+    db = Depends(get_db)
 ):
     """
     Detect and log replay attacks (reused/expired tokens).
     """
+    mark_parsed()
+    data, payload_size = payload
     start_time = time.time()
 
     device_id = data.get("device_id")
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    admit(device_id, "replay")
+    device = await lookup(db, device_id)
     if not device:
         raise HTTPException(status_code=403, detail="Unknown device")
 
-    expected_token = generate_expected_token(device_id, device.shared_secret)
-
-    if x_access_token != expected_token:
+    # Expired token, or a valid token whose use was already seen in this window
+    with timed("token_validation"):
+        valid = token_engine.validate(device_id, device.shared_secret, x_access_token)
+        signed = valid and await message_signed(request, device, x_access_token, x_message_signature)
+    with timed("replay_check"):
+        replayed = not valid or check_replay(seen_tokens, device_id, x_access_token, data, signed)
+    if replayed:
         # Replay detected — log as failed
         log_data = {
             "device_id": device_id,
             "device_type": data.get("device_type"),
             "mode": "replay",
             "status_code": 409,
-            "payload_size": len(str(data)),
-            "response_time": time.time() - start_time
+            "payload_size": payload_size,
+            "response_time": response_time(start_time)
         }
-        create_device_log(db, log_data)
+        await create_device_log_async(db, log_data)
         raise HTTPException(status_code=409, detail="Replay attack detected")
 
-    # Token still valid (rare case)
+    # Token still valid and not seen before (rare case)
     log_data = {
         "device_id": device_id,
         "device_type": data.get("device_type"),
         "mode": "replay",
         "status_code": 200,
-        "payload_size": len(str(data)),
-        "response_time": time.time() - start_time
+        "payload_size": payload_size,
+        "response_time": response_time(start_time)
     }
-    create_device_log(db, log_data)
-    return {"message": "Replay attack logged", "data": data}
+    await create_device_log_async(db, log_data)
+    return ack({"message": "Replay attack logged", "data": data})
+
+
+# ------------------------ batched telemetry ------------------------
+# Gateways that aggregate readings send {"device_id", "device_type", "readings": [...]}.
+# Each reading is logged as its own row, exactly as if it had been posted on its own.
+
+def _batch_readings(batch: dict, size: int):
+    """The batch's readings as per-request payloads, with the payload_size of each."""
+    readings = batch.get("readings")
+    if not isinstance(readings, list) or not all(isinstance(r, dict) for r in readings):
+        raise HTTPException(status_code=422, detail="readings must be a list of objects")
+    if len(readings) > LEGACY_BATCH_MAX_READINGS:
+        raise HTTPException(status_code=413, detail=f"At most {LEGACY_BATCH_MAX_READINGS} readings per batch")
+    device_id = batch.get("device_id")
+    device_type = batch.get("device_type")
+    # the per-request payload each reading would have been sent as (the batch's device identity wins)
+    readings = [{**r, "device_id": device_id, "device_type": device_type} for r in readings]
+    if LEGACY_LEAN_INGESTION:
+        # body bytes shared out evenly: no per-reading re-serialization
+        share, extra = divmod(size, len(readings) or 1)
+        sizes = [share + (i < extra) for i in range(len(readings))]
+    else:
+        sizes = [len(str(data)) for data in readings]
+    return readings, sizes
+
+
+@router.post("/legacy/insecure/batch")
+async def handle_insecure_batch(payload = Depends(read_payload), db = Depends(get_db)):
+    """
+    Handle a batch of unauthenticated readings with one multi-row log insert.
+    """
+    mark_parsed()
+    start_time = time.time()
+    batch, size = payload
+    readings, sizes = _batch_readings(batch, size)
+    admit(batch.get("device_id"), "insecure", cost=len(readings))
+
+    elapsed = response_time(start_time)
+    rows = [{
+        "device_id": data.get("device_id"),
+        "device_type": data.get("device_type"),
+        "mode": "insecure",
+        "status_code": 200,
+        "payload_size": payload_size,
+        "response_time": elapsed
+    } for data, payload_size in zip(readings, sizes)]
+
+    await create_device_logs_async(db, rows)
+    return batch_ack({"message": "Batch received insecurely", "accepted": len(rows)})
+
+
+@router.post("/legacy/secure/batch")
+async def handle_secure_batch(
+    request: Request,
+    payload = Depends(read_payload),
+    x_access_token: str = Header(None),
+    x_message_signature: str = Header(None),
+    db = Depends(get_db)
+):
+    """
+    Handle a batch of authenticated readings: one device lookup and token check for the
+    whole batch, a replay check per reading when the batch is signed (else one for the batch),
+    and one multi-row log insert.
+    """
+    mark_parsed()
+    start_time = time.time()
+    batch, size = payload
+    readings, sizes = _batch_readings(batch, size)
+
+    device_id = batch.get("device_id")
+    admit(device_id, "secure", cost=len(readings))
+    device = await lookup(db, device_id)
+    if not device:
+        raise HTTPException(status_code=403, detail="Unknown device")
+
+    with timed("token_validation"):
+        valid = token_engine.validate(device_id, device.shared_secret, x_access_token)
+        signed = valid and await message_signed(request, device, x_access_token, x_message_signature)
+    if not valid:
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+    rows = []
+    replayed = []
+    with timed("replay_check"):
+        # unsigned: the batch is one use of the token; signed: each reading is keyed by its own nonce
+        batch_replay = not signed and seen_tokens.check_and_record(device_id, x_access_token)
+        for i, (data, payload_size) in enumerate(zip(readings, sizes)):
+            if signed:
+                replay = check_replay(seen_tokens, device_id, x_access_token, data, signed)
+            else:
+                replay = batch_replay
+            if replay:
+                replayed.append(i)
+            rows.append({
+                "device_id": device_id,
+                "device_type": data.get("device_type"),
+                "mode": "secure",
+                "status_code": 409 if replay else 200,
+                "payload_size": payload_size,
+                "response_time": response_time(start_time)
+            })
+
+    await create_device_logs_async(db, rows)
+    return batch_ack({"message": "Batch received securely", "accepted": len(rows) - len(replayed), "replayed": replayed})
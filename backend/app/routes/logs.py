@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.database import get_db, run_db, SessionLocal
+from app import crud
+import csv
+import io
+import json
+
+router = APIRouter()
+
+EXPORT_CHUNK_SIZE = 1000  # rows fetched from the server-side cursor per round-trip
+
+
+def _serialize(row):
+    data = dict(row)
+    if data.get("created_at") is not None:
+        data["created_at"] = data["created_at"].isoformat()
+    return data
+
+
+# Fetch one page of logs
+@router.get("/logs")
+async def get_logs(
+    limit: int = Query(100, ge=1, le=5000),
+    cursor: int = None,
+    mode: str = None,
+    device_id: str = None,
+    status_code: int = None,
+    db = Depends(get_db)
+):
+    """
+    Keyset-paginated device logs, oldest first.
+    Pass next_cursor from the previous response as cursor to continue.
+    """
+    rows, next_cursor = await run_db(db, crud.get_logs_page, limit, cursor, mode, device_id, status_code)
+    return {"items": [_serialize(r) for r in rows], "next_cursor": next_cursor}
+
+
+# Stream every matching log
+@router.get("/logs/export")
+def export_logs(format: str = "ndjson", mode: str = None, device_id: str = None, status_code: int = None):
+    """
+    Stream all matching logs as NDJSON or CSV straight from a server-side cursor.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    def generate():
+        # own session: request dependencies are closed before the body finishes streaming
+        db = SessionLocal()
+        try:
+            rows = crud.iter_logs(db, EXPORT_CHUNK_SIZE, mode, device_id, status_code)
+            if format == "ndjson":
+                lines = []
+                for row in rows:
+                    lines.append(json.dumps(_serialize(row)))
+                    if len(lines) == EXPORT_CHUNK_SIZE:
+                        yield "\n".join(lines) + "\n"
+                        lines = []
+                if lines:
+                    yield "\n".join(lines) + "\n"
+                return
+
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=crud.LOG_COLUMNS)
+            writer.writeheader()
+            for i, row in enumerate(rows, 1):
+                writer.writerow(_serialize(row))
+                if i % EXPORT_CHUNK_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            db.close()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f"attachment; filename=device_logs.{format}"}
+    return StreamingResponse(generate(), media_type=media_type, headers=headers)
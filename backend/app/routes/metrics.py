@@ -1,13 +1,32 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
-from app.database import get_db
+from starlette.concurrency import run_in_threadpool
+from app.database import get_db, run_db, SessionLocal
 from app.models import DeviceLog
+from app.log_buffer import log_buffer
+from app.device_cache import device_cache
+from app.replay_store import seen_tokens
+from app.admission import admission
+from app.shared_state import shared_state
+from app.device_events import device_listener
+from app.rollups import metrics_rollups
+from app.histograms import latency_histograms, WINDOWS
+from app.metrics_stream import MetricsBroadcaster
 
 router = APIRouter()
 
 @router.get("/metrics/summary")
-def get_metrics_summary(db: Session = Depends(get_db)):
+async def get_metrics_summary(db = Depends(get_db)):
+    # O(1): served from the incrementally maintained rollups
+    if metrics_rollups is not None:
+        return metrics_rollups.summary()
+    return await run_db(db, compute_metrics_summary)
+
+
+def compute_metrics_summary(db: Session):
+    """Full-table aggregation; only used when METRICS_ROLLUPS_ENABLED=false."""
     # ---------- per-mode aggregates ----------
     per_mode = (
         db.query(
@@ -61,3 +80,84 @@ def get_metrics_summary(db: Session = Depends(get_db)):
         "throughput_rps": throughput_rps,
         "window_seconds": duration_secs,
     }
+
+
+@router.get("/metrics/latency")
+def get_latency_percentiles(window: str = "5m", mode: str = None, status_code: int = None):
+    """p50/p90/p99/max response time per mode and status code over a sliding window (1m, 5m, 1h)."""
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+    return latency_histograms.report(window, mode=mode, status_code=status_code)
+
+
+@router.get("/metrics/ingestion")
+def get_ingestion_metrics():
+    """Queue depth and flush latency of the write-behind log buffer."""
+    if log_buffer is None:
+        return {"enabled": False}
+    return log_buffer.stats()
+
+
+@router.get("/metrics/device-cache")
+def get_device_cache_metrics():
+    """Hit/miss counters of the in-process device registry cache."""
+    return device_cache.stats()
+
+
+@router.get("/metrics/replay-store")
+def get_replay_store_metrics():
+    """Size and detections of the seen-token replay store."""
+    return seen_tokens.stats()
+
+
+@router.get("/metrics/admission")
+def get_admission_metrics():
+    """Admitted and rate-limited (429) requests per device_type and mode."""
+    if admission is None:
+        return {"enabled": False}
+    return admission.stats()
+
+
+@router.get("/metrics/shared-state")
+def get_shared_state_metrics():
+    """Workers attached to the shared-memory state, its host-wide counters, and device change notifications."""
+    stats = shared_state.stats() if shared_state is not None else {"enabled": False}
+    stats["device_notifications"] = device_listener.stats() if device_listener is not None else {"enabled": False}
+    return stats
+
+
+# ------------------------ live stream ------------------------
+
+async def current_summary():
+    """The /metrics/summary payload, computed once per tick for all stream clients."""
+    if metrics_rollups is not None:
+        return metrics_rollups.summary()
+    return await run_in_threadpool(_summary_from_db)
+
+
+def _summary_from_db():
+    db = SessionLocal()
+    try:
+        return compute_metrics_summary(db)
+    finally:
+        db.close()
+
+
+# Shared by every /metrics/stream client (started with the app)
+metrics_broadcaster = MetricsBroadcaster(current_summary)
+
+
+@router.get("/metrics/stream")
+async def stream_metrics():
+    """Server-Sent Events: the metrics summary plus deltas since the previous tick, pushed every METRICS_STREAM_INTERVAL."""
+    return StreamingResponse(
+        metrics_broadcaster.subscribe(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/metrics/stream/stats")
+def get_metrics_stream_stats():
+    """Connected stream clients and how many summaries were computed for them."""
+    return metrics_broadcaster.stats()
@@ -0,0 +1,49 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.timing import timing_metrics
+from app.log_buffer import log_buffer
+from app.device_cache import device_cache
+from app.replay_store import seen_tokens
+from app.admission import admission
+
+router = APIRouter()
+
+
+def _sample(lines, name, kind, help_text, value):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    lines.append(f"{name} {value}")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Request/stage timings and in-process gateway counters in Prometheus text format."""
+    lines = timing_metrics.render()
+
+    cache = device_cache.stats()
+    _sample(lines, "zta_device_cache_hits_total", "counter", "Device lookups served from the cache.", cache["hits"])
+    _sample(lines, "zta_device_cache_misses_total", "counter", "Device lookups that went to the database.", cache["misses"])
+    _sample(lines, "zta_device_cache_entries", "gauge", "Devices currently cached.", cache["size"])
+
+    replay = seen_tokens.stats()
+    _sample(lines, "zta_replays_detected_total", "counter", "Messages rejected as replays.", replay["replays_detected"])
+    _sample(lines, "zta_replay_store_overflows_total", "counter", "Token uses not recorded because the store was full.", replay["overflows"])
+
+    if admission is not None:
+        stats = admission.stats()
+        _sample(lines, "zta_admission_admitted_total", "counter", "Requests admitted by the per-device rate limiter.", stats["admitted"])
+        lines.append("# HELP zta_admission_rejected_total Requests rejected with 429 by the per-device rate limiter.")
+        lines.append("# TYPE zta_admission_rejected_total counter")
+        for row in stats["rejected"]:
+            lines.append(f'zta_admission_rejected_total{{device_type="{row["device_type"]}",mode="{row["mode"]}"}} {row["count"]}')
+        _sample(lines, "zta_admission_tracked_devices", "gauge", "Devices with rate limiter buckets.", stats["tracked_devices"])
+
+    if log_buffer is not None:
+        buffer = log_buffer.stats()
+        _sample(lines, "zta_log_buffer_queue_depth", "gauge", "Log rows waiting to be flushed.", buffer["queue_depth"])
+        _sample(lines, "zta_log_buffer_rejected_total", "counter", "Log rows rejected because the buffer was full.", buffer["rejected"])
+        _sample(lines, "zta_log_buffer_flushed_rows_total", "counter", "Log rows written by the flusher.", buffer["flushed_rows"])
+        _sample(lines, "zta_log_buffer_flush_errors_total", "counter", "Failed log buffer flushes.", buffer["flush_errors"])
+        _sample(lines, "zta_log_buffer_dropped_rows_total", "counter", "Log rows dropped after every flush retry failed.", buffer["dropped_rows"])
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
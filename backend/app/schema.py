@@ -0,0 +1,66 @@
+#Startup schema check.
+#Instead of running create_all on every import, startup inspects the database once: when every
+#table, column and device_logs index exists nothing else happens. Missing tables are created only
+#with DB_AUTO_CREATE_SCHEMA=true (the default); columns are never altered, a mismatch stops startup.
+import os
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from app.database import Base, engine as default_engine
+from app.partitions import partitioning_enabled, prepare_schema
+
+DB_AUTO_CREATE_SCHEMA = os.getenv("DB_AUTO_CREATE_SCHEMA", "true").lower() == "true"
+
+
+class SchemaError(RuntimeError):
+    """The database schema does not match the models and cannot be fixed automatically."""
+
+
+def schema_differences(engine: Engine = default_engine):
+    """(missing tables, {table: missing columns}, {table: missing indexes}) compared with the models."""
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    missing_tables = []
+    missing_columns = {}
+    missing_indexes = {}
+    for name, table in Base.metadata.tables.items():
+        if name not in existing:
+            missing_tables.append(name)
+            continue
+        columns = {c["name"] for c in inspector.get_columns(name)}
+        absent = [c.name for c in table.columns if c.name not in columns]
+        if absent:
+            missing_columns[name] = absent
+        indexes = {ix["name"] for ix in inspector.get_indexes(name)}
+        absent = [ix.name for ix in table.indexes if ix.name not in indexes]
+        if absent:
+            missing_indexes[name] = absent
+    return missing_tables, missing_columns, missing_indexes
+
+
+def ensure_schema(engine: Engine = default_engine, auto_create=DB_AUTO_CREATE_SCHEMA):
+    """Check the schema and create what is missing (if allowed). Returns the tables created."""
+    missing_tables, missing_columns, missing_indexes = schema_differences(engine)
+    if missing_columns:
+        detail = "; ".join(f"{t}: {', '.join(c)}" for t, c in missing_columns.items())
+        raise SchemaError(f"Columns missing from existing tables (migrate them by hand): {detail}")
+    if not missing_tables and not missing_indexes:
+        return []
+    if not auto_create:
+        raise SchemaError(
+            f"Schema incomplete (tables: {', '.join(missing_tables) or '-'}; "
+            f"indexes: {', '.join(i for ixs in missing_indexes.values() for i in ixs) or '-'}) "
+            "and DB_AUTO_CREATE_SCHEMA=false"
+        )
+
+    # With DEVICE_LOGS_PARTITIONING set, device_logs is created as a partitioned table first.
+    if partitioning_enabled():
+        prepare_schema(engine)
+    Base.metadata.create_all(bind=engine, tables=[Base.metadata.tables[t] for t in missing_tables])
+    # create_all only indexes new tables
+    for table, names in missing_indexes.items():
+        for index in Base.metadata.tables[table].indexes:
+            if index.name in names:
+                index.create(bind=engine)
+    if missing_tables:
+        print(f"[Schema] Created tables: {', '.join(missing_tables)}")
+    return missing_tables
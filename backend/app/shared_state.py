@@ -0,0 +1,353 @@
+#State shared by the gateway workers on one host (uvicorn --workers N), in a named shared-memory segment.
+#- Counters: one row per worker; a worker only writes its own row and readers sum the rows,
+#  so counting needs no cross-process lock.
+#- Replay table: open-addressing hash table of 64-bit keys stamped with their token window, in
+#  buckets of REPLAY_BUCKET slots. Expired slots are simply reused, so nothing has to sweep it.
+#- Rollups: per-mode base totals plus one delta row per worker (see app.rollups).
+#Cross-process locks are byte-range fcntl locks on a lock file, striped so unrelated updates do
+#not contend, each paired with a thread lock for the worker's own threads. POSIX hosts only.
+#The segment outlives the workers (replays stay detected across restarts); remove it with
+#  python -m app.shared_state reset        (with the gateway stopped)
+import atexit
+import math
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+SHARED_STATE_ENABLED = os.getenv("SHARED_STATE_ENABLED", "false").lower() == "true"
+SHARED_STATE_NAME = os.getenv("SHARED_STATE_NAME", "zta-gateway")
+SHARED_STATE_MAX_WORKERS = int(os.getenv("SHARED_STATE_MAX_WORKERS", "64"))
+SHARED_STATE_LOCK_STRIPES = int(os.getenv("SHARED_STATE_LOCK_STRIPES", "1024"))  # replay table locks
+SHARED_REPLAY_SLOTS = int(os.getenv("SHARED_REPLAY_SLOTS", str(1 << 22)))        # 16 bytes each (64 MiB)
+
+MAGIC = 0x5A54415354415445
+VERSION = 1
+COUNTERS = ("device_cache_hits", "device_cache_misses", "replays_detected", "replay_overflows")
+COUNTER_INDEX = {name: i for i, name in enumerate(COUNTERS)}
+ROLLUP_MODES = ("insecure", "secure", "replay", "unknown")
+ROLLUP_INDEX = {mode: i for i, mode in enumerate(ROLLUP_MODES)}
+ROLLUP_FIELDS = 6  # count, latency_sum, latency_count, status_409, first_at, last_at (epoch seconds, NaN = none)
+REPLAY_BUCKET = 16
+
+# lock stripes: registry, rollup base, rollup table writer, one per worker delta row, then the replay buckets
+REGISTRY_STRIPE = 0
+ROLLUP_STRIPE = 1
+ROLLUP_WRITER_STRIPE = 2
+ROW_STRIPE_BASE = 3
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _untrack(shm):
+    # Python < 3.13 registers every segment with the resource tracker, which would unlink it
+    # when this worker exits and leave the other workers on an orphaned copy.
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def lock_path(name=SHARED_STATE_NAME):
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"{name}.lock")
+
+
+class SharedState:
+    def __init__(self, name=SHARED_STATE_NAME, max_workers=SHARED_STATE_MAX_WORKERS,
+                 stripes=SHARED_STATE_LOCK_STRIPES, replay_slots=SHARED_REPLAY_SLOTS):
+        import fcntl  # POSIX only; imported here so the gateway still starts elsewhere when disabled
+        self._fcntl = fcntl
+        self.name = name
+        self.max_workers = max_workers
+        self.stripes = stripes
+        self.replay_buckets = max(1, -(-replay_slots // REPLAY_BUCKET))
+        self.replay_slots = self.replay_buckets * REPLAY_BUCKET
+        self._replay_stripe_base = ROW_STRIPE_BASE + max_workers
+        self._lock_fd = os.open(lock_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_locks = [threading.Lock() for _ in range(self._replay_stripe_base + stripes)]
+        self._row_lock = threading.Lock()  # this worker's counter row
+        self._pid = None
+        self._slot = None
+
+        self._header = (MAGIC, VERSION, max_workers, stripes, self.replay_slots, len(COUNTERS), len(ROLLUP_MODES), 0)
+        with self._hold(REGISTRY_STRIPE):
+            self.shm, created = self._open()
+            self._map()
+            if created:
+                self._initialize()
+        atexit.register(self.close)  # the views must go before SharedMemory's own cleanup
+        self.worker_slot()
+
+    # ------------------------ segment ------------------------
+
+    def _layout(self):
+        n_modes = len(ROLLUP_MODES)
+        return [
+            ("header_view", "q", len(self._header)),
+            ("pids", "q", self.max_workers),
+            ("counters", "q", self.max_workers * len(COUNTERS)),
+            ("rollup_base", "d", n_modes * ROLLUP_FIELDS),
+            ("rollup_delta", "d", self.max_workers * n_modes * ROLLUP_FIELDS),
+            ("replay_keys", "Q", self.replay_slots),
+            ("replay_stamps", "q", self.replay_slots),
+        ]
+
+    def _open(self):
+        size = sum(8 * n for _, _, n in self._layout())
+        try:
+            shm = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            shm = shared_memory.SharedMemory(self.name, create=True, size=size)  # zero-filled
+            _untrack(shm)
+            print(f"[SharedState] Created segment {self.name} ({size / 2**20:.1f} MiB)")
+            return shm, True
+        _untrack(shm)
+        header = shm.buf[:8 * len(self._header)].cast("q")
+        found = tuple(header)
+        header.release()
+        if found != self._header or shm.size < size:
+            shm.close()
+            raise RuntimeError(
+                f"Shared segment {self.name} has a different layout {found} than configured {self._header}; "
+                "stop every worker and run: python -m app.shared_state reset"
+            )
+        return shm, False
+
+    def _initialize(self):
+        for i, value in enumerate(self._header):
+            self._header_view[i] = value
+        for m in range(len(ROLLUP_MODES)):
+            self._rollup_base[m * ROLLUP_FIELDS + 4] = self._rollup_base[m * ROLLUP_FIELDS + 5] = math.nan
+
+    def _map(self):
+        offset = 0
+        for field, fmt, n in self._layout():
+            setattr(self, f"_{field}", self.shm.buf[offset:offset + 8 * n].cast(fmt))
+            offset += 8 * n
+
+    def close(self):
+        if self._lock_fd is None:
+            return
+        for field, _, _ in self._layout():
+            getattr(self, f"_{field}").release()
+        self.shm.close()
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    @contextmanager
+    def _hold(self, stripe):
+        with self._thread_locks[stripe]:
+            self._fcntl.lockf(self._lock_fd, self._fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                self._fcntl.lockf(self._lock_fd, self._fcntl.LOCK_UN, 1, stripe)
+
+    def worker_slot(self):
+        """This process's row, claimed on first use (again after a fork)."""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._hold(REGISTRY_STRIPE):
+                self._slot = self._claim(pid)
+            self._pid = pid
+        return self._slot
+
+    def _claim(self, pid):
+        pids = self._pids
+        for i in range(self.max_workers):
+            if pids[i] == pid:
+                return i
+        # a dead worker's row is taken over as is: its counts keep adding up
+        for i in range(self.max_workers):
+            if pids[i] == 0 or not _alive(pids[i]):
+                pids[i] = pid
+                return i
+        raise RuntimeError(f"All {self.max_workers} shared state worker slots are in use (SHARED_STATE_MAX_WORKERS)")
+
+    # ------------------------ counters ------------------------
+
+    def add(self, counter, n=1):
+        i = self.worker_slot() * len(COUNTERS) + COUNTER_INDEX[counter]
+        with self._row_lock:
+            self._counters[i] += n
+
+    def counter(self, counter):
+        """Sum over all workers, past and present."""
+        column = COUNTER_INDEX[counter]
+        return sum(self._counters[column::len(COUNTERS)])
+
+    # ------------------------ replay table ------------------------
+
+    def replay_check_and_record(self, key, window, live_windows):
+        """
+        True if `key` (64-bit, non-zero) was recorded within the last live_windows windows.
+        Otherwise records it and returns False, or None when its bucket has no free slot.
+        """
+        bucket = key % self.replay_buckets
+        lo = bucket * REPLAY_BUCKET
+        oldest = window - live_windows + 1
+        keys = self._replay_keys
+        stamps = self._replay_stamps
+        with self._hold(self._replay_stripe_base + bucket % self.stripes):
+            free = -1
+            for i in range(lo, lo + REPLAY_BUCKET):
+                k = keys[i]
+                if k == key and stamps[i] >= oldest:
+                    return True
+                if free < 0 and (k == 0 or stamps[i] < oldest):
+                    free = i
+            if free < 0:
+                return None
+            keys[free] = key
+            stamps[free] = window
+            return False
+
+    # ------------------------ rollups ------------------------
+
+    def rollup_record(self, mode, response_time, status_code, created_at):
+        """created_at in epoch seconds."""
+        slot = self.worker_slot()
+        m = ROLLUP_INDEX.get(mode, ROLLUP_INDEX["unknown"])
+        i = (slot * len(ROLLUP_MODES) + m) * ROLLUP_FIELDS
+        d = self._rollup_delta
+        with self._hold(ROW_STRIPE_BASE + slot):
+            d[i] += 1
+            if response_time is not None:
+                d[i + 1] += response_time
+                d[i + 2] += 1
+            if status_code == 409:
+                d[i + 3] += 1
+            if not d[i] > 1 or created_at < d[i + 4]:
+                d[i + 4] = created_at
+            if not d[i] > 1 or created_at > d[i + 5]:
+                d[i + 5] = created_at
+
+    def rollup_totals(self):
+        """{mode: [count, latency_sum, latency_count, status_409, first_at, last_at]}: base plus every worker's delta."""
+        with self._hold(ROLLUP_STRIPE):
+            totals = {mode: list(self._rollup_base[m * ROLLUP_FIELDS:(m + 1) * ROLLUP_FIELDS])
+                      for m, mode in enumerate(ROLLUP_MODES)}
+            for slot in range(self.max_workers):
+                for m, mode in enumerate(ROLLUP_MODES):
+                    i = (slot * len(ROLLUP_MODES) + m) * ROLLUP_FIELDS
+                    if self._rollup_delta[i]:
+                        _merge(totals[mode], self._rollup_delta[i:i + ROLLUP_FIELDS])
+        return totals
+
+    def rollup_writer(self):
+        """Held from rollup_take until the taken totals are committed, and while loading the base from the table."""
+        return self._hold(ROLLUP_WRITER_STRIPE)
+
+    def rollup_take(self):
+        """Move every worker's delta into the base; returns the moved totals for writing to the table."""
+        taken = {mode: [0.0] * 4 + [math.nan, math.nan] for mode in ROLLUP_MODES}
+        d = self._rollup_delta
+        with self._hold(ROLLUP_STRIPE):
+            for slot in range(self.max_workers):
+                with self._hold(ROW_STRIPE_BASE + slot):
+                    for m, mode in enumerate(ROLLUP_MODES):
+                        i = (slot * len(ROLLUP_MODES) + m) * ROLLUP_FIELDS
+                        if d[i]:
+                            _merge(taken[mode], d[i:i + ROLLUP_FIELDS])
+                            for f in range(ROLLUP_FIELDS):
+                                d[i + f] = 0.0
+            for m, mode in enumerate(ROLLUP_MODES):
+                if taken[mode][0]:
+                    base = list(self._rollup_base[m * ROLLUP_FIELDS:(m + 1) * ROLLUP_FIELDS])
+                    _merge(base, taken[mode])
+                    self._rollup_base[m * ROLLUP_FIELDS:(m + 1) * ROLLUP_FIELDS] = _pack(base)
+        return {mode: t for mode, t in taken.items() if t[0]}
+
+    def rollup_restore(self, taken):
+        """Undo rollup_take after a failed write: back out of the base, into this worker's delta row."""
+        slot = self.worker_slot()
+        with self._hold(ROLLUP_STRIPE):
+            for mode, t in taken.items():
+                m = ROLLUP_INDEX[mode]
+                for f in range(4):
+                    self._rollup_base[m * ROLLUP_FIELDS + f] -= t[f]
+                with self._hold(ROW_STRIPE_BASE + slot):
+                    i = (slot * len(ROLLUP_MODES) + m) * ROLLUP_FIELDS
+                    row = list(self._rollup_delta[i:i + ROLLUP_FIELDS])
+                    if not row[0]:
+                        row[4] = row[5] = math.nan
+                    _merge(row, t)
+                    self._rollup_delta[i:i + ROLLUP_FIELDS] = _pack(row)
+
+    def rollup_set_base(self, totals):
+        """Replace the base with the table's totals ({mode: [6 values]}); deltas are left alone."""
+        with self._hold(ROLLUP_STRIPE):
+            for m, mode in enumerate(ROLLUP_MODES):
+                values = totals.get(mode, [0.0] * 4 + [math.nan, math.nan])
+                self._rollup_base[m * ROLLUP_FIELDS:(m + 1) * ROLLUP_FIELDS] = _pack(values)
+
+    # ------------------------ reporting ------------------------
+
+    def stats(self):
+        with self._hold(REGISTRY_STRIPE):
+            workers = [pid for pid in self._pids if pid and _alive(pid)]
+        return {
+            "enabled": True,
+            "segment": self.name,
+            "size_bytes": self.shm.size,
+            "workers": workers,
+            "max_workers": self.max_workers,
+            "replay_slots": self.replay_slots,
+            "lock_stripes": self.stripes,
+            "counters": {name: self.counter(name) for name in COUNTERS},
+        }
+
+
+def _merge(into, values):
+    for f in range(4):
+        into[f] += values[f]
+    first, last = values[4], values[5]
+    if not math.isnan(first) and (math.isnan(into[4]) or first < into[4]):
+        into[4] = first
+    if not math.isnan(last) and (math.isnan(into[5]) or last > into[5]):
+        into[5] = last
+
+
+def _pack(values):
+    from array import array
+    return memoryview(array("d", values))
+
+
+def reset(name=SHARED_STATE_NAME):
+    try:
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        print(f"[SharedState] No segment named {name}")
+        return
+    shm.close()
+    shm.unlink()
+    try:
+        os.remove(lock_path(name))
+    except FileNotFoundError:
+        pass
+    print(f"[SharedState] Removed segment {name}")
+
+
+# Shared state (None when disabled -> every worker keeps its own)
+shared_state = SharedState() if SHARED_STATE_ENABLED else None
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["reset"]:
+        reset()
+    elif sys.argv[1:] == ["stats"]:
+        print(SharedState().stats())
+    else:
+        print("usage: python -m app.shared_state reset|stats")
+        sys.exit(2)
@@ -0,0 +1,185 @@
+#Server-side request timing.
+#TimingMiddleware times every request end to end; handlers mark their stages (request parse,
+#device lookup, token validation, replay check, log write) with timed(). Durations go into
+#in-process counters and fixed-bucket histograms, exposed in Prometheus text format at /metrics.
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Store the gateway-side latency from request arrival as DeviceLog.response_time. It is taken when
+# the row is built, so it stops short of the log write (that is the log_write stage).
+LOG_END_TO_END_LATENCY = os.getenv("LOG_END_TO_END_LATENCY", "false").lower() == "true"
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels); the last bucket is +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTiming:
+    __slots__ = ("start", "stages")
+
+    def __init__(self, start):
+        self.start = start  # perf_counter() when the request reached the gateway
+        self.stages = {}    # stage -> seconds
+
+
+_current = ContextVar("request_timing", default=None)
+
+
+@contextmanager
+def timed(stage):
+    """Add the duration of the with-block to the current request's `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _current.get()
+        if timing is not None:
+            timing.stages[stage] = timing.stages.get(stage, 0.0) + time.perf_counter() - start
+
+
+def mark_parsed():
+    """Call first thing in a handler: arrival -> here is routing, body parsing and dependencies."""
+    timing = _current.get()
+    if timing is not None:
+        timing.stages["parse"] = time.perf_counter() - timing.start
+
+
+def response_time(start_time):
+    """response_time for a log row: since the handler started, or since the request arrived."""
+    if LOG_END_TO_END_LATENCY:
+        timing = _current.get()
+        if timing is not None:
+            return time.perf_counter() - timing.start
+    return time.time() - start_time
+
+
+class TimingMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}   # (method, route, status) -> count
+        self._durations = {}  # (method, route) -> Histogram
+        self._stages = {}     # (route, stage) -> Histogram
+
+    def observe(self, method, route, status, total, stages):
+        with self._lock:
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            hist = self._durations.get((method, route))
+            if hist is None:
+                hist = self._durations[(method, route)] = Histogram()
+            hist.observe(total)
+            for stage, seconds in stages.items():
+                hist = self._stages.get((route, stage))
+                if hist is None:
+                    hist = self._stages[(route, stage)] = Histogram()
+                hist.observe(seconds)
+
+    def render(self):
+        with self._lock:
+            requests = sorted(self._requests.items())
+            durations = [(k, _copy(h)) for k, h in sorted(self._durations.items())]
+            stages = [(k, _copy(h)) for k, h in sorted(self._stages.items())]
+
+        lines = [
+            "# HELP zta_http_requests_total HTTP requests handled by the gateway.",
+            "# TYPE zta_http_requests_total counter",
+        ]
+        for (method, route, status), count in requests:
+            lines.append(f'zta_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP zta_http_request_duration_seconds Time from request arrival to the end of the response.",
+            "# TYPE zta_http_request_duration_seconds histogram",
+        ]
+        for (method, route), hist in durations:
+            lines += _histogram_lines("zta_http_request_duration_seconds", f'method="{method}",route="{route}"', hist)
+
+        lines += [
+            "# HELP zta_request_stage_duration_seconds Time spent in each stage of request handling.",
+            "# TYPE zta_request_stage_duration_seconds histogram",
+        ]
+        for (route, stage), hist in stages:
+            lines += _histogram_lines("zta_request_stage_duration_seconds", f'route="{route}",stage="{stage}"', hist)
+        return lines
+
+
+def _copy(hist):
+    copy = Histogram()
+    copy.counts = list(hist.counts)
+    copy.sum = hist.sum
+    copy.count = hist.count
+    return copy
+
+
+def _histogram_lines(name, labels, hist):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    lines.append(f"{name}_sum{{{labels}}} {hist.sum:.9f}")
+    lines.append(f"{name}_count{{{labels}}} {hist.count}")
+    return lines
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware (no per-request task or body wrapping, unlike BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = {}  # endpoint -> route path template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming(time.perf_counter())
+        token = _current.set(timing)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - timing.start
+            timing_metrics.observe(scope["method"], self._route(scope), status, total, timing.stages)
+
+    def _route(self, scope):
+        # label by route template, not raw path, so /devices/{device_id} stays one series
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            path = next((r.path for r in scope["app"].routes if getattr(r, "endpoint", None) is endpoint), "unmatched")
+            self._route_paths[endpoint] = path
+        return path
+
+
+# Shared timing metrics
+timing_metrics = TimingMetrics()
@@ -0,0 +1,136 @@
+#Time-window token engine for the legacy endpoints.
+#Each device's expected token is hashed once per 30-second window and then served from a table.
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_WINDOW = 30  # seconds, must match the simulator
+TOKEN_SKEW_WINDOWS = int(os.getenv("TOKEN_SKEW_WINDOWS", "0"))             # 0 = exact window, 1 = also accept +/-1 window
+TOKEN_LOG_SAMPLE_RATE = float(os.getenv("TOKEN_LOG_SAMPLE_RATE", "0.001"))  # fraction of validations logged at DEBUG
+TOKEN_PRECOMPUTE = os.getenv("TOKEN_PRECOMPUTE", "false").lower() == "true"  # fill the next window in the background
+
+
+def current_window(now=None) -> int:
+    if now is None:
+        now = time.time()
+    return int(now) // TOKEN_WINDOW
+
+
+def compute_token(device_id: str, shared_secret: str, window: int) -> str:
+    token_data = f"{device_id}{shared_secret}{window}"
+    return hashlib.sha256(token_data.encode()).hexdigest()[:16]
+
+
+def message_signature(shared_secret: str, token: str, body: bytes) -> str:
+    """X-Message-Signature: HMAC-SHA256 under the device secret over the token and the raw body."""
+    return hmac.new(shared_secret.encode(), token.encode() + b"\n" + body, hashlib.sha256).hexdigest()
+
+
+def verify_message_signature(shared_secret: str, token: str, body: bytes, signature) -> bool:
+    if not isinstance(signature, str) or not isinstance(token, str):
+        return False
+    try:
+        return hmac.compare_digest(message_signature(shared_secret, token, body), signature)
+    except TypeError:  # non-ASCII header value
+        return False
+
+
+def generate_expected_token(device_id: str, shared_secret: str) -> str:
+    """
+    Generate a time-based token valid for a 30-second window.
+    """
+    return compute_token(device_id, shared_secret, current_window())
+
+
+class TokenEngine:
+    def __init__(self, skew_windows=TOKEN_SKEW_WINDOWS, log_sample_rate=TOKEN_LOG_SAMPLE_RATE):
+        self.skew_windows = skew_windows
+        self.log_sample_rate = log_sample_rate
+        self._tables = {}  # window -> {device_id: (shared_secret, token)}
+        self._lock = threading.Lock()
+
+    def _table(self, window):
+        table = self._tables.get(window)
+        if table is None:
+            with self._lock:
+                table = self._tables.setdefault(window, {})
+                # keep only the windows that can still be accepted (plus the next one for precompute)
+                oldest = current_window() - self.skew_windows - 1
+                for w in [w for w in self._tables if w < oldest]:
+                    del self._tables[w]
+        return table
+
+    def expected(self, device_id: str, shared_secret: str, window: int) -> str:
+        table = self._table(window)
+        entry = table.get(device_id)
+        # the secret is part of the key so a re-provisioned device never gets a stale token
+        if entry is None or entry[0] != shared_secret:
+            entry = (shared_secret, compute_token(device_id, shared_secret, window))
+            table[device_id] = entry
+        return entry[1]
+
+    def validate(self, device_id: str, shared_secret: str, token) -> bool:
+        """Check a token against the current window (and +/- skew), in constant time."""
+        if not isinstance(token, str):
+            return False
+        window = current_window()
+        ok = False
+        try:
+            if self.skew_windows == 0:
+                ok = hmac.compare_digest(self.expected(device_id, shared_secret, window), token)
+            else:
+                # check every accepted window so timing does not reveal which one matched
+                for offset in range(-self.skew_windows, self.skew_windows + 1):
+                    if hmac.compare_digest(self.expected(device_id, shared_secret, window + offset), token):
+                        ok = True
+        except TypeError:  # non-ASCII header value
+            return False
+
+        if self.log_sample_rate and logger.isEnabledFor(logging.DEBUG) and random.random() < self.log_sample_rate:
+            logger.debug("Token check device=%s window=%s valid=%s", device_id, window, ok)
+        return ok
+
+    def precompute(self, devices, window=None):
+        """Fill the table for a window ahead of time; devices is an iterable of (device_id, shared_secret)."""
+        if window is None:
+            window = current_window()
+        count = 0
+        for device_id, shared_secret in devices:
+            self.expected(device_id, shared_secret, window)
+            count += 1
+        return count
+
+    def stats(self):
+        return {
+            "window": current_window(),
+            "skew_windows": self.skew_windows,
+            "tables": {w: len(t) for w, t in self._tables.items()},
+        }
+
+
+async def precompute_loop(engine: TokenEngine, get_devices, lead_seconds=2.0):
+    """
+    Background task: shortly before each window boundary, hash the next window's
+    tokens for get_devices() so the first request after the boundary is a table hit.
+    """
+    while True:
+        now = time.time()
+        next_window = current_window(now) + 1
+        await asyncio.sleep(max(0.0, next_window * TOKEN_WINDOW - now - lead_seconds))
+        try:
+            count = await asyncio.to_thread(engine.precompute, get_devices(), next_window)
+            logger.debug("Precomputed %s tokens for window %s", count, next_window)
+        except Exception:
+            logger.exception("Token precompute failed")
+        await asyncio.sleep(lead_seconds)
+
+
+# Shared engine instance
+token_engine = TokenEngine()
@@ -0,0 +1,287 @@
+#Benchmark: throughput and latency of the gateway endpoints, with the app running in-process.
+#Runs the FastAPI app on an ASGI transport against a throwaway SQLite file (or any DATABASE_URL,
+#e.g. a local Postgres) and reports requests/s and latency percentiles per endpoint as JSON.
+#Run from backend/:
+#  python -m benchmarks.bench_gateway --json results.json
+#  python -m benchmarks.bench_gateway --log-rows 10000,1000000,10000000 --database-url postgresql://...
+#  python -m benchmarks.bench_gateway --baseline results.json     (compare, exit 1 on regression)
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PERCENTILES = (50, 90, 99)
+DEVICE_TYPES = ("thermostat", "camera", "lock")
+SEED_CHUNK = 50000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="In-process gateway benchmark")
+    parser.add_argument("--database-url", help="default: a fresh SQLite file in a temp directory")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per legacy endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--devices", type=int, default=1000, help="devices registered (and listed)")
+    parser.add_argument("--log-rows", default="10000", help="comma-separated device_logs sizes for /metrics/summary")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against a saved results file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (0.10 = 10%%)")
+    return parser.parse_args()
+
+
+# ------------------------ measurement ------------------------
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def measure(client, make_request, requests, concurrency, expect=(200,)):
+    """Run `requests` calls of make_request(i) -> (method, url, kwargs) from `concurrency` workers."""
+    latencies = []
+    errors = 0
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i, errors
+        while next_i < requests:
+            i = next_i
+            next_i += 1
+            method, url, kwargs = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in expect:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "rps": round(requests / elapsed, 2),
+        **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES},
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "errors": errors,
+    }
+
+
+# ------------------------ data setup ------------------------
+
+def seed_devices(engine, Device, count):
+    """Register bench-0..bench-{count-1}; devices left by an earlier run against the same database are kept."""
+    from sqlalchemy import select
+    with engine.connect() as conn:
+        existing = set(conn.execute(select(Device.device_id).where(Device.device_id.like("bench-%"))).scalars())
+    rows = [{"device_id": f"bench-{i}", "device_type": DEVICE_TYPES[i % 3],
+             "mode": ("insecure", "secure", "replay")[i % 3], "shared_secret": f"secret{i:06d}"}
+            for i in range(count)]
+    missing = [row for row in rows if row["device_id"] not in existing]
+    if missing:
+        with engine.begin() as conn:
+            conn.execute(Device.__table__.insert(), missing)
+    return rows
+
+
+def seed_logs(engine, DeviceLog, start, stop, devices):
+    """Insert synthetic log rows start..stop-1 (timestamps spread over the last day)."""
+    base = datetime.utcnow() - timedelta(days=1)
+    modes = ("insecure", "secure", "replay")
+    for chunk_start in range(start, stop, SEED_CHUNK):
+        rows = []
+        for i in range(chunk_start, min(stop, chunk_start + SEED_CHUNK)):
+            mode = modes[i % 3]
+            rows.append({
+                "device_id": f"bench-{i % devices}", "device_type": DEVICE_TYPES[i % 3], "mode": mode,
+                "status_code": 409 if mode == "replay" and i % 2 else 200,
+                "response_time": 0.001 + (i % 100) / 10000, "payload_size": 180 + i % 40,
+                "created_at": base + timedelta(microseconds=i * 8),
+            })
+        with engine.begin() as conn:
+            conn.execute(DeviceLog.__table__.insert(), rows)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ------------------------ suite ------------------------
+
+def pin_token_window():
+    """
+    Hold the gateway's token window fixed for the rest of the run (like the tests' window
+    fixture), so a secure request whose token was minted just before a 30-second boundary is
+    not rejected with 403 just after it. Returns the window.
+    """
+    import app.replay_store
+    import app.tokens
+
+    real = app.tokens.current_window
+    window = real()
+
+    def pinned(now=None):
+        return window if now is None else real(now)
+
+    app.tokens.current_window = app.replay_store.current_window = pinned
+    return window
+
+
+async def run_suite(args):
+    import httpx
+    from sqlalchemy import func, select
+    import app.main as gateway
+    from app.database import engine, SessionLocal
+    from app.models import Device, DeviceLog
+    from app.tokens import compute_token, message_signature
+    from app.routes import metrics as metrics_routes
+
+    window = pin_token_window()
+
+    app = gateway.app
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+
+    async with app.router.lifespan_context(app):
+        devices = seed_devices(engine, Device, args.devices)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while (await client.get("/health/ready")).status_code != 200:
+                await asyncio.sleep(0.1)  # measure a warm gateway, as a load balancer would route to
+            n, c = args.requests, args.concurrency
+
+            def legacy(mode, token=None):
+                def make(i):
+                    d = devices[i % len(devices)]
+                    headers = {"Content-Type": "application/json"}
+                    payload = {"device_id": d["device_id"], "device_type": d["device_type"],
+                               "timestamp": f"bench-{mode}-{i}", "temperature": 21.5, "humidity": 40.0}
+                    body = json.dumps(payload).encode()
+                    if token == "current":
+                        # signed, so each device's several readings in one window are not replays
+                        headers["X-Access-Token"] = compute_token(d["device_id"], d["shared_secret"], window)
+                        headers["X-Message-Signature"] = message_signature(d["shared_secret"], headers["X-Access-Token"], body)
+                    elif token == "expired":
+                        headers["X-Access-Token"] = compute_token(d["device_id"], d["shared_secret"], window - 10)
+                    return "POST", f"/api/legacy/{mode}", {"content": body, "headers": headers}
+                return make
+
+            def batch(i):
+                d = devices[i % len(devices)]
+                readings = [{"timestamp": f"bench-batch-{i}-{j}", "temperature": 21.5} for j in range(100)]
+                return "POST", "/api/legacy/insecure/batch", {"json": {
+                    "device_id": d["device_id"], "device_type": d["device_type"], "readings": readings}}
+
+            print("[Bench] legacy endpoints")
+            results["legacy_insecure"] = await measure(client, legacy("insecure"), n, c)
+            results["legacy_secure"] = await measure(client, legacy("secure", "current"), n, c)
+            results["legacy_replay"] = await measure(client, legacy("replay", "expired"), n, c, expect=(409,))
+            results["legacy_insecure_batch_100"] = await measure(client, batch, max(1, n // 10), c)
+
+            print("[Bench] device listing")
+            list_requests = max(5, min(50, n // 40))
+            results["devices_list"] = await measure(client, lambda i: ("GET", "/api/devices", {}), list_requests, 4)
+            results["devices_page_100"] = await measure(
+                client, lambda i: ("GET", "/api/devices/page", {"params": {"limit": 100}}), n // 4, c)
+
+            with SessionLocal() as db:
+                have = db.execute(select(func.count(DeviceLog.id))).scalar()
+            for rows in sorted(int(r) for r in args.log_rows.split(",")):
+                if rows > have:
+                    print(f"[Bench] seeding device_logs to {rows} rows")
+                    seed_logs(engine, DeviceLog, have, rows, len(devices))
+                    have = rows
+                if gateway.metrics_rollups is not None:
+                    gateway.metrics_rollups.persist()  # so the rebuild doesn't count local deltas twice
+                    with SessionLocal() as db:
+                        gateway.metrics_rollups.rebuild(db)  # seeded rows bypass the ingestion path
+                summary = lambda i: ("GET", "/api/metrics/summary", {})
+                label = f"metrics_summary_{rows}"
+                results[f"{label}_rollups"] = await measure(client, summary, max(20, n // 4), c)
+                # the SQL fallback scans the table: fewer, sequential requests
+                saved, metrics_routes.metrics_rollups = metrics_routes.metrics_rollups, None
+                try:
+                    results[f"{label}_sql"] = await measure(client, summary, 5, 1)
+                finally:
+                    metrics_routes.metrics_rollups = saved
+
+    return results
+
+
+# ------------------------ reporting ------------------------
+
+def print_results(results):
+    print(f"\n{'benchmark':<38}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<38}{r['rps']:>10}{r['p50_ms']:>10}{r['p90_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline; returns the names of regressed benchmarks."""
+    regressions = []
+    print(f"\n{'benchmark':<38}{'req/s base':>12}{'now':>10}{'change':>9}{'p99 base':>10}{'now':>10}{'change':>9}")
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            print(f"{name:<38}{'(new)':>12}")
+            continue
+        rps_change = (r["rps"] - b["rps"]) / b["rps"] if b["rps"] else 0.0
+        p99_change = (r["p99_ms"] - b["p99_ms"]) / b["p99_ms"] if b["p99_ms"] else 0.0
+        regressed = rps_change < -tolerance or p99_change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<38}{b['rps']:>12}{r['rps']:>10}{rps_change:>+9.1%}{b['p99_ms']:>10}{r['p99_ms']:>10}"
+              f"{p99_change:>+9.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.mkdtemp(prefix="zta-bench-")
+        args.database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # must be set before app.database is imported
+    os.environ["DATABASE_URL"] = args.database_url
+
+    results = asyncio.run(run_suite(args))
+    print_results(results)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "database": args.database_url.split(":", 1)[0],
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "devices": args.devices,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[Bench] results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n[Bench] {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
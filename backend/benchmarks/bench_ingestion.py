@@ -0,0 +1,152 @@
+#Benchmark: CPU and bytes per legacy request, default ingestion vs LEGACY_LEAN_INGESTION.
+#Part 1 times only the per-request body work (parse, validate, payload_size, response encoding).
+#Part 2 runs the app in-process (ASGI transport, throwaway SQLite, write-behind log buffer) and
+#measures process CPU time and request/response bytes per request on /api/legacy/insecure.
+#Run from backend/:  python -m benchmarks.bench_ingestion --requests 5000
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+_dict_adapter = TypeAdapter(dict)  # FastAPI's validation of a `data: dict` body
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Lean ingestion benchmark")
+    parser.add_argument("--iterations", type=int, default=100000, help="codec loop iterations")
+    parser.add_argument("--requests", type=int, default=3000, help="in-process requests per mode")
+    parser.add_argument("--concurrency", type=int, default=8)
+    return parser.parse_args()
+
+
+def sample_payload(i=0):
+    """Shaped like a simulator thermostat reading."""
+    return {
+        "device_id": f"sim{i % 300}",
+        "device_type": "thermostat",
+        "temperature": 21.734512987,
+        "humidity": 44.12093412,
+        "timestamp": datetime(2025, 1, 1, 12, 0, i % 60, 123456).isoformat(),
+    }
+
+
+# ------------------------ part 1: body work only ------------------------
+
+def codec_default(body):
+    """What FastAPI and the handler did per request: parse, validate as dict, len(str()), echo the payload."""
+    data = json.loads(body)
+    data = _dict_adapter.validate_python(data)
+    size = len(str(data))
+    response = JSONResponse(jsonable_encoder({"message": "Data received insecurely", "data": data})).body
+    return size, response
+
+
+def codec_lean(body):
+    """read_payload + ack in lean mode."""
+    data = orjson.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError
+    return len(body), b'{"status":"ok"}'  # app.routes.legacy.ACK_BODY
+
+
+def time_codec(fn, body, iterations):
+    fn(body)  # imports, caches
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(body)
+    return (time.process_time() - start) / iterations
+
+
+# ------------------------ part 2: whole request in-process ------------------------
+
+def response_bytes(response):
+    """Status line, headers and body as sent on the wire (HTTP/1.1, no compression)."""
+    head = len(f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n") + 2
+    head += sum(len(k) + len(v) + 4 for k, v in response.headers.raw)
+    return head + len(response.content)
+
+
+async def run_mode(client, lean, ack, requests, concurrency):
+    import app.routes.legacy as legacy
+    legacy.LEGACY_LEAN_INGESTION = lean
+    legacy.LEGACY_ACK = ack
+    bodies = [json.dumps(sample_payload(i)).encode() for i in range(requests)]
+    sent = received = errors = 0
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i, sent, received, errors
+        while next_i < requests:
+            body = bodies[next_i]
+            next_i += 1
+            response = await client.post("/api/legacy/insecure", content=body,
+                                         headers={"Content-Type": "application/json"})
+            sent += len(body)
+            received += response_bytes(response)
+            errors += response.status_code not in (200, 204)
+
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return {
+        "cpu_us_per_request": round(cpu / requests * 1e6, 1),
+        "requests_per_sec": round(requests / wall, 1),
+        "request_body_bytes": round(sent / requests, 1),
+        "response_bytes": round(received / requests, 1),
+        "errors": errors,
+    }
+
+
+async def run_in_process(args):
+    import httpx
+    import app.main as gateway
+
+    app = gateway.app
+    results = {}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            while (await client.get("/health/ready")).status_code != 200:
+                await asyncio.sleep(0.1)
+            await run_mode(client, False, "json", 200, args.concurrency)  # warm-up
+            for name, lean, ack in (("default", False, "json"), ("lean_ack", True, "json"), ("lean_204", True, "empty")):
+                results[name] = await run_mode(client, lean, ack, args.requests, args.concurrency)
+    return results
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="zta-bench-")
+    # must be set before app.database is imported
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("LOG_BUFFER_ENABLED", "true")  # keep per-request database work out of the comparison
+
+    body = json.dumps(sample_payload()).encode()
+    default = time_codec(codec_default, body, args.iterations)
+    lean = time_codec(codec_lean, body, args.iterations)
+    print(f"[Bench] body work per request ({len(body)} byte payload, {args.iterations} iterations)")
+    print(f"  default: {default * 1e6:8.2f} us   response body {len(codec_default(body)[1])} bytes")
+    print(f"  lean:    {lean * 1e6:8.2f} us   response body {len(codec_lean(body)[1])} bytes")
+    print(f"  saved:   {(default - lean) * 1e6:8.2f} us ({1 - lean / default:.0%})")
+
+    results = asyncio.run(run_in_process(args))
+    base = results["default"]
+    print(f"\n[Bench] whole request in-process ({args.requests} requests, concurrency {args.concurrency})")
+    print(f"{'mode':<10}{'CPU us/req':>12}{'req/s':>10}{'req body B':>12}{'resp B':>9}{'CPU saved':>11}{'resp B saved':>14}{'errors':>8}")
+    for name, r in results.items():
+        cpu_saved = base["cpu_us_per_request"] - r["cpu_us_per_request"]
+        bytes_saved = base["response_bytes"] - r["response_bytes"]
+        print(f"{name:<10}{r['cpu_us_per_request']:>12}{r['requests_per_sec']:>10}{r['request_body_bytes']:>12}"
+              f"{r['response_bytes']:>9}{cpu_saved:>11.1f}{bytes_saved:>14.1f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
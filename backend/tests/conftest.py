@@ -0,0 +1,79 @@
+#Test setup: the app reads its settings when its modules are imported, so the environment is
+#fixed here first (a throwaway SQLite file, every optional subsystem off) and the backend
+#directory is put on sys.path so `app` imports from wherever pytest is started.
+import os
+import sys
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="zta-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "DB_ASYNC": "false",
+    "LOG_BUFFER_ENABLED": "false",
+    "ADMISSION_CONTROL_ENABLED": "false",
+    "SHARED_STATE_ENABLED": "false",
+    "DEVICE_CACHE_NOTIFY": "false",
+    "DEVICE_LOGS_PARTITIONING": "none",
+    "LEGACY_LEAN_INGESTION": "false",
+    "TOKEN_SKEW_WINDOWS": "0",
+    "TOKEN_PRECOMPUTE": "false",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def register_device(client):
+    """Register a device through the API; returns its record including the generated shared secret."""
+    def register(device_id, device_type="thermostat", mode="secure"):
+        response = client.post("/api/devices", json={"device_id": device_id, "device_type": device_type, "mode": mode})
+        assert response.status_code == 200, response.text
+        return response.json()["device"]
+    return register
+
+
+@pytest.fixture
+def window(monkeypatch):
+    """Pin the token window so a test cannot straddle a 30-second boundary; returns the window."""
+    import app.replay_store
+    import app.tokens
+
+    fixed = app.tokens.current_window()
+
+    def pinned(now=None):
+        return fixed if now is None else int(now) // app.tokens.TOKEN_WINDOW
+
+    monkeypatch.setattr(app.tokens, "current_window", pinned)
+    monkeypatch.setattr(app.replay_store, "current_window", pinned)
+    return fixed
+
+
+@pytest.fixture
+def postgres_engine():
+    """Engine on a scratch schema in TEST_POSTGRES_URL; PostgreSQL-only tests skip without it."""
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    from sqlalchemy import create_engine, text
+
+    schema = f"zta_test_{os.getpid()}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    yield engine
+    engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    admin.dispose()
@@ -0,0 +1,98 @@
+import pytest
+from app.admission import AdmissionController, parse_limits
+from app.device_cache import CachedDevice, device_cache
+
+
+def test_bucket_starts_full_and_refills_at_the_rate():
+    admission = AdmissionController(rate=1, burst=2, limits="")
+    assert admission.admit("dev-1", "thermostat", "secure", now=100.0) == 0.0
+    assert admission.admit("dev-1", "thermostat", "secure", now=100.0) == 0.0
+    assert admission.admit("dev-1", "thermostat", "secure", now=100.0) == pytest.approx(1.0)
+    assert admission.admit("dev-1", "thermostat", "secure", now=100.5) == pytest.approx(0.5)
+    assert admission.admit("dev-1", "thermostat", "secure", now=101.0) == 0.0
+
+
+def test_buckets_are_per_device_and_mode():
+    admission = AdmissionController(rate=1, burst=1, limits="")
+    assert admission.admit("dev-1", "camera", "secure", now=0.0) == 0.0
+    assert admission.admit("dev-1", "camera", "secure", now=0.0) > 0
+    assert admission.admit("dev-1", "camera", "insecure", now=0.0) == 0.0
+    assert admission.admit("dev-2", "camera", "secure", now=0.0) == 0.0
+
+
+def test_batch_cost_is_capped_at_the_burst():
+    admission = AdmissionController(rate=1, burst=5, limits="")
+    assert admission.admit("dev-1", "lock", "insecure", cost=50, now=0.0) == 0.0
+    assert admission.admit("dev-1", "lock", "insecure", cost=1, now=0.0) == pytest.approx(1.0)
+
+
+def test_wildcard_limits_most_specific_first():
+    admission = AdmissionController(rate=5, burst=20, limits="camera:*=10/40,*:replay=1/2,lock:secure=0")
+    assert admission.limit("camera", "secure") == (10.0, 40.0)
+    assert admission.limit("camera", "replay") == (10.0, 40.0)
+    assert admission.limit("thermostat", "replay") == (1.0, 2.0)
+    assert admission.limit("thermostat", "secure") == (5, 20)
+    # rate 0: unlimited
+    assert all(admission.admit("lock-1", "lock", "secure", now=0.0) == 0.0 for _ in range(100))
+
+
+def test_unknown_types_are_limited_as_other():
+    admission = AdmissionController(rate=1, burst=1, limits="lock:*=0")
+    assert admission.admit("dev-1", None, "insecure", now=0.0) == 0.0
+    assert admission.admit("dev-1", "fridge", "insecure", now=0.0) > 0
+    assert admission.stats()["rejected"] == [{"device_type": "other", "mode": "insecure", "count": 1}]
+
+
+def test_parse_limits_rejects_unknown_modes():
+    assert parse_limits("thermostat=2") == {("thermostat", "*"): (2.0, 2.0)}
+    with pytest.raises(ValueError):
+        parse_limits("camera:bogus=1/1")
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    import app.routes.legacy as legacy
+    controller = AdmissionController(rate=0.001, burst=2, limits="lock:*=0")
+    monkeypatch.setattr(legacy, "admission", controller)
+    return controller
+
+
+def test_rejected_request_gets_429_with_retry_after(client, limited):
+    payload = {"device_id": "flood-1", "device_type": "thermostat"}
+    statuses = [client.post("/api/legacy/insecure", json=payload).status_code for _ in range(2)]
+    assert statuses == [200, 200]
+    response = client.post("/api/legacy/insecure", json=payload)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_claimed_device_type_does_not_change_the_limit(client, limited, register_device):
+    register_device("claims-lock", device_type="camera", mode="insecure")
+    device_cache.put("claims-lock", CachedDevice("claims-lock", "camera", "insecure", "secret"))
+    payload = {"device_id": "claims-lock", "device_type": "lock"}  # lock is unlimited, camera is not
+    statuses = [client.post("/api/legacy/insecure", json=payload).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert {"device_type": "camera", "mode": "insecure", "count": 1} in limited.stats()["rejected"]
+
+
+def test_flood_of_cache_misses_is_rejected_before_the_device_lookup(client, limited, monkeypatch):
+    import app.routes.legacy as legacy
+    lookups = []
+
+    async def counting_get_device(db, device_id):
+        lookups.append(device_id)
+        return None
+
+    monkeypatch.setattr(legacy, "get_device", counting_get_device)
+    statuses = [client.post("/api/legacy/secure", json={"device_id": "ghost-1"},
+                            headers={"X-Access-Token": "0" * 16}).status_code for _ in range(4)]
+    assert statuses == [403, 403, 429, 429]
+    assert lookups == ["ghost-1", "ghost-1"]
+
+
+@pytest.mark.parametrize("payload", [
+    {"device_id": ["a"], "device_type": "lock"},
+    {"device_id": "dev-1", "device_type": {"type": "lock"}},
+])
+def test_non_string_identity_is_a_422(client, limited, payload):
+    assert client.post("/api/legacy/insecure", json=payload).status_code == 422
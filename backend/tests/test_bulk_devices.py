@@ -0,0 +1,71 @@
+import json
+import pytest
+from app import crud
+from app.device_cache import CachedDevice, device_cache
+from app.routes import device_management
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def devices(prefix, n, device_type="thermostat", mode="secure"):
+    return [{"device_id": f"{prefix}-{i}", "device_type": device_type, "mode": mode} for i in range(n)]
+
+
+def test_json_bulk_create_reports_each_item_in_order(client):
+    items = devices("bulk-a", 3) + [
+        {"device_id": "bulk-a-0", "device_type": "lock", "mode": "secure"},   # already created above
+        {"device_id": "bulk-a-x", "device_type": "lock", "mode": "sideways"},
+        {"device_type": "lock"},
+        "not an object",
+    ]
+    body = client.post("/api/devices/bulk", json=items).json()
+    assert [r["status"] for r in body["results"]] == ["created"] * 3 + ["conflict", "invalid", "invalid", "invalid"]
+    assert body["summary"] == {"created": 3, "conflict": 1, "invalid": 3}
+    assert len({r["shared_secret"] for r in body["results"][:3]}) == 3
+
+    listed = {d["device_id"]: d for d in client.get("/api/devices").json()}
+    assert listed["bulk-a-1"]["shared_secret"] == body["results"][1]["shared_secret"]
+    assert "bulk-a-x" not in listed
+
+
+def test_json_bulk_is_processed_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(device_management, "BULK_CHUNK_SIZE", 2)
+    sizes = []
+    real = crud.create_devices_bulk
+    monkeypatch.setattr(crud, "create_devices_bulk", lambda db, batch: sizes.append(len(batch)) or real(db, batch))
+
+    body = client.post("/api/devices/bulk", json=devices("bulk-b", 5)).json()
+    assert sizes == [2, 2, 1]
+    assert body["summary"] == {"created": 5}
+
+
+def test_ndjson_bulk_create_streams_results_and_a_summary(client, monkeypatch):
+    monkeypatch.setattr(device_management, "BULK_CHUNK_SIZE", 2)
+    lines = [json.dumps(d) for d in devices("bulk-c", 3)] + ["{not json", "", json.dumps(devices("bulk-c", 1)[0])]
+    response = client.post("/api/devices/bulk", content="\n".join(lines), headers=NDJSON)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    out = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["status"] for r in out[:-1]] == ["created"] * 3 + ["invalid", "conflict"]
+    assert out[-1] == {"summary": {"created": 3, "invalid": 1, "conflict": 1}}
+
+
+def test_bulk_delete_accepts_ids_or_objects_and_invalidates_the_cache(client):
+    client.post("/api/devices/bulk", json=devices("bulk-d", 3))
+    device_cache.put("bulk-d-0", CachedDevice("bulk-d-0", "thermostat", "secure", "secret"))
+
+    body = client.request("DELETE", "/api/devices/bulk",
+                          json=["bulk-d-0", {"device_id": "bulk-d-1"}, "bulk-d-missing", 42]).json()
+    assert [r["status"] for r in body["results"]] == ["deleted", "deleted", "not_found", "invalid"]
+    assert device_cache.get("bulk-d-0") == (False, None)
+
+    response = client.request("DELETE", "/api/devices/bulk", content="bulk-d-2\n", headers=NDJSON)
+    assert response.text.splitlines()[-1] == json.dumps({"summary": {"invalid": 1}})  # a bare ID is not JSON
+    response = client.request("DELETE", "/api/devices/bulk", content='"bulk-d-2"\n', headers=NDJSON)
+    assert json.loads(response.text.splitlines()[0])["status"] == "deleted"
+
+
+@pytest.mark.parametrize("body", ["{not json", json.dumps({"device_id": "x"})])
+def test_json_bulk_needs_an_array(client, body):
+    response = client.post("/api/devices/bulk", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
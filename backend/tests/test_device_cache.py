@@ -0,0 +1,89 @@
+import pytest
+from app import device_cache as device_cache_module
+from app.device_cache import CachedDevice, DeviceCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(device_cache_module.time, "monotonic", clock)
+    return clock
+
+
+def device(device_id):
+    return CachedDevice(device_id, "thermostat", "secure", "secret")
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = DeviceCache(ttl=300, negative_ttl=5)
+    assert cache.get("dev-1") == (False, None)
+    cache.put("dev-1", device("dev-1"))
+    assert cache.get("dev-1") == (True, device("dev-1"))
+
+    clock.now += 301
+    assert cache.get("dev-1") == (False, None)
+    assert cache.stats()["size"] == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_unknown_ids_are_cached_for_the_negative_ttl(clock):
+    cache = DeviceCache(ttl=300, negative_ttl=5)
+    cache.put("ghost", None)
+    assert cache.get("ghost") == (True, None)
+    clock.now += 6
+    assert cache.get("ghost") == (False, None)
+
+
+def test_invalidate_one_device_or_everything(clock):
+    cache = DeviceCache()
+    for device_id in ("dev-1", "dev-2", "dev-3"):
+        cache.put(device_id, device(device_id))
+
+    cache.invalidate("dev-1")
+    assert cache.get("dev-1") == (False, None)
+    assert cache.get("dev-2")[0] is True
+
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = DeviceCache(max_size=2)
+    cache.put("dev-1", device("dev-1"))
+    cache.put("dev-2", device("dev-2"))
+    cache.get("dev-1")
+    cache.put("dev-3", device("dev-3"))
+
+    assert cache.get("dev-2") == (False, None)
+    assert cache.get("dev-1")[0] is True
+    assert cache.stats()["evictions"] == 1
+
+
+def test_known_devices_lists_live_positive_entries(clock):
+    cache = DeviceCache(ttl=10)
+    cache.put("dev-1", device("dev-1"))
+    cache.put("ghost", None)
+    assert cache.known_devices() == [("dev-1", "secret")]
+    clock.now += 11
+    assert cache.known_devices() == []
+
+
+def test_deleted_device_is_rejected_right_away(client, register_device, window):
+    from app.tokens import compute_token
+
+    registered = register_device("short-lived")
+    token = compute_token("short-lived", registered["shared_secret"], window)
+    assert client.post("/api/legacy/secure", json={"device_id": "short-lived"},
+                       headers={"X-Access-Token": token}).status_code == 200
+
+    assert client.delete("/api/devices/short-lived").status_code == 200
+    assert client.post("/api/legacy/secure", json={"device_id": "short-lived"},
+                       headers={"X-Access-Token": token}).status_code == 403
@@ -0,0 +1,70 @@
+import random
+import pytest
+from app.histograms import HISTOGRAM_RELATIVE_ACCURACY, LatencyHistograms, LatencySketch
+
+NOW = 1_700_000_000.0
+
+
+def test_quantiles_stay_within_the_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(-5, 1) for _ in range(10000))
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.9, 0.99):
+        exact = values[round(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=HISTOGRAM_RELATIVE_ACCURACY * 1.01)
+    assert sketch.quantile(1.0) == values[-1]
+
+
+def test_merged_sketch_equals_one_sketch_of_everything():
+    a, b, both = LatencySketch(), LatencySketch(), LatencySketch()
+    for i in range(1, 200):
+        (a if i % 2 else b).add(i / 1000)
+        both.add(i / 1000)
+    a.merge(b)
+    assert (a.counts, a.count, a.max) == (both.counts, both.count, both.max)
+
+
+def test_empty_sketch_has_no_quantiles():
+    assert LatencySketch().quantile(0.5) is None
+
+
+def test_windows_only_merge_recent_slices():
+    histograms = LatencyHistograms()
+    histograms.record("secure", 200, 0.010, now=NOW - 3000)  # only inside 1h
+    histograms.record("secure", 200, 0.020, now=NOW - 120)   # inside 5m and 1h
+    histograms.record("secure", 200, 0.030, now=NOW - 5)     # inside every window
+    histograms.record("secure", 200, 0.040, now=NOW - 4000)  # aged out of the ring
+
+    counts = {w: histograms.report(w, now=NOW)["modes"]["secure"]["count"] for w in ("1m", "5m", "1h")}
+    assert counts == {"1m": 1, "5m": 2, "1h": 3}
+    assert histograms.report("1h", now=NOW)["modes"]["secure"]["max"] == 0.03
+
+
+def test_report_splits_by_status_and_filters():
+    histograms = LatencyHistograms()
+    histograms.record("replay", 409, 0.002, now=NOW)
+    histograms.record("replay", 403, 0.001, now=NOW)
+    histograms.record("secure", 200, 0.005, now=NOW)
+    histograms.record("secure", 200, None, now=NOW)  # rows without a latency are skipped
+
+    report = histograms.report("1m", now=NOW)
+    assert report["modes"]["replay"]["count"] == 2
+    assert [(s["mode"], s["status_code"]) for s in report["by_status"]] == [
+        ("replay", 403), ("replay", 409), ("secure", 200)]
+    assert report["modes"]["secure"]["count"] == 1
+
+    only_409 = histograms.report("1m", mode="replay", status_code=409, now=NOW)
+    assert [s["status_code"] for s in only_409["by_status"]] == [409]
+
+
+def test_latency_endpoint(client):
+    client.post("/api/legacy/insecure", json={"device_id": "hist-1", "device_type": "lock"})
+    response = client.get("/api/metrics/latency", params={"window": "1m", "mode": "insecure"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["window_seconds"] == 60
+    assert body["modes"]["insecure"]["count"] >= 1
+    assert client.get("/api/metrics/latency", params={"window": "2d"}).status_code == 400
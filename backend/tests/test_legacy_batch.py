@@ -0,0 +1,93 @@
+import json
+import pytest
+from app.routes.legacy import LEGACY_BATCH_MAX_READINGS
+from app.tokens import compute_token, message_signature
+
+
+def logs_for(client, device_id):
+    return client.get("/api/logs", params={"device_id": device_id, "limit": 5000}).json()["items"]
+
+
+def readings(n, prefix="r"):
+    return [{"timestamp": f"{prefix}-{i}", "temperature": 20 + i} for i in range(n)]
+
+
+def post_secure_batch(client, path, batch, token, secret=None):
+    body = json.dumps(batch).encode()
+    headers = {"Content-Type": "application/json", "X-Access-Token": token}
+    if secret is not None:
+        headers["X-Message-Signature"] = message_signature(secret, token, body)
+    return client.post(path, content=body, headers=headers)
+
+
+def test_insecure_batch_logs_one_row_per_reading(client):
+    batch = {"device_id": "gateway-1", "device_type": "thermostat", "readings": readings(5)}
+    response = client.post("/api/legacy/insecure/batch", json=batch)
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 5
+
+    rows = logs_for(client, "gateway-1")
+    assert len(rows) == 5
+    assert {(r["mode"], r["status_code"], r["device_type"]) for r in rows} == {("insecure", 200, "thermostat")}
+
+
+def test_readings_cannot_override_the_batch_identity(client):
+    batch = {"device_id": "gateway-2", "device_type": "camera",
+             "readings": [{"device_id": "someone-else", "device_type": "lock"}]}
+    assert client.post("/api/legacy/insecure/batch", json=batch).status_code == 200
+    assert [r["device_type"] for r in logs_for(client, "gateway-2")] == ["camera"]
+    assert logs_for(client, "someone-else") == []
+
+
+@pytest.mark.parametrize("batch, status", [
+    ({"device_id": "gateway-3", "readings": "not a list"}, 422),
+    ({"device_id": "gateway-3", "readings": [1, 2]}, 422),
+    ({"device_id": "gateway-3", "readings": readings(LEGACY_BATCH_MAX_READINGS + 1)}, 413),
+    ({"device_id": 3, "readings": []}, 422),
+])
+def test_malformed_batches_are_rejected(client, batch, status):
+    assert client.post("/api/legacy/insecure/batch", json=batch).status_code == status
+
+
+def test_signed_secure_batch_checks_each_reading(client, register_device, window):
+    device = register_device("batch-signed")
+    token = compute_token("batch-signed", device["shared_secret"], window)
+    batch = {"device_id": "batch-signed", "device_type": "thermostat", "readings": readings(3)}
+
+    first = post_secure_batch(client, "/api/legacy/secure/batch", batch, token, device["shared_secret"])
+    assert first.json() == {"message": "Batch received securely", "accepted": 3, "replayed": []}
+
+    # the same readings again, plus one new one
+    batch["readings"].append({"timestamp": "r-new"})
+    second = post_secure_batch(client, "/api/legacy/secure/batch", batch, token, device["shared_secret"])
+    assert second.json()["accepted"] == 1
+    assert second.json()["replayed"] == [0, 1, 2]
+
+    statuses = sorted(r["status_code"] for r in logs_for(client, "batch-signed"))
+    assert statuses == [200] * 4 + [409] * 3
+
+
+def test_unsigned_secure_batch_is_one_use_of_its_token(client, register_device, window):
+    device = register_device("batch-unsigned")
+    token = compute_token("batch-unsigned", device["shared_secret"], window)
+    batch = {"device_id": "batch-unsigned", "device_type": "thermostat", "readings": readings(2)}
+
+    assert post_secure_batch(client, "/api/legacy/secure/batch", batch, token).json()["accepted"] == 2
+    # new timestamps do not make a captured token reusable
+    batch["readings"] = readings(2, prefix="forged")
+    replay = post_secure_batch(client, "/api/legacy/secure/batch", batch, token).json()
+    assert replay["accepted"] == 0
+    assert replay["replayed"] == [0, 1]
+
+
+def test_secure_batch_rejects_bad_credentials(client, register_device, window):
+    device = register_device("batch-auth")
+    token = compute_token("batch-auth", device["shared_secret"], window)
+    batch = {"device_id": "batch-auth", "device_type": "thermostat", "readings": readings(2)}
+
+    assert post_secure_batch(client, "/api/legacy/secure/batch", batch, "0" * 16).status_code == 403
+    assert post_secure_batch(client, "/api/legacy/secure/batch", batch, token, "wrong-secret").status_code == 403
+    unknown = {**batch, "device_id": "not-registered"}
+    assert post_secure_batch(client, "/api/legacy/secure/batch", unknown, token).status_code == 403
+    assert logs_for(client, "batch-auth") == []
+
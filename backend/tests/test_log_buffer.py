@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.log_buffer import LogBufferFull, LogWriteBuffer
+from app.models import DeviceLog
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    Base.metadata.create_all(engine, tables=[DeviceLog.__table__])
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def row(i):
+    return {"device_id": f"dev-{i}", "device_type": "lock", "mode": "insecure", "status_code": 200,
+            "response_time": 0.001, "payload_size": 100}
+
+
+def count_rows(session_factory):
+    with session_factory() as db:
+        return db.execute(select(func.count(DeviceLog.id))).scalar()
+
+
+def test_flusher_writes_queued_rows_in_batches(session_factory):
+    buffer = LogWriteBuffer(session_factory=session_factory, batch_size=10, max_age=0.05)
+    buffer.start()
+    for i in range(25):
+        buffer.put(row(i))
+    buffer.stop()
+
+    assert count_rows(session_factory) == 25
+    stats = buffer.stats()
+    assert stats["enqueued"] == stats["flushed_rows"] == 25
+    assert stats["queue_depth"] == 0
+    assert stats["flush_count"] >= 3
+
+
+def test_rows_are_stamped_when_queued(session_factory):
+    buffer = LogWriteBuffer(session_factory=session_factory)
+    queued = buffer.put(row(0))
+    assert queued["created_at"] is not None
+    buffer.stop()
+    with session_factory() as db:
+        assert db.execute(select(DeviceLog.created_at)).scalar() == queued["created_at"]
+
+
+def test_full_buffer_rejects_after_the_put_timeout(session_factory):
+    buffer = LogWriteBuffer(session_factory=session_factory, queue_size=2, put_timeout=0.01)  # flusher not started
+    buffer.put(row(0))
+    buffer.put(row(1))
+    with pytest.raises(LogBufferFull):
+        buffer.put(row(2))
+    assert buffer.try_put(row(3)) is None
+    assert buffer.stats()["rejected"] == 1
+    assert buffer.stats()["queue_depth"] == 2
+
+
+class FlakySession:
+    """Fails the first `failures` inserts, then delegates to a real session."""
+
+    def __init__(self, factory, state):
+        self.db = factory()
+        self.state = state
+
+    def execute(self, *args):
+        if self.state["failures"] > 0:
+            self.state["failures"] -= 1
+            raise RuntimeError("database unavailable")
+        return self.db.execute(*args)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.close()
+
+
+def test_failed_flush_is_retried(session_factory):
+    state = {"failures": 2}
+    buffer = LogWriteBuffer(session_factory=lambda: FlakySession(session_factory, state),
+                            flush_retries=3, retry_backoff=0.001)
+    for i in range(4):
+        buffer.put(row(i))
+    buffer.stop()
+
+    assert count_rows(session_factory) == 4
+    stats = buffer.stats()
+    assert stats["flush_errors"] == 2
+    assert stats["flushed_rows"] == 4
+    assert stats["dropped_rows"] == 0
+
+
+def test_rows_are_dropped_and_counted_once_retries_run_out(session_factory):
+    state = {"failures": 100}
+    buffer = LogWriteBuffer(session_factory=lambda: FlakySession(session_factory, state),
+                            flush_retries=2, retry_backoff=0.001)
+    for i in range(4):
+        buffer.put(row(i))
+    buffer.stop()
+
+    assert count_rows(session_factory) == 0
+    stats = buffer.stats()
+    assert stats["flush_errors"] == 3
+    assert stats["dropped_rows"] == 4
+    assert stats["flushed_rows"] == 0
+
+
+def test_put_many_queues_all_rows_or_none(session_factory):
+    buffer = LogWriteBuffer(session_factory=session_factory, queue_size=5, put_timeout=0.01)
+    buffer.put_many([row(i) for i in range(3)])
+    with pytest.raises(LogBufferFull):
+        buffer.put_many([row(i) for i in range(3)])
+    assert buffer.stats()["queue_depth"] == 3
+    assert buffer.stats()["rejected"] == 3
+    buffer.put_many([row(i) for i in range(2)])
+    buffer.stop()
+    assert count_rows(session_factory) == 5
+
+
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from app.metrics_stream import MetricsBroadcaster, delta
+
+
+def summary(insecure=0, replay_attempts=0):
+    return {"requests": {"insecure": insecure}, "total_logs": insecure, "replay_attempts": replay_attempts}
+
+
+class Source:
+    """compute() for the broadcaster: returns the queued results in turn (raising exceptions)."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        result = self.results[0] if len(self.results) == 1 else self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def data(message):
+    lines = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+def test_every_subscriber_gets_the_same_single_computation():
+    async def scenario():
+        source = Source(summary(5))
+        broadcaster = MetricsBroadcaster(source, interval=60)
+        first, second = broadcaster.subscribe(), broadcaster.subscribe()
+        a = await first.__anext__()
+        b = await second.__anext__()
+        assert broadcaster.subscribers == 2
+        await first.aclose()
+        await second.aclose()
+        return source, broadcaster, a, b
+
+    source, broadcaster, a, b = asyncio.run(scenario())
+    assert a is b
+    assert source.calls == 1
+    assert data(a) == ("metrics", {"seq": 1, "interval": 60, "summary": summary(5), "delta": None})
+    assert broadcaster.subscribers == 0
+
+
+def test_new_events_only_when_the_summary_changes():
+    async def scenario():
+        source = Source(summary(5), summary(5), summary(8, replay_attempts=1))
+        broadcaster = MetricsBroadcaster(source, interval=0.01)
+        stream = broadcaster.subscribe()
+        await stream.__anext__()
+        broadcaster.start()
+        try:
+            second = await asyncio.wait_for(stream.__anext__(), 5)
+        finally:
+            await broadcaster.stop()
+            await stream.aclose()
+        return source, second
+
+    source, second = asyncio.run(scenario())
+    assert source.calls == 3  # the unchanged tick published nothing
+    event, payload = data(second)
+    assert payload["seq"] == 2
+    assert payload["delta"]["requests"] == {"insecure": 3}
+    assert payload["delta"]["replay_attempts"] == 1
+
+
+def test_failed_first_tick_keeps_the_subscriber_connected():
+    async def scenario():
+        source = Source(RuntimeError("database down"), summary(1))
+        broadcaster = MetricsBroadcaster(source, interval=0.01)
+        stream = broadcaster.subscribe()
+        first = await stream.__anext__()
+        broadcaster.start()
+        try:
+            second = await asyncio.wait_for(stream.__anext__(), 5)
+        finally:
+            await broadcaster.stop()
+            await stream.aclose()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.startswith("event: error\nretry: 10\n")
+    assert data(second)[0] == "metrics"
+
+
+def test_delta_rates_are_per_second_of_the_interval():
+    change = delta(summary(10), summary(30, replay_attempts=2), elapsed=2.0)
+    assert change["requests"] == {"insecure": 20}
+    assert change["throughput_rps"] == {"insecure": 10.0}
+    assert change["total_throughput_rps"] == 10.0
+    assert delta(None, summary(1), None) is None
+
+
+def test_stream_stats_endpoint(client):
+    stats = client.get("/api/metrics/stream/stats").json()
+    assert stats["subscribers"] == 0
+    assert set(stats) == {"subscribers", "ticks", "events", "interval"}
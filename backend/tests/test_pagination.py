@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+import uuid
+import pytest
+from app.routes import logs as logs_routes
+
+
+@pytest.fixture
+def logged(client):
+    """Seven insecure log rows for a fresh device ID; returns the ID."""
+    device_id = f"paged-logs-{uuid.uuid4().hex[:8]}"
+    for i in range(7):
+        client.post("/api/legacy/insecure", json={"device_id": device_id, "device_type": "lock", "n": i})
+    return device_id
+
+
+def test_log_pages_follow_the_cursor_without_gaps_or_repeats(client, logged):
+    ids = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"device_id": logged, "limit": 3}
+        if cursor is not None:
+            params["cursor"] = cursor
+        body = client.get("/api/logs", params=params).json()
+        ids += [row["id"] for row in body["items"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == 3
+    assert len(ids) == 7 and ids == sorted(set(ids))
+
+
+def test_log_filters_and_limits(client, logged):
+    rows = client.get("/api/logs", params={"device_id": logged, "mode": "insecure", "status_code": 200}).json()["items"]
+    assert len(rows) == 7
+    assert client.get("/api/logs", params={"device_id": logged, "mode": "secure"}).json() == {"items": [], "next_cursor": None}
+    assert client.get("/api/logs", params={"limit": 0}).status_code == 422
+    assert client.get("/api/logs", params={"limit": 5001}).status_code == 422
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 2])
+def test_ndjson_export_streams_every_matching_row(client, logged, monkeypatch, chunk_size):
+    monkeypatch.setattr(logs_routes, "EXPORT_CHUNK_SIZE", chunk_size)
+    response = client.get("/api/logs/export", params={"device_id": logged})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 7
+    assert {row["device_id"] for row in rows} == {logged}
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 2])
+def test_csv_export_has_one_header_and_every_row(client, logged, monkeypatch, chunk_size):
+    monkeypatch.setattr(logs_routes, "EXPORT_CHUNK_SIZE", chunk_size)
+    response = client.get("/api/logs/export", params={"device_id": logged, "format": "csv"})
+    assert response.headers["content-disposition"] == "attachment; filename=device_logs.csv"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 7
+    assert {row["mode"] for row in rows} == {"insecure"}
+
+
+def test_export_rejects_unknown_formats(client):
+    assert client.get("/api/logs/export", params={"format": "xml"}).status_code == 400
+
+
+def test_device_pages_and_full_listing_agree(client, register_device):
+    for i in range(5):
+        register_device(f"paged-dev-{i}")
+
+    listed = [d["device_id"] for d in client.get("/api/devices").json()]
+    paged = []
+    cursor = None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        body = client.get("/api/devices/page", params=params).json()
+        paged += [d["device_id"] for d in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert paged == sorted(listed)
+    assert [f"paged-dev-{i}" for i in range(5)] == [d for d in paged if d.startswith("paged-dev-")]
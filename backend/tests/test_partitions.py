@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from app import partitions
+from app.models import DeviceLogAggregate
+
+NOW = datetime(2025, 1, 1, 12, 30)
+
+
+@pytest.fixture
+def partitioned(postgres_engine, monkeypatch):
+    monkeypatch.setattr(partitions, "DEVICE_LOGS_PARTITIONING", "hourly")
+    partitions.prepare_schema(postgres_engine, now=NOW)
+    DeviceLogAggregate.__table__.create(postgres_engine)
+    return postgres_engine
+
+
+def insert_log(conn, created_at):
+    conn.execute(text("INSERT INTO device_logs (device_id, mode, status_code, created_at) "
+                      "VALUES ('dev-1', 'secure', 200, :created_at)"), {"created_at": created_at})
+
+
+def count(conn, table):
+    return conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+def test_rows_outside_every_range_go_to_the_default_partition(partitioned):
+    with partitioned.begin() as conn:
+        insert_log(conn, NOW)
+        insert_log(conn, NOW + timedelta(days=2))  # maintenance fell behind
+        assert count(conn, partitions.DEFAULT_PARTITION) == 1
+        assert [name for name, _, _ in partitions.list_partitions(conn)] == [
+            f"device_logs_p20250101{h}" for h in range(11, 16)]
+
+
+def test_maintenance_moves_default_rows_into_their_partitions(partitioned):
+    with partitioned.begin() as conn:
+        insert_log(conn, NOW + timedelta(days=2))
+        insert_log(conn, NOW + timedelta(days=2, minutes=10))
+        insert_log(conn, NOW - timedelta(days=5))
+
+    created = partitions.ensure_partitions(partitioned, now=NOW)
+    dropped = partitions.apply_retention(partitioned, now=NOW, retention_hours=48)
+    assert "device_logs_p2025010312" in created
+    # the old row got its own partition, which the retention pass then rolled up
+    assert dropped == ["device_logs_p2024122712"]
+    with partitioned.begin() as conn:
+        assert count(conn, partitions.DEFAULT_PARTITION) == 0
+        assert count(conn, "device_logs_p2025010312") == 2
+        assert count(conn, "device_log_aggregates") == 1
@@ -0,0 +1,100 @@
+import json
+import pytest
+from app.replay_store import SeenTokenStore, check_replay, message_nonce
+from app.tokens import TOKEN_WINDOW, compute_token, message_signature
+
+NOW = 1_700_000_010.0  # inside a window, well away from its edges
+
+
+@pytest.mark.parametrize("mode", ["exact", "bloom"])
+def test_second_use_of_a_token_is_a_replay(mode):
+    store = SeenTokenStore(mode=mode, bloom_bits=1 << 16)
+    assert store.check_and_record("dev-1", "token-a", now=NOW) is False
+    assert store.check_and_record("dev-1", "token-a", now=NOW + 1) is True
+    assert store.stats()["replays_detected"] == 1
+
+
+@pytest.mark.parametrize("mode", ["exact", "bloom"])
+def test_devices_tokens_and_nonces_are_kept_apart(mode):
+    store = SeenTokenStore(mode=mode, bloom_bits=1 << 16)
+    assert store.check_and_record("dev-1", "token-a", now=NOW) is False
+    assert store.check_and_record("dev-2", "token-a", now=NOW) is False
+    assert store.check_and_record("dev-1", "token-b", now=NOW) is False
+    assert store.check_and_record("dev-1", "token-a", "t1", now=NOW) is False
+    assert store.check_and_record("dev-1", "token-a", "t2", now=NOW) is False
+    assert store.check_and_record("dev-1", "token-a", "t2", now=NOW) is True
+
+
+@pytest.mark.parametrize("mode", ["exact", "bloom"])
+def test_window_rollover_drops_the_old_bucket(mode):
+    store = SeenTokenStore(mode=mode, bloom_bits=1 << 16, skew_windows=0)
+    store.check_and_record("dev-1", "token-a", now=NOW)
+    first = store.stats()["buckets"]
+
+    assert store.check_and_record("dev-1", "token-a", now=NOW + TOKEN_WINDOW) is False
+    buckets = store.stats()["buckets"]
+    assert len(buckets) == 1 and buckets != first
+    if mode == "exact":
+        assert store.stats()["entries"] == 1
+
+
+def test_skew_keeps_uses_for_every_window_a_token_can_be_presented_in():
+    store = SeenTokenStore(skew_windows=1)
+    store.check_and_record("dev-1", "token-a", now=NOW)
+    assert store.check_and_record("dev-1", "token-a", now=NOW + 2 * TOKEN_WINDOW) is True
+    assert store.check_and_record("dev-1", "token-b", now=NOW) is False
+    assert store.check_and_record("dev-1", "token-b", now=NOW + 3 * TOKEN_WINDOW) is False
+
+
+def test_exact_store_stops_recording_at_its_ceiling():
+    store = SeenTokenStore(mode="exact", max_entries=2)
+    for token in ("a", "b", "c"):
+        assert store.check_and_record("dev-1", token, now=NOW) is False
+    stats = store.stats()
+    assert stats["entries"] == 2
+    assert stats["overflows"] == 1
+    # the unrecorded use fails open
+    assert store.check_and_record("dev-1", "c", now=NOW) is False
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        SeenTokenStore(mode="fuzzy")
+
+
+def test_nonce_only_counts_for_signed_messages():
+    data = {"device_id": "dev-1", "timestamp": "2025-01-01T00:00:00"}
+    assert message_nonce(data, signed=False) is None
+    assert message_nonce(data, signed=True) == "2025-01-01T00:00:00"
+
+
+def test_signed_use_also_spends_the_bare_token():
+    store = SeenTokenStore()
+    data = {"timestamp": "t1"}
+    assert check_replay(store, "dev-1", "token-a", data, signed=True) is False
+    assert check_replay(store, "dev-1", "token-a", {"timestamp": "t2"}, signed=True) is False
+    assert check_replay(store, "dev-1", "token-a", data, signed=False) is True
+    assert store.stats()["replays_detected"] == 1
+
+
+def test_token_from_a_signed_message_cannot_be_resent_unsigned(client, register_device, window):
+    secret = register_device("signer")["shared_secret"]
+    token = compute_token("signer", secret, window)
+    body = json.dumps({"device_id": "signer", "timestamp": "2025-01-01T00:00:00"}).encode()
+    signed = {"X-Access-Token": token, "X-Message-Signature": message_signature(secret, token, body),
+              "Content-Type": "application/json"}
+    assert client.post("/api/legacy/secure", content=body, headers=signed).status_code == 200
+
+    forged = {"device_id": "signer", "temperature": 99}
+    assert client.post("/api/legacy/secure", json=forged, headers={"X-Access-Token": token}).status_code == 409
+
+
+def test_single_secure_message_token_is_single_use(client, register_device, window):
+    device = register_device("single-use")
+    token = compute_token("single-use", device["shared_secret"], window)
+    headers = {"X-Access-Token": token}
+
+    assert client.post("/api/legacy/secure", json={"device_id": "single-use", "timestamp": "t1"},
+                       headers=headers).status_code == 200
+    assert client.post("/api/legacy/replay", json={"device_id": "single-use", "timestamp": "t2"},
+                       headers=headers).status_code == 409
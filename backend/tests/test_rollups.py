@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app import crud
+from app.database import Base
+from app.log_buffer import LogWriteBuffer
+from app.models import DeviceLog, DeviceLogAggregate, MetricsRollup
+from app.rollups import MetricsRollups
+
+T0 = datetime(2025, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}")
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def log(mode, status_code=200, response_time=0.01, seconds=0):
+    return {"device_id": "dev-1", "device_type": "thermostat", "mode": mode, "status_code": status_code,
+            "response_time": response_time, "payload_size": 10, "created_at": T0 + timedelta(seconds=seconds)}
+
+
+def test_recorded_rows_are_summarized_and_persisted(session_factory):
+    rollups = MetricsRollups(session_factory=session_factory)
+    rollups.record(log("secure", response_time=0.01))
+    rollups.record(log("secure", response_time=0.03, seconds=10))
+    rollups.record(log("replay", status_code=409, seconds=5))
+
+    summary = rollups.summary()
+    assert summary["requests"] == {"secure": 2, "replay": 1}
+    assert summary["latencies"]["secure"] == pytest.approx(0.02)
+    assert summary["replay_attempts"] == 1
+    assert summary["window_seconds"] == 10.0
+
+    rollups.persist()
+    restarted = MetricsRollups(session_factory=session_factory)
+    with session_factory() as db:
+        assert restarted.load(db) == 2
+    assert restarted.summary() == summary
+
+
+def test_persist_adds_to_the_table(session_factory):
+    first, second = MetricsRollups(session_factory=session_factory), MetricsRollups(session_factory=session_factory)
+    first.record(log("insecure"))
+    second.record(log("insecure"))
+    second.record(log("insecure"))
+    first.persist()
+    second.persist()
+    with session_factory() as db:
+        assert db.get(MetricsRollup, "insecure").request_count == 3
+
+
+def test_rebuild_counts_raw_logs_and_archived_partitions(session_factory):
+    with session_factory() as db:
+        db.add_all([DeviceLog(**log("secure")), DeviceLog(**log("replay", status_code=409, seconds=60))])
+        db.add(DeviceLogAggregate(bucket_start=T0 - timedelta(days=1), bucket_end=T0 - timedelta(hours=23),
+                                  mode="replay", status_code=409, request_count=4,
+                                  latency_sum=0.4, latency_count=4))
+        db.commit()
+
+        rollups = MetricsRollups(session_factory=session_factory)
+        assert rollups.rebuild(db) == 2
+    summary = rollups.summary()
+    assert summary["requests"] == {"secure": 1, "replay": 5}
+    assert summary["replay_attempts"] == 5
+    assert summary["window_seconds"] == timedelta(days=1, minutes=1).total_seconds()
+
+
+def test_start_rebuilds_only_an_empty_table(session_factory):
+    with session_factory() as db:
+        db.add(DeviceLog(**log("secure")))
+        db.commit()
+
+    rollups = MetricsRollups(session_factory=session_factory, persist_interval=60)
+    rollups.start()
+    rollups.stop()
+    assert rollups.summary()["requests"] == {"secure": 1}
+
+    with session_factory() as db:
+        db.add(DeviceLog(**log("secure")))
+        db.commit()
+    restarted = MetricsRollups(session_factory=session_factory, persist_interval=60)
+    restarted.start()
+    restarted.stop()
+    assert restarted.summary()["requests"] == {"secure": 1}  # loaded, not rebuilt
+
+
+def test_start_loads_the_rows_of_a_worker_that_rebuilt_first(session_factory, monkeypatch):
+    with session_factory() as db:
+        db.add(DeviceLog(**log("secure")))
+        db.commit()
+    other = MetricsRollups(session_factory=session_factory)
+    rollups = MetricsRollups(session_factory=session_factory, persist_interval=60)
+
+    def race(db):
+        # the other worker commits its rebuild between our check and our insert
+        with session_factory() as other_db:
+            other.rebuild(other_db)
+        raise IntegrityError("INSERT INTO metrics_rollups", {}, Exception("duplicate key"))
+
+    monkeypatch.setattr(rollups, "rebuild", race)
+    rollups.start()
+    rollups.stop()
+    assert rollups.summary()["requests"] == {"secure": 1}
+
+
+class FailingSession:
+    def execute(self, *args):
+        raise RuntimeError("database unavailable")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_write_behind_rows_count_once_flushed(session_factory, monkeypatch):
+    rollups = MetricsRollups(session_factory=session_factory)
+    monkeypatch.setattr(crud, "metrics_rollups", rollups)
+
+    flushed = LogWriteBuffer(session_factory=session_factory, on_flush=crud.record_rollups)
+    monkeypatch.setattr(crud, "log_buffer", flushed)
+    crud.create_device_log(None, log("secure"))
+    assert rollups.summary()["total_logs"] == 0  # queued, not written yet
+    flushed.stop()
+    assert rollups.summary()["requests"] == {"secure": 1}
+
+    dropping = LogWriteBuffer(session_factory=FailingSession, flush_retries=0, on_flush=crud.record_rollups)
+    monkeypatch.setattr(crud, "log_buffer", dropping)
+    crud.create_device_logs(None, [log("secure"), log("secure")])
+    dropping.stop()
+    assert dropping.stats()["dropped_rows"] == 2
+    assert rollups.summary()["requests"] == {"secure": 1}
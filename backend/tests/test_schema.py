@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, inspect, text
+from app.database import Base
+from app.routes.health import readiness
+from app.schema import SchemaError, ensure_schema, schema_differences
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_empty_database_is_created_once(engine):
+    created = ensure_schema(engine, auto_create=True)
+    assert sorted(created) == sorted(Base.metadata.tables)
+    assert schema_differences(engine) == ([], {}, {})
+    assert ensure_schema(engine, auto_create=True) == []
+
+
+def test_missing_index_is_created_on_an_existing_table(engine):
+    ensure_schema(engine, auto_create=True)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_device_logs_mode_status_code"))
+    assert schema_differences(engine)[2] == {"device_logs": ["ix_device_logs_mode_status_code"]}
+
+    assert ensure_schema(engine, auto_create=True) == []
+    assert "ix_device_logs_mode_status_code" in {ix["name"] for ix in inspect(engine).get_indexes("device_logs")}
+
+
+def test_incomplete_schema_without_auto_create_stops_startup(engine):
+    with pytest.raises(SchemaError, match="DB_AUTO_CREATE_SCHEMA=false"):
+        ensure_schema(engine, auto_create=False)
+    assert inspect(engine).get_table_names() == []
+
+
+def test_missing_column_is_never_altered(engine):
+    # an old devices table without shared_secret
+    Table("devices", MetaData(), Column("device_id", String, primary_key=True),
+          Column("device_type", String), Column("mode", String)).create(engine)
+    assert schema_differences(engine)[1] == {"devices": ["shared_secret"]}
+    with pytest.raises(SchemaError, match="devices: shared_secret"):
+        ensure_schema(engine, auto_create=True)
+    assert inspect(engine).get_table_names() == ["devices"]
+
+
+def test_unrelated_tables_are_ignored(engine):
+    ensure_schema(engine, auto_create=True)
+    Table("notes", MetaData(), Column("id", Integer, primary_key=True)).create(engine)
+    assert schema_differences(engine) == ([], {}, {})
+
+
+def test_liveness_and_readiness(client):
+    assert client.get("/health/live").json() == {"status": "alive"}
+    ready = client.get("/health/ready")
+    assert ready.status_code == 200
+    assert ready.json()["status"] == "ready"
+    assert "schema" in ready.json()["steps"]
+
+    readiness.set_ready(False)  # as during shutdown
+    try:
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+        assert client.get("/health/live").status_code == 200
+    finally:
+        readiness.set_ready(True)
@@ -0,0 +1,131 @@
+import math
+import multiprocessing
+import os
+import time
+import uuid
+import pytest
+from sqlalchemy.orm import Session
+from app.device_cache import CachedDevice, DeviceCache
+from app.device_events import NOTIFY_PAYLOAD_MAX, DeviceChangeListener, _payloads, notify_device_changes
+from app.replay_store import SharedSeenTokenStore
+from app.shared_state import REPLAY_BUCKET, SharedState, reset
+
+SIZES = {"max_workers": 4, "stripes": 8, "replay_slots": 4 * REPLAY_BUCKET}
+
+
+@pytest.fixture
+def state():
+    name = f"zta-test-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    state = SharedState(name=name, **SIZES)
+    yield state
+    state.close()
+    reset(name)
+
+
+def other_worker(name):
+    # a separate process opening the same segment, as another uvicorn worker does
+    state = SharedState(name=name, **SIZES)
+    state.add("device_cache_hits", 5)
+    state.replay_check_and_record(99, window=10, live_windows=1)
+    state.rollup_record("secure", 0.5, 200, 1000.0)
+    state.close()
+
+
+def test_workers_share_counters_replays_and_rollups(state):
+    state.add("device_cache_hits", 2)
+    worker = multiprocessing.get_context("fork").Process(target=other_worker, args=(state.name,))
+    worker.start()
+    worker.join(10)
+    assert worker.exitcode == 0
+
+    assert state.counter("device_cache_hits") == 7
+    assert state.replay_check_and_record(99, window=10, live_windows=1) is True
+    assert state.rollup_totals()["secure"][:4] == [1, 0.5, 1, 0]
+    assert len([pid for pid in state._pids if pid]) == 2
+
+
+def test_replay_slots_expire_with_their_window(state):
+    assert state.replay_check_and_record(7, window=10, live_windows=2) is False
+    assert state.replay_check_and_record(7, window=11, live_windows=2) is True
+    assert state.replay_check_and_record(7, window=12, live_windows=2) is False  # expired, recorded again
+
+
+def test_full_bucket_fails_open(state):
+    buckets = state.replay_buckets
+    keys = [1 + k * buckets for k in range(REPLAY_BUCKET + 1)]  # all in bucket 1
+    assert all(state.replay_check_and_record(k, window=10, live_windows=1) is False for k in keys[:-1])
+    assert state.replay_check_and_record(keys[-1], window=10, live_windows=1) is None
+    # once the window has passed, the expired slots are reused
+    assert state.replay_check_and_record(keys[-1], window=11, live_windows=1) is False
+
+
+def test_shared_seen_token_store_counts_replays_and_overflows(state):
+    store = SharedSeenTokenStore(state, skew_windows=0)
+    store.mark_used("dev-1", "token-a", now=300.0)
+    assert store.check_and_record("dev-1", "token-a", now=301.0) is True
+    assert store.check_and_record("dev-1", "token-b", now=301.0) is False
+    stats = store.stats()
+    assert (stats["replays_detected"], stats["overflows"]) == (1, 0)
+
+
+def test_rollup_take_moves_deltas_into_the_base_and_restore_undoes_it(state):
+    state.rollup_record("replay", 0.2, 409, 2000.0)
+    state.rollup_record("replay", 0.4, 200, 1000.0)
+    before = state.rollup_totals()["replay"]
+    assert before == [2, pytest.approx(0.6), 2, 1, 1000.0, 2000.0]
+
+    taken = state.rollup_take()
+    assert list(taken) == ["replay"]
+    assert state.rollup_totals()["replay"] == before  # now all in the base
+    assert state.rollup_take() == {}
+
+    state.rollup_restore(taken)
+    assert state.rollup_totals()["replay"][:4] == [2, pytest.approx(0.6), 2, 1]
+    assert math.isnan(state.rollup_totals()["insecure"][4])
+
+
+def test_mismatched_layout_is_refused(state):
+    with pytest.raises(RuntimeError, match="different layout"):
+        SharedState(name=state.name, max_workers=8, stripes=8, replay_slots=4 * REPLAY_BUCKET)
+
+
+def test_notify_payloads_are_split_under_the_limit():
+    ids = [f"device-{i:06d}" for i in range(2000)]
+    payloads = list(_payloads(ids))
+    assert len(payloads) > 1
+    assert all(len(p.encode()) <= NOTIFY_PAYLOAD_MAX for p in payloads)
+    assert "\n".join(payloads).split("\n") == ids
+
+
+def cached(*device_ids):
+    cache = DeviceCache()
+    for device_id in device_ids:
+        cache.put(device_id, CachedDevice(device_id, "lock", "secure", "secret"))
+    return cache
+
+
+def test_listener_drops_notified_devices():
+    cache = cached("dev-1", "dev-2", "dev-3")
+    listener = DeviceChangeListener(cache, engine=None)
+    listener.apply("dev-1\ndev-3")
+    assert [d for d, _ in cache.known_devices()] == ["dev-2"]
+    listener.apply("*")
+    assert cache.known_devices() == []
+    assert listener.received == 2
+
+
+def test_notify_round_trip_through_postgres(postgres_engine):
+    cache = cached("dev-1", "dev-2")
+    listener = DeviceChangeListener(cache, engine=postgres_engine)
+    listener.start()
+    try:
+        deadline = time.monotonic() + 10
+        # the listener connects in the background: notify until it has heard one
+        while listener.received == 0 and time.monotonic() < deadline:
+            with Session(postgres_engine) as db:
+                notify_device_changes(db, ["dev-1"])
+            time.sleep(0.2)
+    finally:
+        listener.stop()
+    assert listener.received >= 1
+    assert [d for d, _ in cache.known_devices()] == ["dev-2"]
@@ -0,0 +1,76 @@
+import pytest
+from app import tokens
+from app.tokens import TOKEN_WINDOW, TokenEngine, compute_token, generate_expected_token
+
+NOW = 1_700_000_010.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Drive the token window from a settable time instead of the wall clock."""
+    clock = {"now": NOW}
+    monkeypatch.setattr(tokens.time, "time", lambda: clock["now"])
+    return clock
+
+
+def test_engine_accepts_only_the_current_windows_token(clock):
+    engine = TokenEngine(skew_windows=0)
+    window = tokens.current_window()
+    assert engine.validate("dev-1", "secret", compute_token("dev-1", "secret", window))
+    assert engine.validate("dev-1", "secret", generate_expected_token("dev-1", "secret"))
+    assert not engine.validate("dev-1", "secret", compute_token("dev-1", "secret", window - 1))
+    assert not engine.validate("dev-1", "other-secret", compute_token("dev-1", "secret", window))
+
+
+def test_expected_tokens_are_hashed_once_per_window(clock, monkeypatch):
+    calls = []
+    real = tokens.compute_token
+    monkeypatch.setattr(tokens, "compute_token", lambda *args: calls.append(args) or real(*args))
+    engine = TokenEngine(skew_windows=0)
+
+    token = real("dev-1", "secret", tokens.current_window())
+    for _ in range(5):
+        assert engine.validate("dev-1", "secret", token)
+    assert len(calls) == 1
+
+    clock["now"] += TOKEN_WINDOW
+    engine.validate("dev-1", "secret", token)
+    assert len(calls) == 2
+
+
+def test_new_secret_is_never_served_a_stale_token(clock):
+    engine = TokenEngine(skew_windows=0)
+    window = tokens.current_window()
+    assert engine.validate("dev-1", "old", compute_token("dev-1", "old", window))
+    assert engine.validate("dev-1", "new", compute_token("dev-1", "new", window))
+    assert not engine.validate("dev-1", "new", compute_token("dev-1", "old", window))
+
+
+def test_skew_accepts_neighbouring_windows(clock):
+    engine = TokenEngine(skew_windows=1)
+    window = tokens.current_window()
+    for offset, accepted in ((-2, False), (-1, True), (0, True), (1, True), (2, False)):
+        assert engine.validate("dev-1", "secret", compute_token("dev-1", "secret", window + offset)) is accepted
+
+
+@pytest.mark.parametrize("token", [None, 123, "é" * 16])
+def test_malformed_tokens_are_rejected(clock, token):
+    assert TokenEngine(skew_windows=0).validate("dev-1", "secret", token) is False
+
+
+def test_old_window_tables_are_dropped(clock):
+    engine = TokenEngine(skew_windows=0)
+    engine.validate("dev-1", "secret", "x")
+    first = tokens.current_window()
+    clock["now"] += 3 * TOKEN_WINDOW
+    engine.validate("dev-1", "secret", "x")
+    assert first not in engine.stats()["tables"]
+    assert engine.stats()["tables"] == {tokens.current_window(): 1}
+
+
+def test_precompute_fills_the_next_window(clock):
+    engine = TokenEngine(skew_windows=0)
+    next_window = tokens.current_window() + 1
+    assert engine.precompute([("dev-1", "s1"), ("dev-2", "s2")], next_window) == 2
+    assert engine.stats()["tables"][next_window] == 2
+    assert engine.expected("dev-2", "s2", next_window) == compute_token("dev-2", "s2", next_window)
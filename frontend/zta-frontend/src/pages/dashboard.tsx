@@ -42,12 +42,31 @@ type SummaryMetrics = {
   window_seconds: number;
 };
 
+// changes since the previous stream event (null on a client's first event)
+type MetricsDelta = {
+  seconds: number;
+  requests: { [key: string]: number };
+  total_logs: number;
+  replay_attempts: number;
+  throughput_rps: { [key: string]: number };
+  total_throughput_rps: number | null;
+};
+
+type MetricsEvent = {
+  seq: number;
+  interval: number;
+  summary: SummaryMetrics;
+  delta: MetricsDelta | null;
+};
+
 const COLORS = ["#0088FE", "#FF8042"];
 
 const Dashboard = () => {
   const [summary, setSummary] = useState<SummaryMetrics | null>(null);
   const [loading, setLoading] = useState(false);
   const [lastUpdated, setLastUpdated] = useState<string | null>(null);
+  const [live, setLive] = useState(false);
+  const [liveThroughput, setLiveThroughput] = useState<number | null>(null);
 
   
   const fetchSummary = async () => {
@@ -63,8 +82,21 @@ const Dashboard = () => {
     }
   };
   
+  // Live updates pushed by the backend (one shared computation for all open dashboards)
   useEffect(() => {
-    fetchSummary(); // Initial load
+    const source = new EventSource(`${axios.defaults.baseURL}/metrics/stream`);
+    source.onopen = () => setLive(true);
+    source.onerror = () => setLive(false); // EventSource reconnects on its own; also fires on the backend's "error" events
+    source.addEventListener("metrics", (e) => {
+      const event: MetricsEvent = JSON.parse((e as MessageEvent).data);
+      setLive(true);
+      setSummary(event.summary);
+      if (event.delta) {
+        setLiveThroughput(event.delta.total_throughput_rps);
+      }
+      setLastUpdated(new Date().toLocaleString());
+    });
+    return () => source.close();
   }, []);
 
   const latencyData =
@@ -124,6 +156,9 @@ const Dashboard = () => {
             Last updated: {lastUpdated}
           </Typography>
         )}
+        <Typography variant="body2" color={live ? "success.main" : "textSecondary"}>
+          {live ? "Live" : "Live updates disconnected, reconnecting..."}
+        </Typography>
       </Box>
 
       {/* {lastUpdated && (
@@ -289,6 +324,11 @@ const Dashboard = () => {
                     <TableCell>{summary?.throughput_rps ?? "—"}</TableCell>
                     <TableCell>req/s</TableCell>
                   </TableRow>
+                  <TableRow>
+                    <TableCell>Current Throughput (live)</TableCell>
+                    <TableCell>{liveThroughput ?? "—"}</TableCell>
+                    <TableCell>req/s</TableCell>
+                  </TableRow>
                   <TableRow>
                     <TableCell>Replay Attempts Detected</TableCell>
                     <TableCell>{summary?.replay_attempts ?? "—"}</TableCell>
@@ -0,0 +1,204 @@
+#Vectorized analysis of simulator results.
+#Loads a ResultSink file (or an old metrics_log.csv) into NumPy columns and computes per-mode
+#latency statistics with confidence intervals, plus the secure-vs-insecure overhead comparison.
+#
+#  python simulator/analysis.py metrics_log.bin
+#  python simulator/analysis.py metrics_log.bin --json summary.json --csv metrics_log.csv
+import argparse
+import json
+import math
+import numpy as np
+from result_sink import COLUMNS, MODES, MODE_CODES, NO_RESPONSE
+
+PERCENTILES = (50, 90, 99, 99.9)
+Z_95 = 1.959964
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_MAX_N = 5000  # subsample larger modes for the median CI
+
+
+def load_results(path):
+    """Columns dict (NumPy arrays, plus "devices": id per device code) from a results file."""
+    if path.endswith(".csv"):
+        return _load_csv(path)
+
+    devices = []
+    chunks = {name: [] for name, _ in COLUMNS}
+    with open(path, "rb") as f:
+        while True:
+            try:
+                new_devices = np.load(f, allow_pickle=False)
+            except EOFError:
+                break
+            devices.extend(new_devices.tolist())
+            for name, _ in COLUMNS:
+                chunks[name].append(np.load(f, allow_pickle=False))
+
+    results = {
+        name: np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+        for (name, dtype), parts in zip(COLUMNS, chunks.values())
+    }
+    results["devices"] = np.array(devices, dtype=str)
+    return results
+
+
+def _load_csv(path):
+    """Results from the old per-line metrics_log.csv (device_id,mode,status_code,response_time,payload_size)."""
+    raw = np.genfromtxt(path, delimiter=",", names=True, dtype=None, encoding="utf-8",
+                        missing_values="None", filling_values={"status_code": NO_RESPONSE})
+    raw = np.atleast_1d(raw)
+    devices, device_codes = np.unique(raw["device_id"].astype(str), return_inverse=True)
+    return {
+        "device": device_codes.astype(np.uint32),
+        "mode": np.array([MODE_CODES[m] for m in raw["mode"].astype(str)], dtype=np.uint8),
+        "status_code": raw["status_code"].astype(np.int16),
+        "response_time": raw["response_time"].astype(np.float32),
+        "payload_size": raw["payload_size"].astype(np.uint32),
+        "timestamp": np.full(len(raw), np.nan),
+        "devices": devices,
+    }
+
+
+def write_csv(results, path):
+    """Export to the old metrics_log.csv layout."""
+    device_ids = results["devices"][results["device"]]
+    modes = np.array(MODES)[results["mode"]]
+    status = results["status_code"].astype(object)
+    status[results["status_code"] == NO_RESPONSE] = None
+    response_time = results["response_time"].astype(object)
+    response_time[np.isnan(results["response_time"])] = None
+    with open(path, "w") as f:
+        f.write("device_id,mode,status_code,response_time,payload_size\n")
+        for row in zip(device_ids, modes, status, response_time, results["payload_size"]):
+            f.write(",".join(str(v) for v in row) + "\n")
+
+
+# ------------------------ statistics ------------------------
+
+def mean_ci(values):
+    """Mean and its normal-approximation 95% confidence interval."""
+    n = len(values)
+    mean = float(values.mean())
+    if n < 2:
+        return mean, (mean, mean)
+    half = Z_95 * float(values.std(ddof=1)) / math.sqrt(n)
+    return mean, (mean - half, mean + half)
+
+
+def median_ci(values, rng):
+    """Bootstrap 95% confidence interval of the median (all resamples drawn in one array)."""
+    if len(values) > BOOTSTRAP_MAX_N:
+        values = rng.choice(values, BOOTSTRAP_MAX_N, replace=False)
+    samples = rng.choice(values, size=(BOOTSTRAP_SAMPLES, len(values)), replace=True)
+    medians = np.median(samples, axis=1)
+    low, high = np.percentile(medians, [2.5, 97.5])
+    return float(low), float(high)
+
+
+def mode_stats(results, seed=0):
+    rng = np.random.default_rng(seed)
+    mode_col = results["mode"]
+    status = results["status_code"]
+    latency = results["response_time"].astype(np.float64)
+    timestamps = results["timestamp"]
+    stats = {}
+    for mode in MODES:
+        mask = mode_col == MODE_CODES[mode]
+        n = int(mask.sum())
+        if n == 0:
+            continue
+        codes, counts = np.unique(status[mask], return_counts=True)
+        answered = latency[mask & ~np.isnan(latency)]
+        entry = {
+            "count": n,
+            "statuses": {("no_response" if c == NO_RESPONSE else str(c)): int(k) for c, k in zip(codes, counts)},
+            "payload_bytes_mean": round(float(results["payload_size"][mask].mean()), 1),
+        }
+        ts = timestamps[mask]
+        ts = ts[~np.isnan(ts)]
+        if len(ts) > 1 and ts.max() > ts.min():
+            entry["throughput_rps"] = round(len(ts) / float(ts.max() - ts.min()), 3)
+        if len(answered):
+            mean, (lo, hi) = mean_ci(answered)
+            med_lo, med_hi = median_ci(answered, rng)
+            entry["latency"] = {
+                "mean": mean,
+                "mean_ci95": [lo, hi],
+                "std": float(answered.std(ddof=1)) if len(answered) > 1 else 0.0,
+                **{f"p{p:g}": float(v) for p, v in zip(PERCENTILES, np.percentile(answered, PERCENTILES))},
+                "median_ci95": [med_lo, med_hi],
+                "max": float(answered.max()),
+            }
+        stats[mode] = entry
+    return stats
+
+
+def compare(results, baseline="insecure", other="secure"):
+    """Latency overhead of `other` over `baseline`: difference of means with a Welch 95% CI."""
+    latency = results["response_time"].astype(np.float64)
+    ok = ~np.isnan(latency)
+    a = latency[ok & (results["mode"] == MODE_CODES[baseline])]
+    b = latency[ok & (results["mode"] == MODE_CODES[other])]
+    if len(a) < 2 or len(b) < 2:
+        return None
+
+    diff = float(b.mean() - a.mean())
+    se = math.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+    t = diff / se if se else math.inf
+    p_value = math.erfc(abs(t) / math.sqrt(2))  # normal approximation, fine at simulator sample sizes
+    median_a, median_b = float(np.median(a)), float(np.median(b))
+    return {
+        "baseline": baseline,
+        "mode": other,
+        "mean_overhead": diff,
+        "mean_overhead_ci95": [diff - Z_95 * se, diff + Z_95 * se],
+        "mean_overhead_pct": round(diff / float(a.mean()) * 100, 2) if a.mean() else None,
+        "median_overhead": median_b - median_a,
+        "median_overhead_pct": round((median_b - median_a) / median_a * 100, 2) if median_a else None,
+        "welch_t": t,
+        "p_value": p_value,
+    }
+
+
+def summarize(results):
+    return {
+        "records": int(len(results["mode"])),
+        "devices": int(len(results["devices"])),
+        "modes": mode_stats(results),
+        "secure_vs_insecure": compare(results),
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['records']} results from {summary['devices']} devices\n")
+    print(f"{'mode':<10}{'count':>9}{'mean ms':>11}{'95% CI ms':>21}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}")
+    for mode, s in summary["modes"].items():
+        lat = s.get("latency")
+        if lat is None:
+            print(f"{mode:<10}{s['count']:>9}   (no responses)")
+            continue
+        ci = f"{lat['mean_ci95'][0] * 1e3:.3f}-{lat['mean_ci95'][1] * 1e3:.3f}"
+        print(f"{mode:<10}{s['count']:>9}{lat['mean'] * 1e3:>11.3f}{ci:>21}"
+              f"{lat['p50'] * 1e3:>10.3f}{lat['p99'] * 1e3:>10.3f}{lat['p99.9'] * 1e3:>10.3f}")
+    cmp_ = summary["secure_vs_insecure"]
+    if cmp_:
+        lo, hi = cmp_["mean_overhead_ci95"]
+        print(f"\nsecure vs insecure: mean overhead {cmp_['mean_overhead'] * 1e3:.3f} ms "
+              f"(95% CI {lo * 1e3:.3f} to {hi * 1e3:.3f} ms, {cmp_['mean_overhead_pct']}%), "
+              f"median overhead {cmp_['median_overhead'] * 1e3:.3f} ms, p = {cmp_['p_value']:.3g}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze simulator results")
+    parser.add_argument("path", nargs="?", default="metrics_log.bin", help="ResultSink file or old metrics_log.csv")
+    parser.add_argument("--json", help="write the summary as JSON")
+    parser.add_argument("--csv", help="export the results in the old metrics_log.csv layout")
+    args = parser.parse_args()
+
+    results = load_results(args.path)
+    summary = summarize(results)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.csv:
+        write_csv(results, args.csv)
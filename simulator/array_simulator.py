@@ -0,0 +1,96 @@
+#Asyncio simulator driving an array-backed fleet (see fleet_state.py).
+#Same cycle loop and insecure/secure/replay behaviour as async_simulator.py, but the fleet lives
+#in NumPy arrays: readings advance in one vectorized step per cycle, payloads are built only as
+#a request is about to go out, and secure tokens are minted per token window in one batch.
+#
+#  python simulator/array_simulator.py --report-every 10 --max-in-flight 2000
+import argparse
+import asyncio
+import numpy as np
+import requests
+import httpx
+from async_simulator import AsyncLegacyIoTFleetSimulator
+from fleet_state import FleetState
+
+
+class ArrayFleetSimulator(AsyncLegacyIoTFleetSimulator):
+    def __init__(self, gateway_url="localhost:8000", report_every=1, **kwargs):
+        super().__init__(gateway_url, **kwargs)
+        self.report_every = report_every  # each device sends every Nth cycle (staggered across the fleet)
+        self.fleet = None
+        self.cycle = 0
+
+    def fetch_devices_from_backend(self):
+        try:
+            response = requests.get(f"http://{self.gateway_url}/api/devices")
+            response.raise_for_status()
+            self.fleet = FleetState.from_devices(response.json())
+            print(f"[Simulator] {self.fleet.size} devices fetched from backend.")
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching devices: {e}")
+
+    def fleet_size(self):
+        return self.fleet.size if self.fleet else 0
+
+    async def send_one(self, i, mode, body, headers, endpoint):
+        status_code = response_time = None
+        try:
+            response = await self.client.post(f"/{endpoint}", content=body, headers=headers)
+            status_code = response.status_code
+            response_time = response.elapsed.total_seconds()
+        except httpx.HTTPError:
+            pass
+        if self.sink is not None:
+            self.sink.record(self.fleet.device_ids[i].decode(), mode, status_code, response_time,
+                             len(body))
+        return status_code is not None
+
+    async def run_simulation_cycle_async(self):
+        fleet = self.fleet
+        fleet.step()
+        # only this cycle's slice of the fleet is due; the rest just had their readings advanced
+        candidates = np.arange((-self.cycle) % self.report_every, fleet.size, self.report_every)
+        self.cycle += 1
+        index, request_modes = fleet.next_actions(candidates=candidates)
+        pending = fleet.requests(index, request_modes)  # lazy: one payload per request taken
+        sent = 0
+
+        async def worker():
+            nonlocal sent
+            # workers share the generator; next() never awaits, so each request is taken once
+            for i, mode, body, headers in pending:
+                if await self.send_one(i, mode, body, headers, f"api/legacy/{mode}"):
+                    sent += 1
+
+        await asyncio.gather(*(worker() for _ in range(min(self.max_in_flight, len(index)))))
+        return sent
+
+
+async def main(args):
+    simulator = ArrayFleetSimulator(
+        args.gateway, report_every=args.report_every, max_connections=args.max_connections,
+        max_in_flight=args.max_in_flight, timeout=args.timeout, results_path=args.results,
+    )
+    if args.synthetic:
+        # devices the backend does not know about: useful to measure the simulator itself
+        simulator.fleet = FleetState.synthetic(args.synthetic)
+    else:
+        simulator.fetch_devices_from_backend()
+    if not simulator.fleet_size():
+        raise SystemExit("no devices to drive")
+    async with simulator:
+        await simulator.run_continuous_simulation_async(cycles=args.cycles, interval=args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an array-backed simulated fleet with asyncio")
+    parser.add_argument("--gateway", default="localhost:8000")
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--report-every", type=int, default=1, help="each device sends every Nth cycle")
+    parser.add_argument("--synthetic", type=int, default=0, help="simulate N made-up devices instead of fetching")
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--results", default="metrics_log.bin", help="results file (see analysis.py)")
+    asyncio.run(main(parser.parse_args()))
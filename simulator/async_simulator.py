@@ -0,0 +1,92 @@
+#Asyncio mode for the legacy IoT fleet simulator.
+#Drives the whole fleet concurrently over one pooled keep-alive HTTP client (httpx),
+#reusing LegacyIoTDevice and the insecure/secure/replay state machine unchanged.
+import argparse
+import asyncio
+import time
+import httpx
+from legacy_iot_simulator import LegacyIoTDevice, LegacyIoTFleetSimulator
+
+
+class AsyncLegacyIoTFleetSimulator(LegacyIoTFleetSimulator):
+    def __init__(self, gateway_url="localhost:8000", max_connections=100, max_in_flight=1000, timeout=10.0,
+                 results_path="metrics_log.bin"):
+        super().__init__(gateway_url, results_path)
+        self.max_connections = max_connections  # pooled keep-alive connections to the gateway
+        self.max_in_flight = max_in_flight      # requests awaiting a response at once
+        self.timeout = timeout
+        self.client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        self.client = httpx.AsyncClient(
+            base_url=f"http://{self.gateway_url}",
+            limits=limits,
+            timeout=httpx.Timeout(self.timeout, pool=None),  # wait for a pooled connection instead of failing
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def send(self, device: LegacyIoTDevice, mode, endpoint):
+        payload, body, headers = device.build_request(mode)
+        async with self._semaphore:
+            try:
+                response = await self.client.post(f"/{endpoint}", content=body, headers=headers)
+            except httpx.HTTPError as e:
+                print(f"[{device.device_id}] {mode.capitalize()} request failed: {e!r}")
+                return None
+        return device.log_response(response, mode, payload)
+
+    def fleet_size(self):
+        return len(self.devices)
+
+    async def run_simulation_cycle_async(self):
+        """One cycle for every device at once; same per-device decisions as run_simulation_cycle.
+        Returns the number of responses received."""
+        tasks = []
+        for device in self.devices:
+            action = self.next_action(device)
+            if action is not None:
+                tasks.append(self.send(device, *action))
+        results = await asyncio.gather(*tasks)
+        return sum(1 for r in results if r is not None)
+
+    async def run_continuous_simulation_async(self, cycles=20, interval=5):
+        for device in self.devices:
+            device.verbose = False  # per-cycle summaries instead of a line per request
+        with self.open_sink() as sink:
+            for i in range(cycles):
+                print(f"\n=== Async simulation cycle {i+1}/{cycles} ({self.fleet_size()} devices) ===")
+                started = time.monotonic()
+                sent = await self.run_simulation_cycle_async()
+                took = time.monotonic() - started
+                print(f"[Simulator] cycle {i+1}: {sent} responses in {took:.2f}s ({sent / took if took else 0:.0f} req/s)")
+                # keep a fixed cycle period rather than sleeping a full interval after a slow cycle
+                await asyncio.sleep(max(0.0, interval - took))
+        print(f"[Simulator] {sink.records} results written to {self.results_path}")
+
+
+async def main(args):
+    simulator = AsyncLegacyIoTFleetSimulator(
+        args.gateway, max_connections=args.max_connections, max_in_flight=args.max_in_flight, timeout=args.timeout,
+        results_path=args.results,
+    )
+    simulator.fetch_devices_from_backend()
+    async with simulator:
+        await simulator.run_continuous_simulation_async(cycles=args.cycles, interval=args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the legacy IoT fleet simulator with asyncio")
+    parser.add_argument("--gateway", default="localhost:8000")
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--results", default="metrics_log.bin", help="results file (see analysis.py)")
+    asyncio.run(main(parser.parse_args()))
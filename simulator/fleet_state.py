@@ -0,0 +1,263 @@
+#Array-backed fleet state for very large simulated fleets.
+#Instead of one LegacyIoTDevice (with its own dicts) per device, the fleet keeps every field in
+#NumPy arrays, with sensor state grouped by device_type. One step() advances every device's
+#readings at once; payloads are only built for the devices that actually send, and tokens are
+#minted once per device per token window.
+#
+#Offline check of memory and step cost (no gateway needed):
+#  python simulator/fleet_state.py --devices 1000000 --cycles 5
+import argparse
+import hashlib
+import time
+from datetime import datetime
+import numpy as np
+from legacy_iot_simulator import TOKEN_WINDOW, encode_body, sign_body
+
+DEVICE_TYPES = ("thermostat", "camera", "lock")
+MODES = ("insecure", "secure", "replay")
+INSECURE, SECURE, REPLAY = range(3)
+NO_WINDOW = -1
+
+
+def _codes(values, names, field):
+    """Small-int code per value (index into names), without a Python-level loop over the fleet."""
+    values = np.asarray(values, dtype=str)
+    codes = np.zeros(len(values), dtype=np.uint8)
+    known = np.zeros(len(values), dtype=bool)
+    for code, name in enumerate(names):
+        match = values == name
+        codes[match] = code
+        known |= match
+    if not known.all():
+        unknown = sorted(set(values[~known].tolist()))
+        raise ValueError(f"Unknown {field} {', '.join(map(repr, unknown[:10]))} (expected one of {', '.join(names)})")
+    return codes
+
+
+class ThermostatGroup:
+    def __init__(self, index):
+        n = len(index)
+        self.index = index  # fleet positions of the devices in this group
+        self.temperature = np.full(n, 22.0, dtype=np.float32)
+        self.humidity = np.full(n, 45.0, dtype=np.float32)
+        self.target_temp = np.full(n, 24.0, dtype=np.float32)
+
+    def step(self, rng):
+        n = len(self.index)
+        np.clip(self.temperature + rng.uniform(-0.5, 0.5, n).astype(np.float32), 15, 30, out=self.temperature)
+        np.clip(self.humidity + rng.uniform(-2, 2, n).astype(np.float32), 0, 100, out=self.humidity)
+
+    def reading(self, j):
+        return {
+            "temperature": float(self.temperature[j]),
+            "humidity": float(self.humidity[j]),
+            "target_temp": float(self.target_temp[j]),
+        }
+
+
+class CameraGroup:
+    def __init__(self, index):
+        n = len(index)
+        self.index = index
+        self.motion_detected = np.zeros(n, dtype=bool)
+        self.recording = np.ones(n, dtype=bool)
+
+    def step(self, rng):
+        self.motion_detected = rng.random(len(self.index), dtype=np.float32) < 0.1
+
+    def reading(self, j):
+        return {
+            "motion_detected": bool(self.motion_detected[j]),
+            "recording": bool(self.recording[j]),
+            "resolution": "720p",
+        }
+
+
+class LockGroup:
+    def __init__(self, index):
+        n = len(index)
+        self.index = index
+        self.locked = np.ones(n, dtype=bool)
+        self.battery_level = np.full(n, 85.0, dtype=np.float32)
+
+    def step(self, rng):
+        drain = rng.uniform(0.01, 0.05, len(self.index)).astype(np.float32)
+        np.maximum(self.battery_level - drain, 0, out=self.battery_level)
+
+    def reading(self, j):
+        return {
+            "locked": bool(self.locked[j]),
+            "battery_level": float(self.battery_level[j]),
+        }
+
+
+GROUPS = {"thermostat": ThermostatGroup, "camera": CameraGroup, "lock": LockGroup}
+
+
+class FleetState:
+    def __init__(self, device_ids, device_types, shared_secrets, modes, firmware_version="1.0.0", seed=None):
+        n = len(device_ids)
+        self.size = n
+        self.firmware_version = firmware_version
+        # ids and secrets are ASCII: fixed-width bytes take a quarter of the space of numpy str
+        self.device_ids = np.asarray(device_ids, dtype=str).astype("S")
+        self.secrets = np.asarray(shared_secrets, dtype=str).astype("S")
+        self.types = _codes(device_types, DEVICE_TYPES, "device_type")
+        self.modes = _codes(modes, MODES, "mode")
+        self.skipped = 0  # devices from_devices could not simulate
+        self.rng = np.random.default_rng(seed)
+
+        # token state (what LegacyIoTDevice.token / token_issued_at hold, per device)
+        self.tokens = np.zeros(n, dtype="S16")
+        self.token_window = np.full(n, NO_WINDOW, dtype=np.int64)  # window the stored token was minted for
+        self.token_issued_at = np.full(n, np.nan)                  # NaN = never minted
+
+        # sensor state, one group of arrays per device type; _slot maps fleet position -> group row
+        self.groups = {}
+        self._slot = np.zeros(n, dtype=np.int64)
+        for code, name in enumerate(DEVICE_TYPES):
+            index = np.flatnonzero(self.types == code)
+            self.groups[name] = GROUPS[name](index)
+            self._slot[index] = np.arange(len(index))
+
+    @classmethod
+    def from_devices(cls, devices, **kwargs):
+        """
+        From /api/devices rows (device_id, device_type, shared_secret, mode). Devices of a type
+        the simulator has no sensor model for, or without a secret, are skipped with a warning;
+        an unknown mode raises ValueError.
+        """
+        usable = [d for d in devices if "shared_secret" in d and d.get("device_type") in GROUPS]
+        skipped = len(devices) - len(usable)
+        if skipped:
+            types = sorted({str(d.get("device_type")) for d in devices if d.get("device_type") not in GROUPS})
+            print(f"[FleetState] Skipping {skipped} devices without a shared secret or of an unsupported "
+                  f"device_type ({', '.join(types) or '-'})")
+        fleet = cls(
+            [d["device_id"] for d in usable],
+            [d["device_type"] for d in usable],
+            [d["shared_secret"] for d in usable],
+            [d.get("mode", "insecure") for d in usable],
+            **kwargs,
+        )
+        fleet.skipped = skipped
+        return fleet
+
+    @classmethod
+    def synthetic(cls, n, seed=None):
+        """n made-up devices with random types and modes (for offline runs)."""
+        rng = np.random.default_rng(seed)
+        types = np.array(DEVICE_TYPES)[rng.integers(0, len(DEVICE_TYPES), n)]
+        modes = np.array(MODES)[rng.integers(0, len(MODES), n)]
+        ids = np.char.add("sim", np.arange(n).astype(str))
+        secrets = np.char.add("secret", np.arange(n).astype(str))
+        return cls(ids, types, secrets, modes, seed=seed)
+
+    # ------------------------ per-cycle updates ------------------------
+
+    def step(self):
+        """Advance every device's sensor readings by one cycle."""
+        for group in self.groups.values():
+            if len(group.index):
+                group.step(self.rng)
+
+    def next_actions(self, now=None, candidates=None):
+        """
+        Vectorized LegacyIoTFleetSimulator.next_action for the whole fleet (or `candidates`).
+        Returns (fleet positions, request mode codes) of the devices that send this cycle.
+        """
+        if now is None:
+            now = time.time()
+        index = np.arange(self.size) if candidates is None else np.asarray(candidates)
+        device_modes = self.modes[index]
+        issued = self.token_issued_at[index]
+
+        request = device_modes.copy()
+        # replay devices: mint a token first (secure), stay quiet until it expires, then replay it
+        replay = device_modes == REPLAY
+        request[replay & np.isnan(issued)] = SECURE
+        waiting = replay & ~np.isnan(issued) & ((now - issued) <= TOKEN_WINDOW)
+        keep = ~waiting
+        return index[keep], request[keep]
+
+    def mint_tokens(self, index, now=None):
+        """Tokens for the current window for `index`, hashing only devices not minted this window yet."""
+        if now is None:
+            now = time.time()
+        window = int(now) // TOKEN_WINDOW
+        index = np.asarray(index)
+        stale = index[self.token_window[index] != window]
+        if len(stale):
+            suffix = str(window).encode()
+            sha256 = hashlib.sha256
+            self.tokens[stale] = [
+                sha256(device_id + secret + suffix).hexdigest()[:16].encode()
+                for device_id, secret in zip(self.device_ids[stale].tolist(), self.secrets[stale].tolist())
+            ]
+            self.token_window[stale] = window
+        self.token_issued_at[index] = now
+        return self.tokens[index]
+
+    # ------------------------ lazy payloads ------------------------
+
+    def payload(self, i):
+        """Request body for fleet position i, same shape as LegacyIoTDevice.simulate_sensor_reading()."""
+        device_type = DEVICE_TYPES[self.types[i]]
+        device_id = self.device_ids[i].decode()
+        return {
+            "device_id": device_id,
+            "device_type": device_type,
+            "timestamp": datetime.now().isoformat(),
+            "firmware": self.firmware_version,
+            **self.groups[device_type].reading(self._slot[i]),
+        }
+
+    def requests(self, index, request_modes, now=None):
+        """(position, mode name, body, headers) for each sender; secure tokens are minted in one batch."""
+        secure = index[request_modes == SECURE]
+        if len(secure):
+            self.mint_tokens(secure, now)
+        for i, mode in zip(index.tolist(), request_modes.tolist()):
+            body = encode_body(self.payload(i))
+            headers = {"Content-Type": "application/json"}
+            if mode != INSECURE:
+                # secure: the token minted above; replay: the old token minted earlier
+                token = self.tokens[i].decode()
+                headers["X-Access-Token"] = token
+                if mode == SECURE:
+                    headers["X-Message-Signature"] = sign_body(self.secrets[i].decode(), token, body)
+            yield i, MODES[mode], body, headers
+
+    def nbytes(self):
+        arrays = [self.device_ids, self.secrets, self.types, self.modes, self.tokens,
+                  self.token_window, self.token_issued_at, self._slot]
+        for group in self.groups.values():
+            arrays.extend(v for v in vars(group).values() if isinstance(v, np.ndarray))
+        return sum(a.nbytes for a in arrays)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline cost of an array-backed fleet")
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--senders", type=int, default=10_000, help="payloads built per cycle")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    fleet = FleetState.synthetic(args.devices, seed=0)
+    print(f"[Fleet] {args.devices} devices built in {time.perf_counter() - started:.2f}s, "
+          f"{fleet.nbytes() / 2**20:.0f} MiB of state ({fleet.nbytes() / args.devices:.0f} bytes/device)")
+
+    now = time.time()
+    for cycle in range(args.cycles):
+        t0 = time.perf_counter()
+        fleet.step()
+        t1 = time.perf_counter()
+        index, request_modes = fleet.next_actions(now)
+        t2 = time.perf_counter()
+        built = sum(1 for _ in fleet.requests(index[:args.senders], request_modes[:args.senders], now))
+        t3 = time.perf_counter()
+        print(f"[Fleet] cycle {cycle + 1}: step {(t1 - t0) * 1e3:.1f} ms, "
+              f"actions {(t2 - t1) * 1e3:.1f} ms ({len(index)} due), "
+              f"{built} requests built in {(t3 - t2) * 1e3:.1f} ms")
+        now += 5
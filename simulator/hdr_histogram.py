@@ -0,0 +1,74 @@
+#Minimal HDR histogram for the load generator.
+#Integer values (microseconds) in log-linear buckets with a fixed number of significant digits,
+#same layout as HdrHistogram: each power-of-two range is split into equal sub-buckets.
+import math
+
+
+class HdrHistogram:
+    def __init__(self, highest_value=3_600_000_000, significant_figures=3):
+        self.highest_value = highest_value
+        largest_single_unit = 2 * 10 ** significant_figures
+        self.sub_bucket_count = 1 << (largest_single_unit - 1).bit_length()  # 2048 for 3 digits
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.sub_bucket_half_magnitude = self.sub_bucket_half_count.bit_length() - 1
+        self.sub_bucket_mask = self.sub_bucket_count - 1
+
+        bucket_count = 1
+        smallest_untrackable = self.sub_bucket_count
+        while smallest_untrackable <= highest_value:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = [0] * ((bucket_count + 1) * self.sub_bucket_half_count)
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._sum = 0
+
+    def _index(self, value):
+        bucket = (value | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_magnitude + 1)
+        sub_bucket = value >> bucket
+        return ((bucket + 1) << self.sub_bucket_half_magnitude) + sub_bucket - self.sub_bucket_half_count
+
+    def _highest_equivalent(self, index):
+        bucket = (index >> self.sub_bucket_half_magnitude) - 1
+        sub_bucket = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket < 0:
+            sub_bucket -= self.sub_bucket_half_count
+            bucket = 0
+        return (sub_bucket << bucket) + (1 << bucket) - 1
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.highest_value)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self._sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.total += other.total
+        self._sum += other._sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self._sum / self.total if self.total else None
+
+    def percentile(self, p):
+        """Value at percentile p (0-100), reported as the top of its bucket like HdrHistogram."""
+        if self.total == 0:
+            return None
+        wanted = max(1, math.ceil(p / 100 * self.total))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= wanted:
+                    return min(self._highest_equivalent(i), self.max)
+        return self.max
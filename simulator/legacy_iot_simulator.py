@@ -1,12 +1,24 @@
 import requests
 import time
 import hashlib
+import hmac
 import random
 import json
 from datetime import datetime
+from result_sink import ResultSink
 
 TOKEN_WINDOW = 30  # MUST match what you used in routes/legacy.py
 
+
+def encode_body(payload):
+    return json.dumps(payload).encode()
+
+
+def sign_body(shared_secret, token, body):
+    """X-Message-Signature: HMAC-SHA256 over the token and the exact body bytes (app.tokens.message_signature).
+    A token is single-use per window; signed readings may each reuse it with their own timestamp."""
+    return hmac.new(shared_secret.encode(), token.encode() + b"\n" + body, hashlib.sha256).hexdigest()
+
 class LegacyIoTDevice:
     def __init__(self, device_id, device_type, shared_secret, firmware_version="1.0.0", mode="insecure"):
         self.device_id = device_id
@@ -14,6 +26,8 @@ class LegacyIoTDevice:
         self.shared_secret = shared_secret
         self.firmware_version = firmware_version
         self.mode = mode
+        self.verbose = True  # per-request console output; the load generator turns it off
+        self.sink = None     # ResultSink shared by the fleet, set while a simulation runs
 
         self.token = None
         self.token_issued_at = None  # when we minted the current token
@@ -58,7 +72,8 @@ class LegacyIoTDevice:
         token = hashlib.sha256(token_data.encode()).hexdigest()[:16]
         self.token = token
         self.token_issued_at = time.time()
-        print(f"[Simulator] {self.device_id} | Token: {token}")
+        if self.verbose:
+            print(f"[Simulator] {self.device_id} | Token: {token}")
         return token
 
     def simulate_sensor_reading(self):
@@ -78,27 +93,33 @@ class LegacyIoTDevice:
 
     # ------------------------ senders ------------------------
 
-    def send_insecure_request(self, gateway_url, endpoint):
+    def build_request(self, mode):
+        """Payload, encoded body and headers for one request in the given mode (insecure / secure / replay)."""
         payload = self.simulate_sensor_reading()
-        url = f"http://{gateway_url}/{endpoint}"
+        body = encode_body(payload)
         headers = {"Content-Type": "application/json"}
+        if mode == "secure":
+            headers["X-Access-Token"] = self.generate_lightweight_token()
+            headers["X-Message-Signature"] = sign_body(self.shared_secret, self.token, body)
+        elif mode == "replay":
+            headers["X-Access-Token"] = self.token  # reuse old, expired token
+        return payload, body, headers
+
+    def send_insecure_request(self, gateway_url, endpoint):
+        payload, body, headers = self.build_request("insecure")
+        url = f"http://{gateway_url}/{endpoint}"
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = requests.post(url, data=body, headers=headers)
             return self.log_response(response, "insecure", payload)
         except requests.exceptions.RequestException as e:
             print(f"[{self.device_id}] Insecure request failed: {e}")
             return None
 
     def send_secure_request(self, gateway_url, endpoint):
-        payload = self.simulate_sensor_reading()
-        token = self.generate_lightweight_token()
+        payload, body, headers = self.build_request("secure")
         url = f"http://{gateway_url}/{endpoint}"
-        headers = {
-            "X-Access-Token": token,
-            "Content-Type": "application/json"
-        }
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = requests.post(url, data=body, headers=headers)
             return self.log_response(response, "secure", payload)
         except requests.exceptions.RequestException as e:
             print(f"[{self.device_id}] Secure request failed: {e}")
@@ -108,14 +129,10 @@ class LegacyIoTDevice:
         """
         Reuse the OLD token (after it has expired) -> should be blocked (409).
         """
-        payload = self.simulate_sensor_reading()
+        payload, body, headers = self.build_request("replay")
         url = f"http://{gateway_url}/{endpoint}"
-        headers = {
-            "X-Access-Token": self.token,  # reuse old, expired token
-            "Content-Type": "application/json"
-        }
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = requests.post(url, data=body, headers=headers)
             return self.log_response(response, "replay", payload)
         except requests.exceptions.RequestException as e:
             print(f"[{self.device_id}] Replay attack failed: {e}")
@@ -127,23 +144,32 @@ class LegacyIoTDevice:
         log_data = {
             "device_id": self.device_id,
             "mode": mode,
-            "status_code": response.status_code if response else None,
-            "response_time": response.elapsed.total_seconds() if response else None,
+            # "is not None": a requests.Response for a 4xx/5xx is falsy
+            "status_code": response.status_code if response is not None else None,
+            "response_time": response.elapsed.total_seconds() if response is not None else None,
             "payload_size": len(json.dumps(payload))
         }
-        with open("metrics_log.csv", "a") as log_file:
-            log_file.write(
-                f"{log_data['device_id']},{log_data['mode']},{log_data['status_code']},"
-                f"{log_data['response_time']},{log_data['payload_size']}\n"
-            )
-        print(f"[{self.device_id}] {mode.upper()} -> {log_data}")
+        if self.sink is not None:
+            self.sink.record(self.device_id, mode, log_data["status_code"],
+                             log_data["response_time"], log_data["payload_size"])
+        if self.verbose:
+            print(f"[{self.device_id}] {mode.upper()} -> {log_data}")
         return log_data
 
 
 class LegacyIoTFleetSimulator:
-    def __init__(self, gateway_url="localhost:8000"):
+    def __init__(self, gateway_url="localhost:8000", results_path="metrics_log.bin"):
         self.gateway_url = gateway_url
+        self.results_path = results_path  # analyze with: python simulator/analysis.py metrics_log.bin
         self.devices = []
+        self.sink = None
+
+    def open_sink(self):
+        """Start a results file shared by every device; close it (or use `with`) to flush the tail."""
+        sink = self.sink = ResultSink(self.results_path)
+        for device in self.devices:
+            device.sink = sink
+        return sink
 
     def fetch_devices_from_backend(self):
         try:
@@ -166,47 +192,65 @@ class LegacyIoTFleetSimulator:
         except requests.exceptions.RequestException as e:
             print(f"Error fetching devices: {e}")
 
-    def run_simulation_cycle(self):
+    def next_action(self, device):
         """
-        Run a simulation cycle based on each device's mode.
+        Decide what a device sends this cycle, based on its mode.
         - insecure: always post to /insecure
         - secure  : always post to /secure with fresh token
         - replay  : 
             * first secure call mints token
             * then WAIT until > TOKEN_WINDOW, then call /replay with the old token
+        Returns (request mode, endpoint) or None when the device sits this cycle out.
         """
-        for device in self.devices:
-            if device.mode == "insecure":
-                device.send_insecure_request(self.gateway_url, "api/legacy/insecure")
+        if device.mode == "insecure":
+            return "insecure", "api/legacy/insecure"
 
-            elif device.mode == "secure":
-                device.send_secure_request(self.gateway_url, "api/legacy/secure")
+        elif device.mode == "secure":
+            return "secure", "api/legacy/secure"
 
-            elif device.mode == "replay":
-                # 1) First time: mint a good token
-                if device.token is None:
+        elif device.mode == "replay":
+            # 1) First time: mint a good token
+            if device.token is None:
+                if device.verbose:
                     print(f"[{device.device_id}] (replay) minting valid token first ...")
-                    device.send_secure_request(self.gateway_url, "api/legacy/secure")
-                    continue
+                return "secure", "api/legacy/secure"
 
-                # 2) If token not expired yet, wait until expiration
-                if not device.is_token_expired():
+            # 2) If token not expired yet, wait until expiration
+            if not device.is_token_expired():
+                if device.verbose:
                     seconds_left = TOKEN_WINDOW - int(time.time() - device.token_issued_at)
                     print(f"[{device.device_id}] (replay) waiting {seconds_left}s for token to expire ...")
-                    continue
+                return None
 
-                # 3) Token expired -> reuse it to simulate replay
+            # 3) Token expired -> reuse it to simulate replay
+            if device.verbose:
                 print(f"[{device.device_id}] (replay) token expired, sending replay now ...")
-                device.send_replay_attack(self.gateway_url, "api/legacy/replay")
+            return "replay", "api/legacy/replay"
+        return None
 
-    def run_continuous_simulation(self, cycles=20, interval=5):
-        with open("metrics_log.csv", "w") as log_file:
-            log_file.write("device_id,mode,status_code,response_time,payload_size\n")
+    def run_simulation_cycle(self):
+        """
+        Run a simulation cycle based on each device's mode (see next_action).
+        """
+        senders = {
+            "insecure": LegacyIoTDevice.send_insecure_request,
+            "secure": LegacyIoTDevice.send_secure_request,
+            "replay": LegacyIoTDevice.send_replay_attack,
+        }
+        for device in self.devices:
+            action = self.next_action(device)
+            if action is None:
+                continue
+            mode, endpoint = action
+            senders[mode](device, self.gateway_url, endpoint)
 
-        for i in range(cycles):
-            print(f"\n=== Simulation cycle {i+1}/{cycles} ===")
-            self.run_simulation_cycle()
-            time.sleep(interval)
+    def run_continuous_simulation(self, cycles=20, interval=5):
+        with self.open_sink() as sink:
+            for i in range(cycles):
+                print(f"\n=== Simulation cycle {i+1}/{cycles} ===")
+                self.run_simulation_cycle()
+                time.sleep(interval)
+        print(f"[Simulator] {sink.records} results written to {self.results_path}")
 
 
 if __name__ == "__main__":
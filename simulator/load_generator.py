@@ -0,0 +1,248 @@
+#Open-loop load generator for the legacy gateway.
+#Requests are scheduled at a target rate (constant, ramp or step profile) whether or not earlier
+#ones have completed, and latency is measured from each request's intended send time, so a
+#gateway that falls behind shows up in the tail instead of silently lowering the offered load
+#(no coordinated omission). Devices come from the backend fleet, using the same per-device
+#insecure/secure/replay decisions as the other simulators.
+#
+#  python simulator/load_generator.py --profile constant --rate 500 --duration 60
+#  python simulator/load_generator.py --profile ramp --start-rate 100 --end-rate 2000 --duration 120
+#  python simulator/load_generator.py --profile step --steps 200:30,400:30,800:30
+import argparse
+import asyncio
+import json
+import math
+import time
+import httpx
+from async_simulator import AsyncLegacyIoTFleetSimulator
+from hdr_histogram import HdrHistogram
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# ------------------------ load profiles ------------------------
+# A profile is a list of (seconds, start_rate, end_rate) segments; the rate changes linearly in each.
+
+def constant_profile(rate, duration):
+    return [(duration, rate, rate)]
+
+
+def ramp_profile(start_rate, end_rate, duration):
+    return [(duration, start_rate, end_rate)]
+
+
+def step_profile(steps):
+    """steps: "rate:seconds,rate:seconds,..." e.g. "200:30,400:30"."""
+    segments = []
+    for step in steps.split(","):
+        rate, seconds = step.split(":")
+        segments.append((float(seconds), float(rate), float(rate)))
+    return segments
+
+
+def schedule(segments):
+    """Intended send offsets (seconds from start) for every request in the profile."""
+    base = 0.0
+    for seconds, r0, r1 in segments:
+        k = (r1 - r0) / seconds if seconds else 0.0
+        arrivals = math.floor((r0 + r1) / 2 * seconds)
+        for n in range(1, arrivals + 1):
+            # solve r0*t + k*t^2/2 = n for t (the n-th arrival of a linearly changing rate)
+            if k == 0:
+                t = n / r0
+            else:
+                t = (-r0 + math.sqrt(r0 * r0 + 2 * k * n)) / k
+            yield base + t
+        base += seconds
+
+
+# ------------------------ results ------------------------
+
+class ModeResults:
+    __slots__ = ("offered", "completed", "failed", "statuses", "latency", "service_time")
+
+    def __init__(self):
+        self.offered = 0
+        self.completed = 0
+        self.failed = 0        # no response (connect error, timeout, ...)
+        self.statuses = {}     # status_code -> count
+        self.latency = HdrHistogram()       # from intended send time (what the report uses)
+        self.service_time = HdrHistogram()  # from actual dispatch (closed-loop view, hides queueing behind the schedule)
+
+    def record(self, status_code, latency, service_time):
+        if status_code is None:
+            self.failed += 1
+        else:
+            self.completed += 1
+            self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+        self.latency.record(latency * 1e6)
+        self.service_time.record(service_time * 1e6)
+
+    @property
+    def errors(self):
+        # 409/403 are expected answers for replay/secure devices; overload and server errors are not
+        return self.failed + sum(c for s, c in self.statuses.items() if s >= 500 or s == 429)
+
+
+def _ms(hist, p):
+    v = hist.percentile(p)
+    return round(v / 1000, 3) if v is not None else None
+
+
+def describe(results: ModeResults, offered_seconds, elapsed):
+    return {
+        "offered": results.offered,
+        "offered_rps": round(results.offered / offered_seconds, 2) if offered_seconds else 0.0,
+        "completed": results.completed,
+        "achieved_rps": round(results.completed / elapsed, 2) if elapsed else 0.0,
+        "failed": results.failed,
+        "errors": results.errors,
+        "error_rate": round(results.errors / results.offered, 6) if results.offered else 0.0,
+        "statuses": {str(s): c for s, c in sorted(results.statuses.items())},
+        "latency_ms": {f"p{p:g}": _ms(results.latency, p) for p in PERCENTILES} | {"max": _ms(results.latency, 100)},
+        "service_time_ms": {f"p{p:g}": _ms(results.service_time, p) for p in PERCENTILES},
+    }
+
+
+# ------------------------ generator ------------------------
+
+class OpenLoopLoadGenerator(AsyncLegacyIoTFleetSimulator):
+    def __init__(self, gateway_url="localhost:8000", max_connections=100, max_in_flight=10000, timeout=30.0):
+        super().__init__(gateway_url, max_connections=max_connections, max_in_flight=max_in_flight, timeout=timeout)
+        self.results = {}
+        self.skipped = 0         # slots where no device had anything to send
+        self.max_send_lag = 0.0  # how far the generator itself fell behind schedule (seconds)
+        self._next_device = 0
+
+    def _pick(self):
+        """Next device with something to send, round-robin over the fleet."""
+        for _ in range(len(self.devices)):
+            device = self.devices[self._next_device]
+            self._next_device = (self._next_device + 1) % len(self.devices)
+            action = self.next_action(device)
+            if action is not None:
+                return device, action
+        return None
+
+    async def _fire(self, device, mode, endpoint, intended):
+        _, body, headers = device.build_request(mode)
+        status_code = None
+        async with self._semaphore:
+            sent = time.perf_counter()
+            try:
+                response = await self.client.post(f"/{endpoint}", content=body, headers=headers)
+                status_code = response.status_code
+            except httpx.HTTPError:
+                pass
+        done = time.perf_counter()
+        self.results[mode].record(status_code, done - intended, done - sent)
+
+    async def run(self, segments):
+        for device in self.devices:
+            device.verbose = False
+        offered_seconds = sum(seconds for seconds, _, _ in segments)
+        tasks = set()
+        start = time.perf_counter() + 0.1
+        for offset in schedule(segments):
+            intended = start + offset
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.max_send_lag = max(self.max_send_lag, -delay)
+
+            picked = self._pick()
+            if picked is None:
+                self.skipped += 1
+                continue
+            device, (mode, endpoint) = picked
+            results = self.results.get(mode)
+            if results is None:
+                results = self.results[mode] = ModeResults()
+            results.offered += 1
+            task = asyncio.create_task(self._fire(device, mode, endpoint, intended))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        return self.report(offered_seconds, elapsed)
+
+    def report(self, offered_seconds, elapsed):
+        total = ModeResults()
+        for results in self.results.values():
+            total.offered += results.offered
+            total.completed += results.completed
+            total.failed += results.failed
+            for s, c in results.statuses.items():
+                total.statuses[s] = total.statuses.get(s, 0) + c
+            total.latency.merge(results.latency)
+            total.service_time.merge(results.service_time)
+        return {
+            "offered_seconds": offered_seconds,
+            "elapsed_seconds": round(elapsed, 3),
+            "skipped": self.skipped,
+            "max_send_lag_ms": round(self.max_send_lag * 1000, 3),
+            "modes": {mode: describe(r, offered_seconds, elapsed) for mode, r in sorted(self.results.items())},
+            "total": describe(total, offered_seconds, elapsed),
+        }
+
+
+def print_report(report):
+    print(f"\n=== Open-loop run: {report['offered_seconds']:g}s offered, {report['elapsed_seconds']}s elapsed ===")
+    if report["max_send_lag_ms"] > 10:
+        print(f"[LoadGen] generator fell up to {report['max_send_lag_ms']} ms behind schedule; "
+              f"latencies still count from the intended send time")
+    header = f"{'mode':<10}{'offered/s':>11}{'achieved/s':>12}{'err%':>8}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}"
+    print(header)
+    rows = list(report["modes"].items()) + [("total", report["total"])]
+    for mode, r in rows:
+        lat = r["latency_ms"]
+        print(f"{mode:<10}{r['offered_rps']:>11}{r['achieved_rps']:>12}{r['error_rate'] * 100:>8.2f}"
+              f"{lat['p50']!s:>10}{lat['p99']!s:>10}{lat['p99.9']!s:>10}{lat['max']!s:>10}")
+    svc = report["total"]["service_time_ms"]
+    print(f"(service time from actual send, for comparison: p50 {svc['p50']} ms, p99 {svc['p99']} ms)")
+
+
+def build_profile(args):
+    if args.profile == "constant":
+        return constant_profile(args.rate, args.duration)
+    if args.profile == "ramp":
+        return ramp_profile(args.start_rate, args.end_rate, args.duration)
+    if not args.steps:
+        raise SystemExit("--profile step needs --steps rate:seconds,...")
+    return step_profile(args.steps)
+
+
+async def main(args):
+    segments = build_profile(args)
+    generator = OpenLoopLoadGenerator(
+        args.gateway, max_connections=args.max_connections, max_in_flight=args.max_in_flight, timeout=args.timeout
+    )
+    generator.fetch_devices_from_backend()
+    if not generator.devices:
+        raise SystemExit("no devices to drive")
+    async with generator:
+        report = await generator.run(segments)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[LoadGen] report written to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop, rate-controlled load against the legacy gateway")
+    parser.add_argument("--gateway", default="localhost:8000")
+    parser.add_argument("--profile", choices=("constant", "ramp", "step"), default="constant")
+    parser.add_argument("--rate", type=float, default=100, help="requests/s for the constant profile")
+    parser.add_argument("--start-rate", type=float, default=10, help="ramp profile start rate")
+    parser.add_argument("--end-rate", type=float, default=1000, help="ramp profile end rate")
+    parser.add_argument("--duration", type=float, default=60, help="seconds, constant and ramp profiles")
+    parser.add_argument("--steps", help="step profile, e.g. 200:30,400:30,800:30 (rate:seconds)")
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--max-in-flight", type=int, default=10000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+#Buffered columnar sink for simulator results.
+#Records go into preallocated NumPy columns and are written out a chunk at a time, instead of
+#one CSV line (and one print) per request. Load a results file with analysis.load_results().
+#
+#File layout: a sequence of chunks, each a run of np.save arrays in COLUMNS order, preceded by
+#the device ids first seen in that chunk (device ids are stored as small integer codes).
+import time
+import numpy as np
+
+MODES = ("insecure", "secure", "replay")
+MODE_CODES = {mode: i for i, mode in enumerate(MODES)}
+NO_RESPONSE = -1  # status_code when the request failed before a response came back
+
+COLUMNS = (
+    ("device", np.uint32),
+    ("mode", np.uint8),
+    ("status_code", np.int16),
+    ("response_time", np.float32),  # seconds, NaN when there was no response
+    ("payload_size", np.uint32),
+    ("timestamp", np.float64),      # unix time the response was logged
+)
+CHUNK_SIZE = 65536
+
+
+class ResultSink:
+    def __init__(self, path="metrics_log.bin", chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._columns = {name: np.empty(chunk_size, dtype=dtype) for name, dtype in COLUMNS}
+        self._size = 0
+        self._device_codes = {}  # device_id -> code
+        self._new_devices = []   # ids not yet written to the file
+        self._file = open(path, "wb")
+        self.records = 0
+
+    def record(self, device_id, mode, status_code, response_time, payload_size, timestamp=None):
+        code = self._device_codes.get(device_id)
+        if code is None:
+            code = self._device_codes[device_id] = len(self._device_codes)
+            self._new_devices.append(device_id)
+
+        i = self._size
+        c = self._columns
+        c["device"][i] = code
+        c["mode"][i] = MODE_CODES[mode]
+        c["status_code"][i] = NO_RESPONSE if status_code is None else status_code
+        c["response_time"][i] = np.nan if response_time is None else response_time
+        c["payload_size"][i] = payload_size
+        c["timestamp"][i] = time.time() if timestamp is None else timestamp
+        self._size += 1
+        self.records += 1
+        if self._size == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._size == 0:
+            return
+        np.save(self._file, np.array(self._new_devices, dtype=str), allow_pickle=False)
+        for name, _ in COLUMNS:
+            np.save(self._file, self._columns[name][:self._size], allow_pickle=False)
+        self._file.flush()
+        self._new_devices = []
+        self._size = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()